@@ -0,0 +1,257 @@
+"""
+Single-file DAPs model bundle.
+
+A bundle holds everything required to run a trained model: weights keyed by
+layer name, model specification, priors and the parameters used to build its
+input (pooling type, T, stride, C3D size/stride and input dimension).
+
+Layout:
+    MAGIC | version (uint32) | header size (uint64) | json header | arrays
+
+Arrays are stored uncompressed, in C order and aligned to `ALIGNMENT` bytes.
+Thus, they are memory-mapped on load instead of being copied.
+
+"""
+import json
+import struct
+from collections import OrderedDict
+
+import numpy as np
+
+from daps.inference import LSTM_GATES, load_model, parse_model_prm
+from daps.utils.pooling import pooled_size
+
+MAGIC = 'DAPSBNDL'
+VERSION = 1
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<8sIQ')
+CONFIG_KEYS = ['model_prm', 'input_size', 'T', 'stride', 'c3d_size',
+               'c3d_stride', 'pool_type', 'feat_dim']
+
+
+def _aligned(n_bytes):
+    return -(-n_bytes // ALIGNMENT) * ALIGNMENT
+
+
+def param_names(model_prm):
+    """Name of every parameter of the network
+
+    Parameters
+    ----------
+    model_prm : str
+        Model specification, see `daps.model.build_model`.
+
+    Outputs
+    -------
+    names : list
+        Layer-qualified names in the order of
+        `lasagne.layers.get_all_param_values`.
+
+    """
+    prm, names = parse_model_prm(model_prm), []
+    for i in range(prm['depth']):
+        if prm['type'] == 'mlp':
+            names += ['hidden{}.W'.format(i), 'hidden{}.b'.format(i)]
+        else:
+            for gate in LSTM_GATES:
+                names += ['lstm{}.{}_{}'.format(i, j, gate)
+                          for j in ['W_in_to', 'W_hid_to', 'b']]
+            names += ['lstm{}.W_cell_to_{}'.format(i, gate)
+                      for gate in ['ingate', 'forgetgate', 'outgate']]
+            names += ['lstm{}.cell_init'.format(i),
+                      'lstm{}.hid_init'.format(i)]
+    names += ['loc.W', 'loc.b', 'conf.W', 'conf.b']
+    return names
+
+
+def is_bundle(filename):
+    """Check if a file is a DAPs bundle"""
+    with open(filename, 'rb') as fobj:
+        return fobj.read(len(MAGIC)) == MAGIC
+
+
+def check_config(config, params, priors=None):
+    """Validate bundle configuration against its content
+
+    Parameters
+    ----------
+    config : dict
+        Bundle configuration, see `dump_bundle`.
+    params : dict
+        ndarrays with the parameters of the network keyed by name.
+    priors : ndarray, optional
+        [K x 2] array with priors used to train the model.
+
+    """
+    missing = [i for i in CONFIG_KEYS if i not in config]
+    if missing:
+        raise ValueError('Missing bundle fields: {}'.format(missing))
+    model_prm = config['model_prm']
+    prm = parse_model_prm(model_prm)
+    if sorted(param_names(model_prm)) != sorted(params.keys()):
+        raise ValueError('Parameters do not match model ' + model_prm)
+    if config['feat_dim'] is not None and config['pool_type']:
+        input_size = pooled_size(config['feat_dim'], config['pool_type'])
+        if input_size != config['input_size']:
+            msg = 'Pooling {} of {}-d features does not give input size {}'
+            raise ValueError(msg.format(config['pool_type'],
+                                        config['feat_dim'],
+                                        config['input_size']))
+    if config['T'] < config['c3d_size'] or config['stride'] < 1:
+        raise ValueError('Invalid T or stride')
+    if priors is not None and priors.shape != (prm['n_outputs'], 2):
+        msg = 'Priors of shape {} do not match {} outputs'
+        raise ValueError(msg.format(priors.shape, prm['n_outputs']))
+
+
+def dump_bundle(filename, model_prm, params, priors=None, input_size=4096,
+                T=256, stride=128, c3d_size=16, c3d_stride=8,
+                pool_type='mean', feat_dim=None):
+    """Serialize a model and its configuration on a single file
+
+    Parameters
+    ----------
+    filename : str
+        Fullpath of output file.
+    model_prm : str
+        Model specification, see `daps.model.build_model`.
+    params : list or str
+        ndarrays in the order of `lasagne.layers.get_all_param_values` or
+        fullpath of npz-file dumped by `daps.learning.dump_model`.
+    priors : ndarray, optional
+        [K x 2] array with priors used to train the model.
+    input_size : int, optional
+        Size of the input to the network.
+    T : int, optional
+        Canonical temporal size of the windows.
+    stride : int, optional
+        Sliding step among windows.
+    c3d_size : int, optional
+        Size of C3D receptive field.
+    c3d_stride : int, optional
+        Sliding step of C3D.
+    pool_type : str, optional
+        Pooling used to build the input of the network.
+    feat_dim : int, optional
+        Dimension of the raw features. It is validated against input_size.
+
+    """
+    if isinstance(params, basestring):
+        with np.load(params) as f:
+            params = [f['arr_%d' % i] for i in range(len(f.files))]
+    names = param_names(model_prm)
+    if len(names) != len(params):
+        msg = 'Expected {} parameters, got {}'
+        raise ValueError(msg.format(len(names), len(params)))
+    arrays = OrderedDict(zip(names, params))
+    if priors is not None:
+        priors = np.asarray(priors, dtype=np.float32).reshape((-1, 2))
+
+    config = {'model_prm': model_prm, 'input_size': input_size, 'T': T,
+              'stride': stride, 'c3d_size': c3d_size,
+              'c3d_stride': c3d_stride, 'pool_type': pool_type,
+              'feat_dim': feat_dim}
+    check_config(config, arrays, priors)
+    # Shapes are validated by the model itself
+    load_model(model_prm, input_size=input_size, params=params,
+               backend='numpy')
+    if priors is not None:
+        arrays['priors'] = priors
+
+    # Place arrays after the header
+    entries, offset = [], 0
+    for name, value in arrays.iteritems():
+        value = np.ascontiguousarray(value)
+        arrays[name] = value
+        entries.append({'name': name, 'dtype': value.dtype.str,
+                        'shape': list(value.shape), 'offset': offset})
+        offset += _aligned(value.nbytes)
+    header = json.dumps({'config': config, 'arrays': entries})
+    data_offset = _aligned(PREAMBLE.size + len(header))
+
+    with open(filename, 'wb') as fobj:
+        fobj.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        fobj.write(header)
+        fobj.write('\0' * (data_offset - PREAMBLE.size - len(header)))
+        for value in arrays.itervalues():
+            fobj.write(value.tobytes())
+            fobj.write('\0' * (_aligned(value.nbytes) - value.nbytes))
+
+
+def read_bundle(filename, mmap=True):
+    """Read content of a bundle
+
+    Parameters
+    ----------
+    filename : str
+        Fullpath of bundle file.
+    mmap : bool, optional
+        Memory-map arrays instead of reading them.
+
+    Outputs
+    -------
+    config : dict
+        Bundle configuration, see `dump_bundle`.
+    arrays : OrderedDict
+        ndarrays with the parameters of the network keyed by name. It may
+        include 'priors'.
+
+    """
+    with open(filename, 'rb') as fobj:
+        magic, version, header_size = PREAMBLE.unpack(
+            fobj.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError('{} is not a DAPs bundle'.format(filename))
+        if version > VERSION:
+            raise ValueError('Unsupported bundle version {}'.format(version))
+        header = json.loads(fobj.read(header_size))
+        data_offset = _aligned(PREAMBLE.size + header_size)
+        arrays = OrderedDict()
+        for entry in header['arrays']:
+            offset = data_offset + entry['offset']
+            dtype, shape = np.dtype(str(entry['dtype'])), tuple(entry['shape'])
+            if mmap:
+                value = np.memmap(filename, dtype=dtype, mode='r',
+                                  offset=offset, shape=shape)
+            else:
+                fobj.seek(offset)
+                value = np.fromfile(fobj, dtype=dtype,
+                                    count=int(np.prod(shape)))
+                value = value.reshape(shape)
+            arrays[str(entry['name'])] = value
+    config = dict((str(k), v) for k, v in header['config'].iteritems())
+    config['model_prm'] = str(config['model_prm'])
+    if config['pool_type'] is not None:
+        config['pool_type'] = str(config['pool_type'])
+    return config, arrays
+
+
+def load_bundle(filename, backend='theano', mmap=True):
+    """Validate a bundle and instantiate its model
+
+    Parameters
+    ----------
+    filename : str
+        Fullpath of bundle file.
+    backend : str, optional
+        Library used to evaluate the network, see
+        `daps.inference.load_model`.
+    mmap : bool, optional
+        Memory-map arrays instead of reading them.
+
+    Outputs
+    -------
+    model : ProposalModel or NumpyProposalModel
+        Model ready for inference.
+    config : dict
+        Bundle configuration, see `dump_bundle`, plus 'priors' (None if the
+        bundle does not have them).
+
+    """
+    config, arrays = read_bundle(filename, mmap)
+    config['priors'] = arrays.pop('priors', None)
+    check_config(config, arrays, config['priors'])
+    params = [arrays[i] for i in param_names(config['model_prm'])]
+    model = load_model(config['model_prm'], input_size=config['input_size'],
+                       params=params, backend=backend)
+    return model, config
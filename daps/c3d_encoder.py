@@ -1,7 +1,62 @@
 import h5py
 import numpy as np
 
-from daps.utils.pooling import concat1d, pyramid1d
+from daps.utils.pooling import feature_pooling
+
+
+def pool_windows(raw_feat_stack, f_init_array, duration=256, t_size=16,
+                 t_stride=8, pool_type='mean', return_reshaped=True,
+                 dtype=np.float64):
+    """Pool C3D features over a batch of windows of a video.
+
+    Parameters
+    ----------
+    raw_feat_stack : ndarray.
+        [l x d] array with all the C3D features of a video.
+    f_init_array : 1darray.
+        Contains list of initial frames.
+    duration : int.
+        Segment size.
+    t_size : int, optional.
+        Size of temporal receptive field C3D-model.
+    t_stride : int, optional.
+        Size of temporal stride between features.
+    pool_type : str, optional.
+        Global pooling strategy over a bunch of features.
+        'mean', 'max', 'pyr-2-mean/max', 'concat-2-mean/max'
+    return_reshaped : bool.
+        Return stack of features reshaped when pooling is applied.
+    dtype : numpy dtype, optional.
+        Type of the output. Windows are pooled straight into it.
+    """
+    # Sanitize.
+    f_init_array = f_init_array.astype(int)
+    n_segments = f_init_array.shape[0]
+
+    # Set feat stack size.
+    m = 1
+    d = raw_feat_stack.shape[1]
+    if 'pyr' in (pool_type or ''):
+        _, levels, _ = pool_type.split('-')
+        d *= 2**(int(levels) + 1) - 1
+    elif 'concat' in (pool_type or ''):
+        _, levels, _ = pool_type.split('-')
+        d *= int(levels)
+    elif not pool_type:
+        m *= (duration - t_size)/t_stride + 1
+    feat_stack = np.empty((n_segments, int(m), int(d)), dtype=dtype)
+
+    # Iterate over each segment.
+    for i, f_init in enumerate(f_init_array):
+        frames_of_interest = range(f_init,
+                                   f_init + duration - t_size + 1, t_stride)
+        feat_stack[i, ...] = feature_pooling(
+            raw_feat_stack[frames_of_interest, :], pool_type)
+
+    if return_reshaped and pool_type:
+        feat_stack = feat_stack.reshape(feat_stack.shape[0],
+                                        feat_stack.shape[2])
+    return feat_stack
 
 
 class Feature(object):
@@ -85,7 +140,8 @@ class Feature(object):
         return pooled_feat
 
     def read_feat_batch_from_video(self, video_name, f_init_array,
-                                   duration=256, return_reshaped=True):
+                                   duration=256, return_reshaped=True,
+                                   dtype=np.float64):
         """Read C3D feature batch from a video. The slicing
            is operated in memory.
 
@@ -99,41 +155,29 @@ class Feature(object):
             Segment size.
         return_reshaped : bool.
             Return stack of features reshaped when pooling is applied.
+        dtype : numpy dtype, optional.
+            Type of the output.
+        """
+        return pool_windows(self.read_video(video_name), f_init_array,
+                            duration, self.t_size, self.t_stride,
+                            self.pool_type, return_reshaped, dtype)
+
+    def read_video(self, video_name, f_init=None, f_end=None):
+        """Read the C3D features of a video.
+
+        Parameters
+        ----------
+        video-name : str.
+            Video identifier.
+        f_init : int, optional.
+            Initial frame index. By default the first one.
+        f_end : int, optional.
+            Frame index after the last one read. By default all the rows
+            till the end of the video.
         """
         if not self.fobj:
             raise ValueError('The object instance is not open.')
-        # Sanitize.
-        f_init_array = f_init_array.astype(int)
-        # Load all features associated to video-name.
-        raw_feat_stack = self.fobj[video_name][self.feat_id].value
-        t_size = self.t_size
-        s = self.t_stride
-        n_segments = f_init_array.shape[0]
-
-        # Set feat stack size.
-        m = 1
-        d = raw_feat_stack.shape[1]
-        if 'pyr' in self.pool_type:
-            _, levels, pool_type = self.pool_type.split('-')
-            d *= 2**(int(levels) + 1) - 1
-        elif 'concat' in self.pool_type:
-            _, levels, pool_type = self.pool_type.split('-')
-            d *= int(levels)
-        elif not self.pool_type:
-            m *= (duration - t_size)/s + 1
-        feat_stack = np.empty((n_segments, int(m), int(d)))
-
-        # Iterate over each segment.
-        for i, f_init in enumerate(f_init_array):
-            frames_of_interest = range(f_init,
-                                       f_init + duration - t_size + 1, s)
-            feat_stack[i, ...] = self._feature_pooling(
-                raw_feat_stack[frames_of_interest, :])
-
-        if return_reshaped and self.pool_type:
-            feat_stack = feat_stack.reshape(feat_stack.shape[0],
-                                            feat_stack.shape[2])
-        return feat_stack
+        return self.fobj[video_name][self.feat_id][f_init:f_end]
 
     def _feature_pooling(self, x):
         """Compute pooling of a feature vector.
@@ -144,19 +188,4 @@ class Feature(object):
             [m x d] array of features.m is the number of features and
             d is the dimensionality of the feature space.
         """
-        if x.ndim != 2:
-            raise ValueError('Invalid input ndarray. Input must be [mxd].')
-
-        if not self.pool_type:
-            return x
-
-        if self.pool_type == 'mean':
-            return x.mean(axis=0)
-        elif self.pool_type == 'max':
-            return x.max(axis=0)
-        elif 'pyr' in self.pool_type:
-            _, level, pool_type = self.pool_type.split('-')
-            return pyramid1d(x, int(level), pool_type)
-        elif 'concat' in self.pool_type:
-            _, level, pool_type = self.pool_type.split('-')
-            return concat1d(x, int(level), pool_type)
+        return feature_pooling(x, self.pool_type)
@@ -1,33 +1,121 @@
 import os
+import time
 import warnings
 
 import hickle as hkl
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import pairwise_distances_argmin_min
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import StandardScaler
 
 from daps.utils.extra import sampling_with_uniform_groups
-from daps.utils.segment import format as segment_format
+from daps.utils.segment import grouped_iou_matching
+from daps.utils.segment import IntervalIndex, MEMORY_BUDGET, SegmentArray
 from daps.utils.segment import intersection as segment_intersection
 from daps.utils.segment import iou as segment_iou
+from daps.utils.segment import sliding_coverage
 from daps.utils.segment import unit_scaling as segment_unit_scaling
 
 RATIO_INTERVALS = [0, 0.05, 0.15, 0.4, np.inf]
 REQ_INFO_CP = ['video-name', 'f-init', 'n-frames', 'video-frames']
+CLUSTERING = ['kmeans', 'minibatch', 'streaming']
 
 
 def wrapper_unit_scaling(x, T, s_ref, n_gt, *args, **kwargs):
     """Normalize segments to unit-length and use center-duration format
     """
-    xc = segment_format(x, 'b2c')
+    xc = SegmentArray(x, 'b').convert('c').data
     init_ref = np.repeat(s_ref[:, 0], n_gt)
     return segment_unit_scaling(xc, T, init_ref)
 
 
+def video_segments(T, l_size, gtruth_b, rng_seed=None, i_thr=1.0):
+    """Segments of a video and annotations mapped onto them
+
+    Parameters
+    ----------
+    T : int
+        Canonical temporal size of evaluation window.
+    l_size : int
+        Size of the video.
+    gtruth_b : ndarray
+        2-dim array with annotations of the video in format [f-init, f-end].
+    rng_seed : int, optional
+        Seed for random number generator.
+    i_thr : float, optional
+        Ratio [0, 1] to include an annotation inside a segment.
+
+    Outputs
+    -------
+    segments : ndarray
+        2-dim array of sampled segments, see `generate_segments`.
+    mapped_gt : ndarray
+        2-dim array with intersection of annotations and segments.
+    n_gt : ndarray
+        1-dim array with number of annotations inside each segment.
+
+    """
+    segments, gt_list, n_gt = generate_segments(
+        T, l_size, gtruth_b, method='iou', rng_seed=rng_seed, i_thr=i_thr)
+    if len(gt_list) > 0:
+        return segments, np.vstack(gt_list), n_gt
+    return segments, np.empty((0, 2)), n_gt
+
+
+def segment_priors_score(priors_b, mapped_gt, n_gt, iou_thr=0.5,
+                         memory_budget=None):
+    """Priors matching the annotations of each segment
+
+    Parameters
+    ----------
+    priors_b : ndarray
+        2-dim array [K x 2:=[f-init, f-end]] of priors in boundary format.
+    mapped_gt : ndarray
+        2-dim array [m x 2:=[f-init, f-end]] of annotations referenced to the
+        initial frame of their segment. Annotations of a segment are
+        contiguous.
+    n_gt : ndarray
+        1-dim array with number of annotations of each segment.
+    iou_thr : float, optional
+        IOU threshold to consider that an annotation match with a prior.
+    memory_budget : int, optional
+        Max number of bytes of the IOU matrix of a chunk of segments. By
+        default MEMORY_BUDGET of daps.utils.segment.
+
+    Outputs
+    -------
+    score : ndarray
+        2-dim array [n_segments x K] with 1 for priors matching any
+        annotation of the segment and 0 otherwise.
+
+    """
+    if memory_budget is None:
+        memory_budget = MEMORY_BUDGET
+    score = np.zeros((n_gt.size, priors_b.shape[0]), dtype=int)
+    end_gt = np.cumsum(n_gt)
+    first_gt = end_gt - n_gt
+    has_gt = np.flatnonzero(n_gt > 0)
+    if has_gt.size == 0:
+        return score
+    # Segments are matched by chunks whose IOU matrix fits on budget
+    itemsize = np.result_type(priors_b, mapped_gt, np.float32).itemsize
+    max_gt = max(int(memory_budget // (priors_b.shape[0] * itemsize)), 1)
+    chunk = (end_gt[has_gt] - 1) // max_gt
+    bounds = np.flatnonzero(np.hstack([True, np.diff(chunk) > 0, True]))
+    for i, j in zip(bounds[:-1], bounds[1:]):
+        idx = has_gt[i:j]
+        lo, hi = first_gt[idx[0]], end_gt[idx[-1]]
+        iou = segment_iou(priors_b, mapped_gt[lo:hi, :])
+        max_iou = np.maximum.reduceat(iou, first_gt[idx] - lo, axis=1).T
+        score[idx, :] = max_iou > iou_thr
+    return score
+
+
 def compute_priors(df, T, K=200, iou_thr=0.5, norm_fcn=wrapper_unit_scaling,
-                   i_thr=1.0, rng_seed=None):
+                   i_thr=1.0, rng_seed=None, n_jobs=1, clustering='kmeans',
+                   batch_size=10000, return_model=False):
     """Clustering of ground truth locations
 
     Parameters
@@ -47,7 +135,17 @@ def compute_priors(df, T, K=200, iou_thr=0.5, norm_fcn=wrapper_unit_scaling,
     i_thr : float
         ratio [0, 1] to include an annotation inside a segment.
     rng_seed : int
-        Seed for random number generator
+        Seed for random number generator. Seeds of every video are drawn from
+        it.
+    n_jobs : int, optional
+        Number of processes used to sample segments of videos.
+    clustering : str, optional
+        Clustering algorithm, see `TempPriorsNoScale`.
+    batch_size : int, optional
+        Size of mini-batches of 'minibatch' and 'streaming' clustering.
+    return_model : bool, optional
+        Return two extra outputs (clustering model and normalized annotations
+        used to fit it).
 
     Outputs
     -------
@@ -56,6 +154,10 @@ def compute_priors(df, T, K=200, iou_thr=0.5, norm_fcn=wrapper_unit_scaling,
         different priors.
     new_df : DataFrame
         Table with information about instances to use in training
+    model : TempPriorsNoScale
+        Clustering model.
+    X : ndarray
+        2-dim array with normalized annotations.
 
     """
     # Input validation
@@ -67,23 +169,28 @@ def compute_priors(df, T, K=200, iou_thr=0.5, norm_fcn=wrapper_unit_scaling,
     if iou_thr > 1 or iou_thr < 0:
         raise ValueError('Invalid value of IOU')
 
-    # Loop over videos
-    videos = df['video-name'].unique()
-    L = np.empty(videos.size, dtype=int)
-    segment_lst, n_seg = [None] * videos.size, np.empty(videos.size, dtype=int)
-    mapped_gt_lst, n_gt_lst = [None] * videos.size, [None] * videos.size
-    for i, v in enumerate(videos):
-        idx = df['video-name'] == v
-        L[i] = df.loc[idx, 'video-frames'].mean()
-        gtruth_c = df.loc[idx, ['f-init', 'n-frames']]
-        gtruth_b = segment_format(np.array(gtruth_c), 'd2b')
-        segment_lst[i], gt_list_i, n_gt_lst[i] = generate_segments(
-            T, L[i], gtruth_b, method='iou', rng_seed=rng_seed, i_thr=i_thr)
-        n_seg[i] = segment_lst[i].shape[0]
-        if len(gt_list_i) > 0:
-            mapped_gt_lst[i] = np.vstack(gt_list_i)
-        else:
-            mapped_gt_lst[i] = np.empty((0, 2))
+    # Group annotations by video once, in order of appearance
+    gtruth = SegmentArray.from_dataframe(df, dtype=np.float64)
+    gtruth.convert('b', inplace=True)
+    frames = df.groupby('video-name', sort=False)['video-frames'].mean()
+    videos, L = frames.index.values, frames.values.astype(int)
+    gtruth_lst = [i.data for _, i in gtruth.groupby_video()]
+
+    # Every video has its own seed, thus results do not depend on n_jobs
+    seeds = [None] * videos.size
+    if isinstance(rng_seed, int):
+        seeds = np.random.RandomState(rng_seed).randint(
+            0, np.iinfo(np.int32).max, videos.size).tolist()
+    args = zip(L, gtruth_lst, seeds)
+    if n_jobs == 1:
+        rst = [video_segments(T, l, g, seed, i_thr) for l, g, seed in args]
+    else:
+        from sklearn.externals.joblib import Parallel, delayed
+        rst = Parallel(n_jobs=n_jobs)(
+            delayed(video_segments)(T, l, g, seed, i_thr)
+            for l, g, seed in args)
+    segment_lst, mapped_gt_lst, n_gt_lst = zip(*rst)
+    n_seg = np.array([i.shape[0] for i in segment_lst], dtype=int)
 
     # Standardize mapped annotations into a common reference + Normalization
     segments = np.vstack(segment_lst)
@@ -92,37 +199,24 @@ def compute_priors(df, T, K=200, iou_thr=0.5, norm_fcn=wrapper_unit_scaling,
     X = norm_fcn(mapped_gt, T, segments, n_gt)
 
     # Clustering
-    model = TempPriorsNoScale(K, rng_seed=rng_seed)
+    model = TempPriorsNoScale(K, rng_seed=rng_seed, clustering=clustering,
+                              batch_size=batch_size)
     model.fit(X)
     priors = model.priors
 
     # Matching
-    score = np.empty((segments.shape[0], priors.shape[0]), dtype=int)
-    j = 0
-    for i, v in enumerate(segment_lst):
-        # Scale priors and use boundary format
-        mapped_priors_b = segment_format(priors * T, 'c2b')
-        s_ref = np.expand_dims(np.repeat(v[:, 0], n_gt_lst[i]), 1)
-
-        # Reference mapped gt on [0 - T] interval
-        if mapped_gt_lst[i].size == 0:
-            continue
-        mapped_gt_i_ref = mapped_gt_lst[i] - s_ref
-        if (mapped_gt_i_ref[:, 0] < 0).sum() > 0:
-            msg = ('Initial frame must be greater that zero. Running at your '
-                   'own risk. Debug is needed.')
-            warnings.warn(msg)
-
-        # IOU computation
-        iou = segment_iou(mapped_priors_b, mapped_gt_i_ref)
-
-        # Map IOU of priors for each segment
-        idx = [0] + np.cumsum(n_gt_lst[i]).tolist()
-        max_iou = np.vstack(map(lambda u, v: np.zeros(K, dtype=int)
-                                if u == v else iou[:, u:v].max(axis=1),
-                                idx[:-1], idx[1::]))
-        score[j:j+n_seg[i], :] = max_iou > iou_thr
-        j += n_seg[i]
+    # Reference mapped gt on [0 - T] interval of its segment
+    segment_idx = np.arange(segments.shape[0]).repeat(n_gt)
+    mapped_gt_ref = mapped_gt - segments[segment_idx, :1]
+    if (mapped_gt_ref[:, 0] < 0).sum() > 0:
+        msg = ('Initial frame must be greater that zero. Running at your '
+               'own risk. Debug is needed.')
+        warnings.warn(msg)
+
+    # Priors scaled in boundary format
+    mapped_priors_b = SegmentArray(priors * T, 'c').boundaries()
+    score = segment_priors_score(mapped_priors_b, mapped_gt_ref, n_gt,
+                                 iou_thr)
 
     # Build DataFrame
     col_triads = ['c_{}'.format(i) for i in range(K)]
@@ -132,10 +226,13 @@ def compute_priors(df, T, K=200, iou_thr=0.5, norm_fcn=wrapper_unit_scaling,
                                                             segments.shape[0]),
                                       'video-frames': np.repeat(L, n_seg)}),
                         pd.DataFrame(score, columns=col_triads)], axis=1)
+    if return_model:
+        return priors, new_df, model, X
     return priors, new_df
 
 
-def compute_priors_over_time(mapped_priors_b, T, l_size, stride=16):
+def compute_priors_over_time(mapped_priors_b, T, l_size, stride=16,
+                             flat=True, dtype=np.int32):
     """Compile priors over time from a given video length.
     Parameters
     ----------
@@ -147,31 +244,126 @@ def compute_priors_over_time(mapped_priors_b, T, l_size, stride=16):
         Size of the video.
     stride: int
         Size of the sliding step.
+    flat : bool, optional
+        Return priors_t as a 2-dim view instead of a 3-dim array.
+    dtype : numpy.dtype, optional
+        Type of priors_t.
 
     Outputs
     -------
     priors_t: ndarray
-         2-dim array of selected segments for a video,
-         format: [n x 2:=[init, end]].
+         3-dim array [n_windows x K x 2:=[init, end]] of priors shifted by
+         the initial frame of each window or 2-dim view of it, format:
+         [n_windows * K x 2:=[init, end]].
     k_idx: ndarray
          1-dim array of prior indices.
     """
-    # Build segment stack.
     nr_priors = mapped_priors_b.shape[0]
-    f_init = np.arange(1, l_size - T, stride + 1).repeat(nr_priors)
-    priors_t = np.stack([f_init, f_init + np.zeros(f_init.shape[0])], axis=-1)
-    k_idx = np.empty(f_init.shape[0])
-
-    # Assign a segment to each prior.
-    for i, mp_i in enumerate(mapped_priors_b):
-        idx = np.arange(i, priors_t.shape[0], nr_priors)
-        priors_t[idx, :] += mp_i
-        k_idx[idx] = i
+    f_init = np.arange(1, l_size - T, stride + 1, dtype=dtype)
+    priors_t = (f_init[:, np.newaxis, np.newaxis] +
+                mapped_priors_b.astype(dtype, copy=False)).astype(
+                    dtype, copy=False)
+    k_idx = np.tile(np.arange(nr_priors, dtype=np.int32), f_init.size)
+    if flat:
+        priors_t = priors_t.reshape(-1, 2)
     return priors_t, k_idx
 
 
+def iter_priors_over_time(mapped_priors_b, T, l_size, stride=16,
+                          chunk_size=1024, dtype=np.int32):
+    """Priors over time of a video by chunks of windows
+
+    Parameters
+    ----------
+    mapped_priors_b: ndarray
+        2-dim array of priors discovered in 'c2b' format [f-init, f-end].
+    T: int
+        Canonical temporal size of evaluation window.
+    l_size : int
+        Size of the video.
+    stride: int, optional
+        Size of the sliding step.
+    chunk_size : int, optional
+        Number of windows per chunk.
+    dtype : numpy.dtype, optional
+        Type of priors_t.
+
+    Outputs
+    -------
+    priors_t: ndarray
+         2-dim array [chunk_size * K x 2:=[init, end]] with priors of the
+         chunk, see `compute_priors_over_time`.
+    k_idx: ndarray
+         1-dim array of prior indices.
+    """
+    nr_priors = mapped_priors_b.shape[0]
+    mapped_priors_b = mapped_priors_b.astype(dtype, copy=False)
+    k_idx = np.tile(np.arange(nr_priors, dtype=np.int32), chunk_size)
+    f_init = np.arange(1, l_size - T, stride + 1, dtype=dtype)
+    for i in range(0, f_init.size, chunk_size):
+        f_init_chunk = f_init[i:i + chunk_size]
+        priors_t = f_init_chunk[:, np.newaxis, np.newaxis] + mapped_priors_b
+        yield (priors_t.reshape(-1, 2).astype(dtype, copy=False),
+               k_idx[:f_init_chunk.size * nr_priors])
+
+
+def match_priors(mapped_priors_b, T, lengths, gtruth_b, l_idx, stride=16):
+    """Best prior over time of annotations of videos with given lengths
+
+    Parameters
+    ----------
+    mapped_priors_b: ndarray
+        2-dim array of priors in format [f-init, f-end].
+    T: int
+        Canonical temporal size of evaluation window.
+    lengths : ndarray
+        1-dim array with size of videos.
+    gtruth_b : ndarray
+        2-dim array with annotations in format [f-init, f-end].
+    l_idx : ndarray
+        1-dim array with index of the length of the video of each annotation.
+    stride: int, optional
+        Size of the sliding step.
+
+    Outputs
+    -------
+    best_iou : ndarray
+        1-dim array with IOU of the best prior of each annotation.
+    best_priors_t : ndarray
+        2-dim array with the best prior of each annotation, NaN for videos
+        without priors.
+    best_priors_index : ndarray
+        1-dim array with index of the best prior of each annotation.
+
+    """
+    priors_lst = [np.empty((0, 2), dtype=np.int32)]
+    k_lst = [np.empty(0, dtype=np.int32)]
+    for L in lengths:
+        priors_t, k_idx = compute_priors_over_time(mapped_priors_b, T, L,
+                                                   stride)
+        priors_lst.append(priors_t)
+        k_lst.append(k_idx)
+    n_priors = np.array([i.shape[0] for i in priors_lst[1:]], dtype=int)
+    priors_t, k_idx = np.vstack(priors_lst), np.hstack(k_lst)
+    best_iou, max_idx = grouped_iou_matching(
+        l_idx, gtruth_b, np.arange(lengths.size).repeat(n_priors), priors_t)
+
+    # Without overlap, the first prior is reported as dense argmax does
+    first_prior = np.cumsum(n_priors) - n_priors
+    no_match = max_idx < 0
+    max_idx[no_match] = first_prior[l_idx[no_match]]
+    # Not found priors for these videos.
+    found = n_priors[l_idx] > 0
+    best_priors_t = np.full((gtruth_b.shape[0], 2), np.nan)
+    best_priors_index = np.full(gtruth_b.shape[0], np.nan)
+    best_priors_t[found, :] = priors_t[max_idx[found], :]
+    best_priors_index[found] = k_idx[max_idx[found]]
+    best_iou[~found] = 0.0
+    return best_iou, best_priors_t, best_priors_index
+
+
 def evaluate_priors(df, priors, T, stride=16, iou_thr=0.5,
-                    return_recall=False):
+                    return_recall=False, n_jobs=1, max_priors=2**22):
     """
     Parameters
     ----------
@@ -189,6 +381,11 @@ def evaluate_priors(df, priors, T, stride=16, iou_thr=0.5,
         IOU threshold to consider that an annotation match with a prior.
     return_recall: bool, optional
         Return one extra output (recall, computed at given iou_thr).
+    n_jobs : int, optional
+        Number of processes matching batches of videos.
+    max_priors : int, optional
+        Approximate number of priors over time matched at once. Videos are
+        batched by length up to it.
 
     Outputs
     -------
@@ -198,40 +395,41 @@ def evaluate_priors(df, priors, T, stride=16, iou_thr=0.5,
         Recall at given iou threshold.
     """
     # Sanitize input.
-    mapped_priors_b = segment_format(priors * T, 'c2b').clip(1, T)
-    mapped_priors_b = np.array(mapped_priors_b).astype(np.int)
-
-    # Iterate over each instance.
-    best_iou, v_pointer = np.empty(df['video-name'].size), 0
-    best_priors_t = np.empty((df['video-name'].size, 2))
-    best_priors_index = np.empty(df['video-name'].size)
-    for i, sgm_i in df.iterrows():
-        # Parsing ground-truth.
-        L = sgm_i['video-frames']
-        gtruth_c = np.empty((1, 2))
-        gtruth_c[0, :] = np.stack([sgm_i['f-init'], sgm_i['n-frames']],
-                                  axis=-1)
-        gtruth_b = segment_format(gtruth_c, 'd2b')
-
-        # Slide priors over time.
-        priors_t, k_idx = compute_priors_over_time(mapped_priors_b, T,
-                                                   L, stride)
-
-        # Not found priors for this video.
-        if priors_t.shape[0] == 0:
-            best_iou[v_pointer] = 0.0
-            best_priors_t[v_pointer, :] = np.array([[np.nan, np.nan]])
-            best_priors_index[v_pointer] = np.array([np.nan])
-            v_pointer += 1
-            continue
-
-        # Compute iou and keep the best one for each ground-truth instance.
-        iou = segment_iou(gtruth_b, priors_t)
-        max_idx = iou.argmax(axis=1)
-        best_iou[v_pointer] = iou.flatten()[max_idx]
-        best_priors_t[v_pointer, :] = priors_t[max_idx, :]
-        best_priors_index[v_pointer] = k_idx[max_idx]
-        v_pointer += 1
+    mapped_priors_b = SegmentArray(priors * T, 'c').boundaries()
+    mapped_priors_b = mapped_priors_b.clip(1, T).astype(np.int)
+
+    # Priors over time only depend on the length of the video, thus they are
+    # built once per length and matched against all the annotations of
+    # videos with that length at once.
+    gtruth_b = SegmentArray.from_dataframe(df, video_column=None,
+                                           dtype=np.float64).boundaries()
+    lengths, l_idx = np.unique(df['video-frames'].values,
+                               return_inverse=True)
+
+    # Batches of lengths whose priors over time fit in max_priors
+    n_windows = np.ceil((lengths - T - 1) / (stride + 1.0)).clip(0)
+    batch = (np.cumsum(n_windows * len(priors)) // max(max_priors, 1))
+    edges = np.hstack([0, np.flatnonzero(np.diff(batch)) + 1, lengths.size])
+    order = np.argsort(l_idx, kind='mergesort')
+    gt_edges = np.searchsorted(l_idx[order], edges)
+    args = [(lengths[i:j], gtruth_b[order[u:v], :], l_idx[order[u:v]] - i)
+            for i, j, u, v in zip(edges[:-1], edges[1:], gt_edges[:-1],
+                                  gt_edges[1:])]
+    if n_jobs == 1:
+        rst = [match_priors(mapped_priors_b, T, l, g, idx, stride)
+               for l, g, idx in args]
+    else:
+        from sklearn.externals.joblib import Parallel, delayed
+        rst = Parallel(n_jobs=n_jobs)(
+            delayed(match_priors)(mapped_priors_b, T, l, g, idx, stride)
+            for l, g, idx in args)
+    best_iou = np.empty(gtruth_b.shape[0])
+    best_priors_t = np.empty((gtruth_b.shape[0], 2))
+    best_priors_index = np.empty(gtruth_b.shape[0])
+    if len(rst) > 0:
+        best_iou[order] = np.hstack([i[0] for i in rst])
+        best_priors_t[order, :] = np.vstack([i[1] for i in rst])
+        best_priors_index[order] = np.hstack([i[2] for i in rst])
 
     # Build DataFrame.
     s_init = best_priors_t[:, 0]
@@ -292,7 +490,8 @@ def dump_files(filename, priors=None, df=None, conf=False):
 
 def generate_segments(t_size, l_size, annotations, cov_edges=RATIO_INTERVALS,
                       i_thr=0.5, rng_seed=None, method=None,
-                      strict_uniform=False, return_annot=True):
+                      strict_uniform=False, return_annot=True,
+                      engine='analytic'):
     """Sample segments from a video
 
     Parameters
@@ -315,6 +514,12 @@ def generate_segments(t_size, l_size, annotations, cov_edges=RATIO_INTERVALS,
         If true the samples are selected with strict uniform distribution.
     return_annot : bool, optional
         Return two extra outputs (new_annotations and n_annotations).
+    engine : str, optional
+        'analytic': coverage from the breakpoints of the intersection with
+        `daps.utils.segment.sliding_coverage`, annotations are only looked up
+        for sampled segments. 'index': look up the annotations overlapping
+        each segment with `daps.utils.segment.IntervalIndex`. 'dense':
+        compute intersection and IOU of every pair annotation-segment.
 
     Outputs
     -------
@@ -327,35 +532,81 @@ def generate_segments(t_size, l_size, annotations, cov_edges=RATIO_INTERVALS,
         1-dim array of size n with number of annotations inside ith-segment.
 
     """
+    if engine not in ('analytic', 'index', 'dense'):
+        raise ValueError('Unknown engine {}'.format(engine))
     rng = np.random.RandomState()
     if isinstance(rng_seed, int):
         rng = np.random.RandomState(rng_seed)
 
     f_init = np.arange(1, l_size - t_size)
     segments = np.stack([f_init, f_init + t_size - 1], axis=-1)
-    i_segments, i_ratio = segment_intersection(annotations, segments,
-                                               return_ratio_target=True)
-
-    idx_mask = i_ratio >= i_thr
-    if isinstance(method, str):
-        iou_ratio = segment_iou(annotations, segments)
-        cov_ratio_per_segment = iou_ratio.sum(axis=0)
+    # Annotations without overlap pass a non-positive threshold
+    if engine == 'analytic' and i_thr > 0:
+        cov_ratio_per_segment = sliding_coverage(
+            annotations, t_size, f_init[0] if f_init.size else 1,
+            f_init.size, method, i_thr)
+    elif engine == 'index' and i_thr > 0:
+        rows, cols, i_ratio, iou_ratio = IntervalIndex(annotations).overlap(
+            segments)
+        idx_inside = i_ratio >= i_thr
+        if isinstance(method, str):
+            cov_ratio_per_segment = np.bincount(cols, iou_ratio,
+                                                minlength=segments.shape[0])
+        else:
+            cov_ratio_per_segment = np.bincount(
+                cols[idx_inside], i_ratio[idx_inside],
+                minlength=segments.shape[0])
+        rows, cols = rows[idx_inside], cols[idx_inside]
     else:
-        # Coverage computation
-        # Note: summing i_ratio of segments may yield values greater that 1.
-        i_ratio[~idx_mask] = 0  # For incomplete actions and empty seg.
-        cov_ratio_per_segment = i_ratio.sum(axis=0)
+        i_ratio = segment_intersection(annotations, segments,
+                                       ratio_only=True)
+        idx_mask = i_ratio >= i_thr
+        if isinstance(method, str):
+            iou_ratio = segment_iou(annotations, segments)
+            cov_ratio_per_segment = iou_ratio.sum(axis=0)
+        else:
+            # Coverage computation
+            # Note: summing i_ratio of segments may yield values greater that
+            # 1.
+            i_ratio[~idx_mask] = 0  # For incomplete actions and empty seg.
+            cov_ratio_per_segment = i_ratio.sum(axis=0)
 
     idx_samples = sampling_with_uniform_groups(
         cov_ratio_per_segment, cov_edges, strict=False, rng=rng)
     idx_samples = rng.permutation(idx_samples)
 
     # Should valif i_segments have intersection >=0.5?
-    if return_annot:
+    if return_annot and engine != 'dense' and i_thr > 0:
+        keys = idx_samples
+        if engine == 'analytic':
+            rows, cols, i_ratio, _ = IntervalIndex(annotations).overlap(
+                segments[idx_samples, :])
+            idx_inside = i_ratio >= i_thr
+            rows, cols = rows[idx_inside], cols[idx_inside]
+            keys = np.arange(len(idx_samples))
+        # Pairs of every sample are contiguous as they are sorted by cols
+        lo = np.searchsorted(cols, keys, 'left')
+        n_annotations = np.searchsorted(cols, keys, 'right') - lo
+        offset = np.cumsum(n_annotations) - n_annotations
+        idx_pairs = (np.repeat(lo - offset, n_annotations) +
+                     np.arange(n_annotations.sum()))
+        annot_i = annotations[rows[idx_pairs], :]
+        segment_i = segments[np.repeat(idx_samples, n_annotations), :]
+        i_segments = np.stack(
+            [np.maximum(annot_i[:, 0], segment_i[:, 0]),
+             np.minimum(annot_i[:, 1], segment_i[:, 1])], axis=-1).astype(
+                 np.result_type(annotations, segments, np.float32))
+        new_annotations = []
+        if len(idx_samples) > 0:
+            new_annotations = np.split(i_segments,
+                                       np.cumsum(n_annotations)[:-1])
+        return segments[idx_samples, :], new_annotations, n_annotations
+    elif return_annot:
         new_annotations = [None] * len(idx_samples)
         n_annotations = np.zeros(len(idx_samples), dtype=int)
         for i, v in enumerate(idx_samples):
-            new_annotations[i] = i_segments[idx_mask[:, v], v, :]
+            new_annotations[i] = segment_intersection(
+                annotations[idx_mask[:, v], :], segments[v:v + 1, :])[:, 0, :]
             n_annotations[i] = new_annotations[i].shape[0]
         return segments[idx_samples, :], new_annotations, n_annotations
 
@@ -415,22 +666,89 @@ def load_files(priors_file=None, ref_file=None, conf_file=None):
 
 
 class TempPriorsNoScale(object):
-    def __init__(self, n_prop=200, rng_seed=None):
+    """KMeans over temporal locations features
+
+    Parameters
+    ----------
+    n_prop : int, optional
+        Number of priors.
+    rng_seed : int, optional
+        Seed for random number generator.
+    clustering : str, optional
+        'kmeans': full-batch KMeans. 'minibatch': MiniBatchKMeans over random
+        mini-batches. 'streaming': features are standardized and clustered
+        chunk by chunk with MiniBatchKMeans.partial_fit after seeding the
+        centers with k-means++ on a random sample.
+    batch_size : int, optional
+        Size of mini-batches and chunks.
+    n_epochs : int, optional
+        Number of passes over the chunks of 'streaming' clustering.
+
+    """
+    def __init__(self, n_prop=200, rng_seed=None, clustering='kmeans',
+                 batch_size=10000, n_epochs=3):
+        if clustering not in CLUSTERING:
+            raise ValueError('Unknown clustering {}'.format(clustering))
         self.n_prop = n_prop
         self.priors = None
+        self.rng_seed = rng_seed
+        self.clustering = clustering
+        self.batch_size = batch_size
+        self.n_epochs = n_epochs
+        self.fit_time = None
+        if clustering == 'kmeans':
+            kmeans = KMeans(n_prop, random_state=rng_seed)
+        else:
+            kmeans = MiniBatchKMeans(
+                n_prop, batch_size=batch_size, random_state=rng_seed,
+                init_size=max(3 * n_prop, batch_size))
         self.model = Pipeline([('scaling', StandardScaler()),
-                               ('kmeans', KMeans(n_prop,
-                                                 random_state=rng_seed))])
+                               ('kmeans', kmeans)])
 
     def fit(self, X):
         """KMeans over temporal locations features
         """
-        self.model.fit(X)
+        start_time = time.time()
+        if self.clustering == 'streaming':
+            self._streaming_fit(X)
+        else:
+            self.model.fit(X)
+        self.fit_time = time.time() - start_time
         norm_priors = self.model.steps[1][1].cluster_centers_
         mu = self.model.steps[0][1].mean_
         sigma = self.model.steps[0][1].scale_
         self.priors = norm_priors * sigma + mu
 
+    def _streaming_fit(self, X):
+        scaler, kmeans = self.model.steps[0][1], self.model.steps[1][1]
+        chunks = range(0, X.shape[0], self.batch_size)
+        for i in chunks:
+            scaler.partial_fit(X[i:i + self.batch_size])
+
+        # Centers are seeded with k-means++ on a random sample
+        rng = np.random.RandomState(self.rng_seed)
+        sample_size = min(X.shape[0], kmeans.init_size)
+        idx = rng.choice(X.shape[0], sample_size, replace=False)
+        kmeans.partial_fit(scaler.transform(X[idx]))
+        for _ in range(self.n_epochs):
+            for i in rng.permutation(chunks):
+                kmeans.partial_fit(scaler.transform(X[i:i + self.batch_size]))
+
+    def inertia(self, X):
+        """Sum of squared distances of standardized features to their closest
+        center
+        """
+        if self.priors is None:
+            raise ValueError('model has not been trained')
+        scaler, kmeans = self.model.steps[0][1], self.model.steps[1][1]
+        rst = 0.0
+        for i in range(0, X.shape[0], self.batch_size):
+            _, dist = pairwise_distances_argmin_min(
+                scaler.transform(X[i:i + self.batch_size]),
+                kmeans.cluster_centers_)
+            rst += (dist**2).sum()
+        return rst
+
     def proposals(self, X, return_index=False):
         """Retrieve proposals for a video based on its duration
 
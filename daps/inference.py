@@ -0,0 +1,1066 @@
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from daps.c3d_encoder import Feature, pool_windows
+from daps.utils.pooling import feature_pooling, pooled_size
+from daps.utils.segment import SegmentArray
+
+
+LSTM_GATES = ['ingate', 'forgetgate', 'cell', 'outgate']
+
+
+def parse_model_prm(model_prm):
+    """Parse the specification of a localization model
+
+    Parameters
+    ----------
+    model_prm : str
+        'mlp:OUT,DEPTH,WIDTH,DROP_IN,DROP_HID' or
+        'lstm:OUT,SEQ-LENGTH,WIDTH,DEPTH'. See `daps.model.build_model`.
+
+    Outputs
+    -------
+    prm : dict
+        Type of model and its hyper-parameters.
+
+    """
+    if model_prm.startswith('mlp:'):
+        user_prm = model_prm.split(':', 1)[1].split(',')
+        n_outputs, depth, width, drop_in, drop_hid = user_prm
+        return {'type': 'mlp', 'n_outputs': int(n_outputs),
+                'depth': int(depth), 'width': int(width),
+                'drop_in': float(drop_in), 'drop_hid': float(drop_hid)}
+    elif model_prm.startswith('lstm:'):
+        user_prm = model_prm.split(':', 1)[1].split(',')
+        n_outputs, seq_length, width, depth = user_prm
+        return {'type': 'lstm', 'n_outputs': int(n_outputs),
+                'seq_length': int(seq_length), 'width': int(width),
+                'depth': int(depth)}
+    raise ValueError("Unrecognized model type " + model_prm)
+
+
+def multiply_adds(model_prm, input_size=4096):
+    """Number of multiply-add operations to evaluate a single window
+
+    Parameters
+    ----------
+    model_prm : str
+        Model specification, see `daps.model.build_model`.
+    input_size : int, optional
+        Size of the input to the network.
+
+    """
+    prm = parse_model_prm(model_prm)
+    width, n_in = prm['width'], input_size
+    if prm['type'] == 'mlp':
+        n_ops = 0
+        for _ in range(prm['depth']):
+            n_ops += n_in * width
+            n_in = width
+    else:
+        n_ops = 0
+        for _ in range(prm['depth']):
+            n_ops += prm['seq_length'] * 4 * (n_in + width) * width
+            n_in = width
+    # Localization and confidence layers
+    return n_ops + 3 * prm['n_outputs'] * width
+
+
+def sliding_windows(l_size, T=256, stride=128):
+    """Initial frame of every evaluation window over a video
+
+    Parameters
+    ----------
+    l_size : int
+        Size of the video.
+    T : int, optional
+        Canonical temporal size of evaluation window.
+    stride : int, optional
+        Size of the sliding step.
+
+    """
+    return np.arange(0, l_size - T, stride)
+
+
+def model_input(feat_stack, model_prm):
+    """Arrange a stack of pooled features as expected by the model
+
+    Parameters
+    ----------
+    feat_stack : ndarray
+        [n x d] array of pooled features.
+    model_prm : str
+        Model specification, see `daps.model.build_model`.
+
+    """
+    prm = parse_model_prm(model_prm)
+    if prm['type'] == 'lstm':
+        seq_length = prm['seq_length']
+        feat_stack = feat_stack.reshape(feat_stack.shape[0], seq_length,
+                                        feat_stack.shape[1]/seq_length)
+    return feat_stack
+
+
+def window_chunk_size(memory_budget, feat_dim, T=256, stride=128,
+                      c3d_size=16, c3d_stride=8, pool_type='mean',
+                      raw_itemsize=4):
+    """Number of windows whose features fit in a memory budget
+
+    Parameters
+    ----------
+    memory_budget : int
+        Max number of bytes used by the raw rows read from the feature file
+        plus the pooled features of a chunk of windows.
+    feat_dim : int
+        Dimension of the raw features.
+    T : int, optional
+        Canonical temporal size of the windows.
+    stride : int, optional
+        Sliding step among windows.
+    c3d_size : int, optional
+        Size of C3D receptive field.
+    c3d_stride : int, optional
+        Sliding step of C3D.
+    pool_type : str, optional
+        Pooling strategy, see `daps.utils.pooling.feature_pooling`.
+    raw_itemsize : int, optional
+        Bytes per value of the raw features.
+
+    Outputs
+    -------
+    chunk_size : int
+        Number of windows per chunk, at least one.
+
+    """
+    if pool_type:
+        pooled_bytes = pooled_size(feat_dim, pool_type) * 4
+    else:
+        pooled_bytes = ((T - c3d_size) / c3d_stride + 1) * feat_dim * 4
+    # n windows span (n - 1) * stride + T - c3d_size + 1 rows
+    row_bytes = feat_dim * raw_itemsize
+    fixed_bytes = (T - c3d_size + 1 - stride) * row_bytes
+    window_bytes = stride * row_bytes + pooled_bytes
+    return max(int((memory_budget - fixed_bytes) // window_bytes), 1)
+
+
+def iter_window_chunks(feat, video_name, f_init_array, T=256,
+                       chunk_size=1024):
+    """Pool windows of a video by chunks reading only the rows they span
+
+    Parameters
+    ----------
+    feat : daps.c3d_encoder.Feature
+        Feature file with an open instance.
+    video_name : str
+        Video identifier.
+    f_init_array : ndarray
+        1-dim array with initial frame of the windows.
+    T : int, optional
+        Canonical temporal size of the windows.
+    chunk_size : int, optional
+        Number of windows per chunk.
+
+    Outputs
+    -------
+    f_init_chunk : ndarray
+        1-dim array with initial frame of the windows in the chunk.
+    feat_stack : ndarray
+        float32 array with pooled features of the chunk.
+    n_bytes : int
+        Bytes allocated for the raw rows and pooled features of the chunk.
+
+    """
+    for i in range(0, f_init_array.size, chunk_size):
+        f_init_chunk = f_init_array[i:i + chunk_size]
+        f_init = int(f_init_chunk[0])
+        f_end = int(f_init_chunk[-1]) + T - feat.t_size + 1
+        raw_feat_stack = feat.read_video(video_name, f_init, f_end)
+        feat_stack = pool_windows(raw_feat_stack, f_init_chunk - f_init, T,
+                                  feat.t_size, feat.t_stride, feat.pool_type,
+                                  dtype=np.float32)
+        yield (f_init_chunk, feat_stack,
+               raw_feat_stack.nbytes + feat_stack.nbytes)
+
+
+def window_proposals(f_init_array, loc, score, T=256):
+    """Map outputs of the model onto video proposals
+
+    Parameters
+    ----------
+    f_init_array : ndarray
+        1-dim array with initial frame of n windows.
+    loc : ndarray
+        [n * K x 2] array with localization outputs, [center, duration]
+        relative to the window.
+    score : ndarray
+        [n x K] array with confidence outputs.
+    T : int, optional
+        Canonical temporal size of evaluation window.
+
+    Outputs
+    -------
+    proposal : ndarray
+        [n * K x 2] array with proposals, format [f-init, f-end].
+    score : ndarray
+        1-dim array of size n * K with confidence of each proposal.
+
+    """
+    n_proposals = score.shape[1]
+    score = score.flatten()
+    # Centers are shifted by the initial frame of their window in-place
+    proposal = loc.clip(0, 1)
+    proposal *= T
+    proposal = proposal.astype(np.float64, copy=False)
+    proposal[:, 0] += np.repeat(f_init_array, n_proposals)
+    proposal = SegmentArray(proposal, 'c').convert('b', inplace=True)
+    return proposal.data.astype(int), score
+
+
+def prune_proposals(proposal, score, n_proposals, top_k=None,
+                    score_thr=None, return_index=False):
+    """Keep the best scoring proposals of every window
+
+    Parameters
+    ----------
+    proposal : ndarray
+        [n * K x 2] array with proposals, see `window_proposals`.
+    score : ndarray
+        1-dim array of size n * K with confidence of each proposal.
+    n_proposals : int
+        Number of proposals per window, K.
+    top_k : int, optional
+        Number of proposals kept per window.
+    score_thr : float, optional
+        Proposals with a confidence lower than this value are removed.
+    return_index : bool, optional
+        Return one extra output (index of kept proposals).
+
+    Outputs
+    -------
+    proposal : ndarray
+        [m x 2] array with remaining proposals, same order as input.
+    score : ndarray
+        1-dim array of size m.
+    keep : ndarray
+        1-dim array with index of the remaining proposals.
+
+    """
+    keep = np.arange(score.size)
+    if top_k is not None and 0 < top_k < n_proposals:
+        score_2d = score.reshape((-1, n_proposals))
+        idx = np.argpartition(-score_2d, top_k - 1, axis=1)[:, :top_k]
+        idx += n_proposals * np.arange(score_2d.shape[0])[:, np.newaxis]
+        keep = np.sort(idx, axis=None)
+    if score_thr is not None:
+        keep = keep[score[keep] >= score_thr]
+
+    if return_index:
+        return proposal[keep, :], score[keep], keep
+    return proposal[keep, :], score[keep]
+
+
+def load_model(model_prm, filename=None, input_size=4096, backend='theano',
+               params=None):
+    """Instantiate a localization model for inference
+
+    Parameters
+    ----------
+    model_prm : str
+        Model specification, see `daps.model.build_model`.
+    filename : str, optional
+        Fullpath of npz-file with weights of the network.
+    input_size : int, optional
+        Size of the input to the network.
+    backend : str, optional
+        'theano' for `daps.model.ProposalModel` or 'numpy' for
+        `NumpyProposalModel`. The latter does not import Theano/Lasagne.
+    params : list, optional
+        ndarrays with parameters of the network. Ignored if filename is given.
+
+    """
+    if backend == 'numpy':
+        return NumpyProposalModel(model_prm, filename, input_size=input_size,
+                                  params=params)
+    elif backend == 'theano':
+        from daps.model import ProposalModel
+        return ProposalModel(model_prm, filename, input_size=input_size,
+                             params=params)
+    raise ValueError('Unknown backend {}'.format(backend))
+
+
+def _sigmoid(x):
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def lasagne_legacy_peephole():
+    """Whether the installed Lasagne adds the output peephole after the gate
+
+    Lasagne 0.1 does it. The version is read from the package metadata, thus
+    Theano/Lasagne are not imported. It is False if Lasagne is not installed.
+
+    """
+    import pkg_resources
+    try:
+        version = pkg_resources.get_distribution('Lasagne').version
+    except pkg_resources.DistributionNotFound:
+        return False
+    return version == '0.1'
+
+
+class NumpyProposalModel(object):
+    """Localization model evaluated with NumPy
+
+    It implements the deterministic forward pass of the networks created by
+    `daps.model.build_model` (dropout is the identity at inference time).
+
+    Attributes
+    ----------
+    model_prm : str
+        Model specification, see `daps.model.build_model`.
+    params : list
+        ndarrays with the parameters of the network in the same order used by
+        `lasagne.layers.get_all_param_values`.
+
+    """
+    def __init__(self, model_prm, filename=None, input_size=4096,
+                 params=None, legacy_peephole=None):
+        """Setup model and load its parameters
+
+        Parameters
+        ----------
+        model_prm : str
+            Model specification, see `daps.model.build_model`.
+        filename : str, optional
+            Fullpath of npz-file dumped by `daps.learning.dump_model`.
+        input_size : int, optional
+            Size of the input to the network.
+        params : list, optional
+            ndarrays with parameters of the network. Ignored if filename is
+            given.
+        legacy_peephole : bool, optional
+            Add the peephole of the output gate after its nonlinearity as
+            Lasagne 0.1 does. By default, it matches the installed Lasagne,
+            see `lasagne_legacy_peephole`.
+
+        """
+        self.model_prm = model_prm
+        if legacy_peephole is None:
+            legacy_peephole = lasagne_legacy_peephole()
+        self.legacy_peephole = legacy_peephole
+        self.prm = parse_model_prm(model_prm)
+        self.input_size = input_size
+        if filename is not None:
+            with np.load(filename) as f:
+                params = [f['arr_%d' % i] for i in range(len(f.files))]
+        if params is None:
+            raise ValueError('Parameters of the network are required')
+        self.set_params(params)
+
+    def param_shapes(self):
+        """Shape of every parameter of the network"""
+        prm, shapes = self.prm, []
+        n_in, width = self.input_size, prm['width']
+        for _ in range(prm['depth']):
+            if prm['type'] == 'mlp':
+                shapes += [(n_in, width), (width,)]
+            else:
+                for _ in LSTM_GATES:
+                    shapes += [(n_in, width), (width, width), (width,)]
+                shapes += [(width,)] * 3 + [(1, width)] * 2
+            n_in = width
+        n_outputs = prm['n_outputs']
+        shapes += [(n_in, 2 * n_outputs), (2 * n_outputs,),
+                   (n_in, n_outputs), (n_outputs,)]
+        return shapes
+
+    def set_params(self, params):
+        """Set parameters of the network
+
+        Parameters
+        ----------
+        params : list
+            ndarrays in the order of `lasagne.layers.get_all_param_values`.
+
+        """
+        shapes = self.param_shapes()
+        if len(params) != len(shapes):
+            msg = 'Expected {} parameters, got {}'
+            raise ValueError(msg.format(len(shapes), len(params)))
+        for i, (v, shape) in enumerate(zip(params, shapes)):
+            if v.shape != shape:
+                msg = 'Mismatch on shape of parameter {}: {} != {}'
+                raise ValueError(msg.format(i, v.shape, shape))
+        self.params = list(params)
+
+        # Gate parameters are stacked as in lasagne.layers.LSTMLayer
+        self._layers, i = [], 0
+        for _ in range(self.prm['depth']):
+            if self.prm['type'] == 'mlp':
+                self._layers.append(params[i:i + 2])
+                i += 2
+            else:
+                gates = params[i:i + 12]
+                W_in = np.concatenate(gates[0::3], axis=1)
+                W_hid = np.concatenate(gates[1::3], axis=1)
+                b = np.concatenate(gates[2::3])
+                self._layers.append([W_in, W_hid, b] + params[i + 12:i + 17])
+                i += 17
+        self._output = params[i:i + 4]
+
+    def forward(self, input_data):
+        """Forward pass input_data over network
+
+        Parameters
+        ----------
+        input_data : ndarray
+            Batch of pooled features, see `model_input`.
+
+        Outputs
+        -------
+        loc : ndarray
+            [n * K x 2] array with localization outputs.
+        score : ndarray
+            [n x K] array with confidence outputs.
+
+        """
+        x = np.asarray(input_data, dtype=self._output[0].dtype)
+        activations = self.hidden_activations(x)
+        if activations:
+            x = activations[-1]
+        if self.prm['type'] == 'lstm':
+            # Retain last-output state
+            x = x[:, -1, :]
+
+        W_loc, b_loc, W_conf, b_conf = self._output
+        # Localization layer uses the default nonlinearity of DenseLayer
+        loc = np.maximum(np.dot(x, W_loc) + b_loc, 0)
+        score = _sigmoid(np.dot(x, W_conf) + b_conf)
+        return loc.reshape((-1, 2)), score
+
+    def hidden_activations(self, input_data):
+        """Output of every hidden layer
+
+        Parameters
+        ----------
+        input_data : ndarray
+            Batch of pooled features, see `model_input`.
+
+        Outputs
+        -------
+        activations : list
+            ndarrays with the output of each hidden layer, [n x width] for
+            MLP and [n x seq_length x width] for LSTM.
+
+        """
+        x = np.asarray(input_data, dtype=self._output[0].dtype)
+        activations = []
+        for layer in self._layers:
+            if self.prm['type'] == 'mlp':
+                W, b = layer
+                x = np.maximum(np.dot(x, W) + b, 0)
+            else:
+                x = self._lstm_layer(x, *layer)
+            activations.append(x)
+        return activations
+
+    def _lstm_layer(self, x, W_in, W_hid, b, w_ci, w_cf, w_co, cell_init,
+                    hid_init):
+        """Output of LSTM layer with peepholes over all the time steps"""
+        n, seq_length = x.shape[:2]
+        width = W_hid.shape[0]
+        gates_in = np.dot(x, W_in) + b
+        cell = np.repeat(cell_init, n, axis=0)
+        hid = np.repeat(hid_init, n, axis=0)
+        hid_out = np.empty((n, seq_length, width), dtype=gates_in.dtype)
+        for t in range(seq_length):
+            gates = gates_in[:, t, :] + np.dot(hid, W_hid)
+            ingate = _sigmoid(gates[:, :width] + cell * w_ci)
+            forgetgate = _sigmoid(gates[:, width:2 * width] + cell * w_cf)
+            cell_input = np.tanh(gates[:, 2 * width:3 * width])
+            cell = forgetgate * cell + ingate * cell_input
+            if self.legacy_peephole:
+                outgate = _sigmoid(gates[:, 3 * width:]) + cell * w_co
+            else:
+                outgate = _sigmoid(gates[:, 3 * width:] + cell * w_co)
+            hid = outgate * np.tanh(cell)
+            hid_out[:, t, :] = hid
+        return hid_out
+
+
+class WindowScheduler(object):
+    """Pack windows of many sources into fixed-size batches
+
+    Windows are queued in arrival order and the model runs as soon as
+    `batch_size` of them are available, regardless of the source they belong
+    to. Outputs are scattered back to their source.
+
+    Attributes
+    ----------
+    forward : callable
+        Function mapping a batch of inputs onto (loc, score), see
+        `daps.model.ProposalModel.forward`.
+    batch_size : int
+        Number of windows evaluated by every forward pass.
+
+    """
+    def __init__(self, forward, batch_size=1024):
+        if batch_size < 1:
+            raise ValueError('batch_size must be a positive integer')
+        self.forward = forward
+        self.batch_size = batch_size
+        self.n_batches = 0
+        self._queue = []
+        self._n_queued = 0
+        self._buffer = None
+        self._pending = OrderedDict()
+
+    def add(self, key, X, f_init_array):
+        """Queue windows of a source and run all the complete batches
+
+        Parameters
+        ----------
+        key : hashable
+            Source identifier.
+        X : ndarray
+            Model input of the windows, first axis iterates over windows.
+        f_init_array : ndarray
+            1-dim array with initial frame of the windows.
+
+        Outputs
+        -------
+        completed : list
+            (key, f_init_array, loc, score) of every source whose windows
+            were all evaluated, in arrival order.
+
+        """
+        if key in self._pending:
+            raise ValueError('Duplicated key {}'.format(key))
+        n = f_init_array.shape[0]
+        self._pending[key] = {'f_init': f_init_array, 'n_left': n,
+                              'loc': None, 'score': None}
+        if n > 0:
+            self._queue.append([key, X, 0])
+            self._n_queued += n
+        while self._n_queued >= self.batch_size:
+            self._run(self.batch_size)
+        return self._pop_completed()
+
+    def flush(self):
+        """Evaluate all the queued windows
+
+        Outputs
+        -------
+        completed : list
+            Same as `add`.
+
+        """
+        while self._n_queued > 0:
+            self._run(min(self._n_queued, self.batch_size))
+        return self._pop_completed()
+
+    def _run(self, n):
+        """Forward pass over the first n queued windows"""
+        if self._buffer is None:
+            X = self._queue[0][1]
+            self._buffer = np.empty((self.batch_size,) + X.shape[1:],
+                                    dtype=np.float32)
+
+        pieces, i = [], 0
+        while i < n:
+            item = self._queue[0]
+            key, X, start = item
+            take = min(n - i, X.shape[0] - start)
+            self._buffer[i:i + take, ...] = X[start:start + take, ...]
+            pieces.append((key, start, i, take))
+            i += take
+            if start + take == X.shape[0]:
+                self._queue.pop(0)
+            else:
+                item[2] = start + take
+        self._n_queued -= n
+
+        loc, score = self.forward(self._buffer[:n, ...])
+        loc = loc.reshape((n, -1, 2))
+        self.n_batches += 1
+
+        for key, start, i, take in pieces:
+            rst = self._pending[key]
+            if rst['score'] is None:
+                n_windows = rst['f_init'].shape[0]
+                rst['loc'] = np.empty((n_windows,) + loc.shape[1:],
+                                      dtype=loc.dtype)
+                rst['score'] = np.empty((n_windows,) + score.shape[1:],
+                                        dtype=score.dtype)
+            rst['loc'][start:start + take, ...] = loc[i:i + take, ...]
+            rst['score'][start:start + take, ...] = score[i:i + take, ...]
+            rst['n_left'] -= take
+
+    def _pop_completed(self):
+        """Remove sources whose windows were evaluated"""
+        completed = []
+        while self._pending:
+            key, rst = next(self._pending.iteritems())
+            if rst['n_left'] > 0:
+                break
+            del self._pending[key]
+            if rst['score'] is None:
+                rst['loc'], rst['score'] = np.empty((0, 2)), np.empty((0, 0))
+            completed.append((key, rst['f_init'],
+                              rst['loc'].reshape((-1, 2)), rst['score']))
+        return completed
+
+
+def retrieve_proposals(video_name, l_size, network, T=256, stride=128,
+                       c3d_size=16, c3d_stride=8, pool_type='mean',
+                       hdf5_dataset=None, model_prm=None, top_k=None,
+                       score_thr=None, memory_budget=None,
+                       return_stats=False):
+    """Retrieve proposals for an input video.
+
+    Parameters
+    ----------
+    video_name : str.
+        Video identifier.
+    l_size : int.
+        Size of the video.
+    network : ProposalModel, NumpyProposalModel or callable.
+        Model with a `forward` method or function mapping a batch of inputs
+        onto (loc, score), see `daps.model.ProposalModel.forward`.
+    T : int, optional.
+        Canonical temporal size of evaluation window.
+    stride : int, optional.
+        Size of the sliding step.
+    c3d_size : int, optional.
+        Size of temporal fiel C3D network.
+    c3d_stride : int, optional.
+        Size of temporal stride between extracted features.
+    pool_type : str, optional.
+        Global pooling strategy over a bunch of features.
+        'mean', 'max', 'pyr-2-mean/max', 'concat-2-mean/max'
+    hdf5_dataset : str.
+        Path to feature file.
+    top_k : int, optional.
+        Number of proposals kept per window.
+    score_thr : float, optional.
+        Proposals with lower confidence are removed.
+    memory_budget : int, optional.
+        Max bytes of features held at once. Windows are processed by chunks
+        fitting in it. By default, all the windows are processed at once.
+    return_stats : bool, optional.
+        Return one extra output (dict with 'n_chunks', 'chunk_size' and
+        'chunk_bytes', the bytes allocated for features of each chunk).
+
+    """
+    # IO interface.
+    fobj = Feature(filename=hdf5_dataset, t_size=c3d_size,
+                   t_stride=c3d_stride, pool_type=pool_type)
+    fobj.open_instance()
+    # Video scanning.
+    f_init_array = sliding_windows(l_size, T, stride)
+    chunk_size = max(f_init_array.size, 1)
+    if memory_budget is not None:
+        feat_info = fobj.read_video(video_name, 0, 0)
+        chunk_size = min(chunk_size, window_chunk_size(
+            memory_budget, feat_info.shape[1], T, stride, c3d_size,
+            c3d_stride, pool_type, feat_info.dtype.itemsize))
+
+    # Generate proposals.
+    forward = getattr(network, 'forward', network)
+    loc, score, chunk_bytes = [], [], []
+    for _, feat_stack, n_bytes in iter_window_chunks(
+            fobj, video_name, f_init_array, T, chunk_size):
+        loc_i, score_i = forward(model_input(feat_stack, model_prm))
+        loc.append(loc_i)
+        score.append(score_i)
+        chunk_bytes.append(n_bytes)
+    # Close instance.
+    fobj.close_instance()
+
+    if f_init_array.size > 0:
+        loc, score = np.vstack(loc), np.vstack(score)
+        n_proposals = score.shape[1]
+        proposal, score = window_proposals(f_init_array, loc, score, T)
+        rst = prune_proposals(proposal, score, n_proposals, top_k, score_thr)
+    else:
+        rst = np.empty((0, 2), dtype=int), np.empty(0)
+    if return_stats:
+        stats = {'n_chunks': len(chunk_bytes), 'chunk_size': chunk_size,
+                 'chunk_bytes': chunk_bytes}
+        return rst + (stats,)
+    return rst
+
+
+def batch_retrieve_proposals(video_lst, model, T=256, stride=128,
+                             c3d_size=16, c3d_stride=8, pool_type='mean',
+                             hdf5_dataset=None, model_prm=None,
+                             batch_size=1024, top_k=None, score_thr=None):
+    """Retrieve proposals for many videos packing their windows together.
+
+    Parameters
+    ----------
+    video_lst : iterable
+        Pairs (video-name, video-frames) of the videos to process.
+    model : ProposalModel
+        Model with a `forward` method, see `daps.model.ProposalModel`.
+    batch_size : int, optional
+        Number of windows evaluated by every forward pass.
+    top_k : int, optional
+        Number of proposals kept per window, see `prune_proposals`.
+    score_thr : float, optional
+        Minimum confidence of the proposals, see `prune_proposals`.
+
+    The remaining parameters are described in `retrieve_proposals`.
+
+    Outputs
+    -------
+    It yields a tuple (video-name, proposal, score) per video as soon as all
+    its windows were evaluated. Videos are yielded in the same order as
+    `video_lst`.
+
+    """
+    if model_prm is None:
+        model_prm = model.model_prm
+    # IO interface.
+    fobj = Feature(filename=hdf5_dataset, t_size=c3d_size,
+                   t_stride=c3d_stride, pool_type=pool_type)
+    fobj.open_instance()
+    scheduler = WindowScheduler(model.forward, batch_size)
+
+    def format_output(completed):
+        for video_name, f_init_array, loc, score in completed:
+            n_proposals = score.shape[1]
+            proposal, score = window_proposals(f_init_array, loc, score, T)
+            yield (video_name,) + prune_proposals(proposal, score, n_proposals,
+                                                  top_k, score_thr)
+
+    try:
+        for video_name, l_size in video_lst:
+            # Video scanning.
+            f_init_array = sliding_windows(l_size, T, stride)
+            feat_stack = None
+            if f_init_array.size > 0:
+                feat_stack = fobj.read_feat_batch_from_video(
+                    video_name, f_init_array, duration=T, dtype=np.float32)
+                feat_stack = model_input(feat_stack, model_prm)
+            completed = scheduler.add(video_name, feat_stack, f_init_array)
+            for i in format_output(completed):
+                yield i
+        for i in format_output(scheduler.flush()):
+            yield i
+    finally:
+        # Close instance.
+        fobj.close_instance()
+
+
+class StreamingProposals(object):
+    """Generate proposals over a stream of C3D features
+
+    Features are appended to a ring buffer as they arrive. A window is
+    evaluated as soon as it is complete, i.e. the stream is longer than
+    `f-init + T` rows, which yields the same windows, pooling and outputs as
+    `retrieve_proposals` for a video of the current length.
+
+    Attributes
+    ----------
+    n_rows : int
+        Number of feature rows received so far.
+    latency : list
+        Seconds elapsed between the arrival of the rows completing a window
+        and the generation of its proposals.
+
+    """
+    def __init__(self, model, T=256, stride=128, c3d_size=16, c3d_stride=8,
+                 pool_type='mean', model_prm=None, capacity=None):
+        """Setup stream
+
+        Parameters
+        ----------
+        model : ProposalModel
+            Model with a `forward` method, see `daps.model.ProposalModel`.
+        capacity : int, optional
+            Number of rows kept in memory. It must be larger than T, by
+            default T + stride.
+
+        The remaining parameters are described in
+        `retrieve_proposals`.
+
+        """
+        if capacity is None:
+            capacity = T + stride
+        if capacity <= T:
+            raise ValueError('capacity must be larger than T')
+        self.model = model
+        self.model_prm = model_prm or model.model_prm
+        self.T, self.stride = T, stride
+        self.c3d_size, self.c3d_stride = c3d_size, c3d_stride
+        self.pool_type = pool_type
+        self.capacity = capacity
+        self.n_rows = 0
+        self.latency = []
+        self._next_f_init = 0
+        self._buffer = None
+
+    def push(self, rows):
+        """Append feature rows and evaluate the windows that were completed
+
+        Parameters
+        ----------
+        rows : ndarray
+            [m x d] array with the new rows of the feature stream.
+
+        Outputs
+        -------
+        proposal : list
+            A tuple (f-init, proposal, score, latency) per evaluated window.
+            proposal is a [K x 2] array with format [f-init, f-end] and score
+            is a 1-dim array of size K.
+
+        """
+        t_start = time.time()
+        rows = np.atleast_2d(rows)
+        if self._buffer is None:
+            self._buffer = np.empty((self.capacity, rows.shape[1]),
+                                    dtype=rows.dtype)
+
+        f_init_lst, feat_lst, i = [], [], 0
+        while i < rows.shape[0]:
+            # Rows older than the next window are no longer needed
+            n_free = self._next_f_init + self.capacity - self.n_rows
+            take = min(n_free, rows.shape[0] - i)
+            idx = np.arange(self.n_rows, self.n_rows + take) % self.capacity
+            self._buffer[idx, :] = rows[i:i + take, :]
+            self.n_rows += take
+            i += take
+
+            while self.n_rows > self._next_f_init + self.T:
+                f_init = self._next_f_init
+                frames_of_interest = np.arange(
+                    f_init, f_init + self.T - self.c3d_size + 1,
+                    self.c3d_stride)
+                feat_lst.append(feature_pooling(
+                    self._buffer[frames_of_interest % self.capacity, :],
+                    self.pool_type))
+                f_init_lst.append(f_init)
+                self._next_f_init += self.stride
+        if len(f_init_lst) == 0:
+            return []
+
+        feat_stack = np.empty((len(feat_lst),) + feat_lst[0].shape,
+                              dtype=np.float32)
+        for j, v in enumerate(feat_lst):
+            feat_stack[j, ...] = v
+        if self.pool_type:
+            feat_stack = feat_stack.reshape(feat_stack.shape[0], -1)
+        feat_stack = model_input(feat_stack, self.model_prm)
+        f_init_array = np.array(f_init_lst)
+        loc, score = self.model.forward(feat_stack)
+        proposal, score = window_proposals(f_init_array, loc, score, self.T)
+
+        latency = time.time() - t_start
+        self.latency += [latency] * f_init_array.size
+        n_proposals = proposal.shape[0] / f_init_array.size
+        return [(v, proposal[j * n_proposals:(j + 1) * n_proposals, :],
+                 score[j * n_proposals:(j + 1) * n_proposals], latency)
+                for j, v in enumerate(f_init_lst)]
+
+
+def stream_proposals(feature_stream, model, T=256, stride=128, c3d_size=16,
+                     c3d_stride=8, pool_type='mean', model_prm=None,
+                     capacity=None):
+    """Generate proposals as rows of a feature stream arrive
+
+    Parameters
+    ----------
+    feature_stream : iterable
+        It yields [m x d] arrays with new C3D rows of the video.
+
+    The remaining parameters are described in `StreamingProposals`.
+
+    Outputs
+    -------
+    It yields a tuple (f-init, proposal, score, latency) per window as soon
+    as the window is complete. See `StreamingProposals.push`.
+
+    """
+    stream = StreamingProposals(model, T, stride, c3d_size, c3d_stride,
+                                pool_type, model_prm, capacity)
+    for rows in feature_stream:
+        for i in stream.push(rows):
+            yield i
+
+
+def proposals_from_features(raw_feat_stack, l_size, configs, c3d_size=16,
+                            c3d_stride=8):
+    """Retrieve proposals of several models sharing the features of a video
+
+    Windows are pooled once per distinct (T, stride, pool_type) and reused by
+    all the configurations requiring them.
+
+    Parameters
+    ----------
+    raw_feat_stack : ndarray
+        [l x d] array with all the C3D features of the video.
+    l_size : int
+        Size of the video.
+    configs : list
+        dicts with keys 'model', 'T', 'stride', 'pool_type' and, optionally,
+        'model_prm', 'top_k' and 'score_thr'. 'model' has a `forward`
+        method, see `daps.model.ProposalModel`. See `prune_proposals` for a
+        description of the optional keys.
+    c3d_size : int, optional.
+        Size of temporal fiel C3D network.
+    c3d_stride : int, optional.
+        Size of temporal stride between extracted features.
+
+    Outputs
+    -------
+    proposal_lst : list
+        (proposal, score) of each configuration, see `window_proposals`.
+
+    """
+    pooled, proposal_lst = {}, []
+    for config in configs:
+        T, stride = config['T'], config['stride']
+        key = (T, stride, config['pool_type'])
+        if key not in pooled:
+            f_init_array = sliding_windows(l_size, T, stride)
+            feat_stack = pool_windows(raw_feat_stack, f_init_array, T,
+                                      c3d_size, c3d_stride,
+                                      config['pool_type'], dtype=np.float32)
+            pooled[key] = f_init_array, feat_stack
+        f_init_array, feat_stack = pooled[key]
+        if f_init_array.size == 0:
+            proposal_lst.append((np.empty((0, 2), dtype=int), np.empty(0)))
+            continue
+
+        model = config['model']
+        model_prm = config.get('model_prm') or model.model_prm
+        loc, score = model.forward(model_input(feat_stack, model_prm))
+        n_proposals = score.shape[1]
+        proposal, score = window_proposals(f_init_array, loc, score, T)
+        proposal_lst.append(prune_proposals(
+            proposal, score, n_proposals, config.get('top_k'),
+            config.get('score_thr')))
+    return proposal_lst
+
+
+def batch_retrieve_proposals_multiscale(video_lst, scales, hdf5_dataset=None,
+                                        c3d_size=16, c3d_stride=8):
+    """Retrieve proposals at several scales reading each video once
+
+    Parameters
+    ----------
+    video_lst : iterable
+        Pairs (video-name, video-frames) of the videos to process.
+    scales : list
+        dicts describing each scale, see `proposals_from_features`.
+    hdf5_dataset : str.
+        Path to feature file.
+    c3d_size : int, optional.
+        Size of temporal fiel C3D network.
+    c3d_stride : int, optional.
+        Size of temporal stride between extracted features.
+
+    Outputs
+    -------
+    It yields a tuple (video-name, proposal, score, scale-idx) per video.
+    Proposals of all the scales are merged, scale-idx is a 1-dim array with
+    the index of the scale that generated each proposal.
+
+    """
+    # IO interface. Pooling is done in memory for each scale.
+    fobj = Feature(filename=hdf5_dataset, t_size=c3d_size,
+                   t_stride=c3d_stride, pool_type=None)
+    fobj.open_instance()
+    try:
+        for video_name, l_size in video_lst:
+            raw_feat_stack = fobj.read_video(video_name)
+            proposal_lst = proposals_from_features(
+                raw_feat_stack, l_size, scales, c3d_size, c3d_stride)
+            scale_idx = np.repeat(np.arange(len(scales)),
+                                  [i[1].size for i in proposal_lst])
+            yield (video_name, np.vstack([i[0] for i in proposal_lst]),
+                   np.hstack([i[1] for i in proposal_lst]), scale_idx)
+    finally:
+        # Close instance.
+        fobj.close_instance()
+
+
+def fuse_proposals(proposal, score, model_idx, weights=None, iou_thr=0.8):
+    """Fuse proposals of several models by a weighted average of their scores
+
+    Proposals are matched greedily in decreasing order of score. Each
+    unmatched proposal takes, from every other model, the unmatched proposal
+    with highest IOU with it, if it is at least iou_thr. The fused score of
+    the group is the weighted average, over all the models, of the score of
+    its proposal (zero if the model does not have one). The group keeps the
+    boundaries of its highest scoring proposal.
+
+    Parameters
+    ----------
+    proposal : ndarray
+        [n x 2] array with proposals of all the models.
+    score : ndarray
+        1-dim array of size n with confidence of each proposal.
+    model_idx : ndarray
+        1-dim array of size n with the index of the model that generated each
+        proposal, see `batch_retrieve_proposals_multiscale`.
+    weights : list, optional
+        Weight of each model. By default, all the models weight the same.
+    iou_thr : float, optional
+        Minimum IOU, in (0, 1], of matched proposals.
+
+    Outputs
+    -------
+    proposal : ndarray
+        [m x 2] array with fused proposals sorted by initial frame.
+    score : ndarray
+        1-dim array of size m with fused scores.
+
+    """
+    if iou_thr <= 0 or iou_thr > 1:
+        raise ValueError('iou_thr must be in (0, 1]')
+    if weights is None:
+        weights = np.ones(model_idx.max() + 1 if model_idx.size else 1)
+    weights = np.asarray(weights, dtype=float)
+    n = proposal.shape[0]
+    if n == 0:
+        return proposal, score
+
+    # Proposals with IOU >= iou_thr with i begin at most slack[i] frames away
+    t1, t2 = proposal[:, 0].astype(float), proposal[:, 1].astype(float)
+    area = t2 - t1 + 1.0
+    slack = area * (1.0 - iou_thr) / iou_thr
+    order_init = np.argsort(t1, kind='mergesort')
+    init_sorted = t1[order_init]
+    lo = np.searchsorted(init_sorted, t1 - slack, 'left')
+    hi = np.searchsorted(init_sorted, t1 + slack, 'right')
+
+    group = -np.ones(n, dtype=int)
+    anchors = []
+    for i in np.argsort(-score, kind='mergesort'):
+        if group[i] >= 0:
+            continue
+        group[i] = len(anchors)
+        anchors.append(i)
+        ind = order_init[lo[i]:hi[i]]
+        ind = ind[(group[ind] < 0) & (model_idx[ind] != model_idx[i])]
+        tt1 = np.maximum(t1[i], t1[ind])
+        tt2 = np.minimum(t2[i], t2[ind])
+        inter = (tt2 - tt1 + 1.0).clip(0)
+        iou = inter / (area[i] + area[ind] - inter)
+        ind, iou = ind[iou >= iou_thr], iou[iou >= iou_thr]
+        # Best match of every other model
+        idx = np.lexsort([-iou, model_idx[ind]])
+        m = model_idx[ind[idx]]
+        first = idx[np.hstack([True, m[1:] != m[:-1]])] if idx.size else idx
+        group[ind[first]] = group[i]
+
+    anchors = np.array(anchors)
+    model_score = np.zeros((anchors.size, weights.size))
+    model_score[group, model_idx] = score
+    fused = np.dot(model_score, weights) / weights.sum()
+    idx = np.lexsort([t2[anchors], t1[anchors]])
+    return proposal[anchors[idx], :], fused[idx]
@@ -1,4 +1,5 @@
 import argparse
+import hashlib
 import json
 import logging
 import os
@@ -11,8 +12,9 @@ import theano
 import theano.tensor as T
 from sklearn.metrics import average_precision_score, roc_auc_score
 
+from daps.inference import model_input, multiply_adds, parse_model_prm
 from daps.model import weigthed_binary_crossentropy
-from daps.model import build_model, read_model
+from daps.model import build_model, ProposalModel, read_model
 from daps.utils.extra import balance_labels
 
 
@@ -40,7 +42,10 @@ def load_dataset(prefix, suffix):
 # mini-batches of a particular size, optionally in random order. It assumes
 # data is available as numpy arrays.
 
-def iterate_minibatches(inputs, targets, batchsize, shuffle=False):
+def iterate_minibatches(inputs, targets, batchsize, shuffle=False,
+                        teacher=None):
+    # teacher is an optional tuple of arrays aligned with inputs. Their
+    # mini-batches are appended to the yielded ones.
     assert len(inputs) == len(targets)
     if shuffle:
         indices = np.arange(len(inputs))
@@ -50,14 +55,19 @@ def iterate_minibatches(inputs, targets, batchsize, shuffle=False):
             excerpt = indices[start_idx:start_idx + batchsize]
         else:
             excerpt = slice(start_idx, start_idx + batchsize)
-        yield inputs[excerpt], targets[excerpt]
+        if teacher is None:
+            yield inputs[excerpt], targets[excerpt]
+        else:
+            yield ((inputs[excerpt], targets[excerpt]) +
+                   tuple(i[excerpt] for i in teacher))
 
 
 # #############################################################################
 
 def dump_hyperprm(prmfile, exp_id, model, num_epochs, alpha, beta, w_pos,
                   batch_size, l_rate, forget_bias, grad_clip, rng_seed,
-                  init_model, output_dir, opt_rule, reg, val_ap, rec_50):
+                  init_model, output_dir, opt_rule, reg, val_ap, rec_50,
+                  teacher=None, distill_weight=None):
     logging.info("Serializing hyper-parameters ...")
     with open(prmfile, 'w') as f:
         json.dump({'exp_id': exp_id, 'model': model, 'num_epochs': num_epochs,
@@ -66,7 +76,8 @@ def dump_hyperprm(prmfile, exp_id, model, num_epochs, alpha, beta, w_pos,
                    'rng_seed': rng_seed, 'init_model': init_model,
                    'opt_method': opt_rule, 'grad_clip': grad_clip,
                    'forget_bias': forget_bias, 'output_dir': output_dir,
-                   'val_ap': float(val_ap), 'rec_50': float(rec_50)},
+                   'val_ap': float(val_ap), 'rec_50': float(rec_50),
+                   'teacher': teacher, 'distill_weight': distill_weight},
                   f, indent=4, separators=(',', ': '))
     logging.info("Hpyer-parameters saved on " + prmfile)
 
@@ -77,6 +88,102 @@ def dump_model(filename, network):
     logging.info("Model saved on " + filename)
 
 
+def teacher_digest(teacher):
+    """Hash identifying the outputs of a trained model
+
+    Parameters
+    ----------
+    teacher : (str, str)
+        Pair of npz-file with weights and json-file with hyper-parameters of
+        the model.
+
+    Outputs
+    -------
+    digest : str
+        md5 of the model specification and the content of the weights file.
+
+    """
+    with open(teacher[1], 'r') as fobj:
+        model_prm = json.load(fobj)['model']
+    md5 = hashlib.md5(model_prm.encode('utf-8'))
+    with open(teacher[0], 'rb') as fobj:
+        for chunk in iter(lambda: fobj.read(2**20), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def teacher_input(X, model_prm):
+    """Arrange inputs of the student as expected by the teacher
+
+    Parameters
+    ----------
+    X : ndarray
+        [n x d] or [n x seq-length x d] inputs of the student network.
+    model_prm : str
+        Model specification of the teacher.
+
+    """
+    X = X.reshape((X.shape[0], -1))
+    prm = parse_model_prm(model_prm)
+    if prm['type'] == 'lstm' and X.shape[1] % prm['seq_length']:
+        msg = 'Input of size {} does not fit a sequence of length {}'
+        raise ValueError(msg.format(X.shape[1], prm['seq_length']))
+    return model_input(X, model_prm)
+
+
+def teacher_outputs(teacher, X, cachefile=None, batch_size=500):
+    """Outputs of a trained model over a dataset
+
+    Parameters
+    ----------
+    teacher : (str, str)
+        Pair of npz-file with weights and json-file with hyper-parameters of
+        the model.
+    X : ndarray
+        Inputs of the network. They are rearranged for the architecture of
+        the teacher, see `teacher_input`.
+    cachefile : str, optional
+        npz-file to reuse outputs computed previously. It is created if it
+        does not exist.
+    batch_size : int, optional
+        Number of samples per forward pass.
+
+    Outputs
+    -------
+    loc : ndarray
+        [n x 2K] localization outputs.
+    conf : ndarray
+        [n x K] confidence outputs.
+    model_prm : str
+        Model specification of the teacher.
+
+    """
+    model_file, prmfile = teacher
+    with open(prmfile, 'r') as fobj:
+        model_prm = json.load(fobj)['model']
+    if cachefile is not None and os.path.exists(cachefile):
+        with np.load(cachefile) as cache:
+            if (cache['conf'].shape[0] == X.shape[0] and
+                    str(cache['model_prm']) == model_prm):
+                logging.info("Teacher outputs loaded from " + cachefile)
+                return cache['loc'], cache['conf'], model_prm
+        logging.info("Ignoring teacher outputs of different dataset or model")
+
+    X = teacher_input(X, model_prm)
+    model = ProposalModel(model_prm, model_file, input_size=X.shape[-1])
+    loc, conf = [], []
+    for start_idx in range(0, X.shape[0], batch_size):
+        l_pred, y_pred = model.forward(X[start_idx:start_idx + batch_size])
+        loc.append(l_pred.reshape((y_pred.shape[0], -1)))
+        conf.append(y_pred)
+    loc = np.vstack(loc).astype(np.float32)
+    conf = np.vstack(conf).astype(np.float32)
+    if cachefile is not None:
+        np.savez(cachefile, loc=loc, conf=conf, model_prm=model_prm)
+        logging.info("Teacher outputs saved on " + cachefile)
+    return loc, conf, model_prm
+
+
 def forward_pass(fn, X, y, batch_size, shuffle=False):
     # Helper function to perform forward_pass over a dataset
     err, n_batches, pred = 0, 0, []
@@ -90,9 +197,10 @@ def forward_pass(fn, X, y, batch_size, shuffle=False):
 
 
 def optimization(network, input_var, priors, alpha, beta, w1, w0,
-                 reg='l2', opt_method=None, opt_prm=None):
+                 reg='l2', opt_method=None, opt_prm=None, distill_weight=None):
     # Define optimization problem and functions to perform training and
-    # validation
+    # validation. If distill_weight is given, train_fn also takes the outputs
+    # of a teacher network as soft targets.
     if opt_prm is None:
         opt_prm = {}
     if reg == 'l1':
@@ -125,7 +233,23 @@ def optimization(network, input_var, priors, alpha, beta, w1, w0,
     # Regularization term
     loss_reg = lasagne.regularization.regularize_network_params(network,
                                                                 penalty)
-    loss = alpha * loss_match.mean() + loss_conf.mean() + beta * loss_reg
+    loss = alpha * loss_match.mean() + loss_conf.mean()
+
+    # Distillation: match localization and confidence of teacher weighting
+    # anchors by its confidence
+    train_inputs = [input_var, target_conf_var]
+    if distill_weight is not None:
+        teacher_loc_var = T.fmatrix('teacher_loc')
+        teacher_conf_var = T.fmatrix('teacher_conf')
+        # loc is interleaved as [c0, d0, c1, d1, ...]
+        soft_match = ((loc - teacher_loc_var)**2 *
+                      T.repeat(teacher_conf_var, 2, axis=1))
+        soft_conf = weigthed_binary_crossentropy(conf, teacher_conf_var,
+                                                 w0_train_var, w1_train_var)
+        soft_loss = alpha * soft_match.mean() + soft_conf.mean()
+        loss = (1 - distill_weight) * loss + distill_weight * soft_loss
+        train_inputs += [teacher_loc_var, teacher_conf_var]
+    loss += beta * loss_reg
 
     # Optimization
     params = lasagne.layers.get_all_params(network, trainable=True)
@@ -143,8 +267,7 @@ def optimization(network, input_var, priors, alpha, beta, w1, w0,
 
     # Compile a function performing a training step on a mini-batch (by giving
     # the updates dictionary) and returning the corresponding training loss:
-    train_fn = theano.function([input_var, target_conf_var],
-                               loss, updates=updates,
+    train_fn = theano.function(train_inputs, loss, updates=updates,
                                allow_input_downcast=True)
 
     # Compile a second function computing the validation loss and accuracy:
@@ -198,7 +321,8 @@ def main(exp_id='0', model='', num_epochs=500, alpha=0.3, beta=0, w_pos=1.0,
          batch_size=500, l_rate=0.01, forget_bias=1.0, grad_clip=100, reg='l2',
          rng_seed=None, init_model=None, shuffle=False, output_dir='',
          ds_prefix=None, ds_suffix=None, snapshot_freq=125, opt_rule=None,
-         opt_prm=None, debug=False, **kwargs):
+         opt_prm=None, debug=False, teacher=None, distill_weight=0.5,
+         **kwargs):
     if opt_prm is None:
         opt_prm = {}
     if rng_seed:
@@ -221,6 +345,26 @@ def main(exp_id='0', model='', num_epochs=500, alpha=0.3, beta=0, w_pos=1.0,
     w0 = (wc_train[1], wc_val[1])
     logging.info("Data loaded successfully")
 
+    # Soft targets from teacher network
+    soft_targets = None
+    if teacher:
+        digest = teacher_digest(teacher)[:8]
+        cachefile = os.path.join(ds_prefix, 'train_teacher_{}_{}.npz'.format(
+            ds_suffix, digest))
+        teacher_loc, teacher_conf, teacher_prm = teacher_outputs(
+            teacher, X_train, cachefile, batch_size)
+        if teacher_conf.shape[1] != y_train.shape[1]:
+            msg = 'Teacher has {} outputs, expected {}'
+            raise ValueError(msg.format(teacher_conf.shape[1],
+                                        y_train.shape[1]))
+        soft_targets = (teacher_loc, teacher_conf)
+        msg = "Multiply-adds per window: teacher {}, student {}"
+        teacher_dim = teacher_input(X_train[:1], teacher_prm).shape[-1]
+        logging.info(msg.format(multiply_adds(teacher_prm, teacher_dim),
+                                multiply_adds(model, feat_dim)))
+    else:
+        distill_weight = None
+
     # Prepare Theano variables for inputs and targets
     if X_train.ndim == 2:
         input_var = T.matrix('inputs')
@@ -236,7 +380,8 @@ def main(exp_id='0', model='', num_epochs=500, alpha=0.3, beta=0, w_pos=1.0,
     network = build_model(model, input_var, input_size=feat_dim,
                           grad_clip=grad_clip, forget_bias=forget_bias)
     train_fn, val_fn = optimization(network, input_var, priors, alpha,
-                                    beta, w1, w0, reg, opt_method, opt_prm)
+                                    beta, w1, w0, reg, opt_method, opt_prm,
+                                    distill_weight)
 
     # Initialize model from previous file
     if init_model and len(init_model) == 2:
@@ -257,7 +402,8 @@ def main(exp_id='0', model='', num_epochs=500, alpha=0.3, beta=0, w_pos=1.0,
     prmfile = os.path.join(output_dir, 'hyper_prm.json')
     dump_hyperprm(prmfile, exp_id, model, num_epochs, alpha, beta, w_pos,
                   batch_size, l_rate, forget_bias, grad_clip, rng_seed,
-                  init_model, output_dir, opt_rule, reg, 0, 0)
+                  init_model, output_dir, opt_rule, reg, 0, 0, teacher,
+                  distill_weight)
 
     # Finally, launch the training loop.
     logging.info("Starting training...")
@@ -267,10 +413,9 @@ def main(exp_id='0', model='', num_epochs=500, alpha=0.3, beta=0, w_pos=1.0,
         start_time = time.time()
         train_err, train_batches = 0, 0
         for batch in iterate_minibatches(X_train, y_train, batch_size,
-                                         shuffle):
-            inputs, targets = batch
+                                         shuffle, soft_targets):
             # priors can be a T.constants vector
-            train_err += train_fn(inputs, targets)
+            train_err += train_fn(*batch)
             train_batches += 1
 
         # and a full pass over the validation data
@@ -301,7 +446,8 @@ def main(exp_id='0', model='', num_epochs=500, alpha=0.3, beta=0, w_pos=1.0,
     prmfile = os.path.join(output_dir, 'hyper_prm.json')
     dump_hyperprm(prmfile, exp_id, model, num_epochs, alpha, beta, w_pos,
                   batch_size, l_rate, forget_bias, grad_clip, rng_seed,
-                  init_model, output_dir, opt_rule, reg, val_ap, rec50)
+                  init_model, output_dir, opt_rule, reg, val_ap, rec50,
+                  teacher, distill_weight)
 
 
 def input_parser():
@@ -364,6 +510,16 @@ def input_parser():
     p.add_argument('-od', '--output_dir', help=h_outputdir, default='')
     h_debug = 'Report extra metrics on training set after every epoch'
     p.add_argument('-dg', '--debug', action='store_true', help=h_debug)
+    h_teacher = ('Pair of model-path, hyper-parameters json of a trained '
+                 'model used as teacher for distillation. Inputs are '
+                 'reshaped for its architecture, e.g. an lstm teacher of a '
+                 'mlp student, thus the sequence length of an lstm teacher '
+                 'must divide the size of the pooled features.')
+    p.add_argument('-t', '--teacher', nargs=2, default=None, help=h_teacher)
+    h_distillw = ('Weight of teacher soft targets on loss function. The '
+                  'ground-truth loss is weighted by one minus this value')
+    p.add_argument('-dw', '--distill_weight', default=0.5, type=float,
+                   help=h_distillw)
     return p
 
 
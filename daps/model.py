@@ -1,9 +1,11 @@
+import functools
+
 import lasagne
 import numpy as np
+import theano
 import theano.tensor as T
 
-from daps.c3d_encoder import Feature
-from daps.utils.segment import format as segment_format
+from daps.inference import retrieve_proposals as inference_retrieve_proposals
 
 EPSILON = 10e-8
 
@@ -74,9 +76,80 @@ def build_model(model_prm=None, input_var=None, input_size=4096,
     return localization, conf
 
 
+class ProposalModel(object):
+    """Localization model with a compiled inference function
+
+    The deterministic graph of the network is compiled once, when the object
+    is instantiated, and reused for every call of `forward`.
+
+    Attributes
+    ----------
+    model_prm : str
+        Model specification, see `build_model`.
+    network : (localization, conf)
+        Lasagne layers.
+
+    """
+    def __init__(self, model_prm, filename=None, input_size=4096,
+                 grad_clip=100, forget_bias=1.0, params=None):
+        """Build network, load its parameters and compile inference function
+
+        Parameters
+        ----------
+        model_prm : str
+            Model specification, see `build_model`.
+        filename : str, optional
+            Fullpath of npz-file with weights of the network.
+        input_size : int, optional
+            Size of the input to the network.
+        params : list, optional
+            ndarrays with parameters of the network. Ignored if filename is
+            given.
+
+        """
+        self.model_prm = model_prm
+        if model_prm.startswith('lstm:'):
+            input_var = T.tensor3('inputs')
+        else:
+            input_var = T.matrix('inputs')
+        self.network = build_model(model_prm, input_var,
+                                   input_size=input_size, grad_clip=grad_clip,
+                                   forget_bias=forget_bias)
+        if filename is not None:
+            read_model(filename, self.network)
+        elif params is not None:
+            lasagne.layers.set_all_param_values(self.network, params)
+
+        l_pred_var, y_pred_var = lasagne.layers.get_output(self.network,
+                                                           deterministic=True)
+        self._fn = theano.function([input_var], [l_pred_var, y_pred_var],
+                                   allow_input_downcast=True)
+
+    def forward(self, input_data):
+        """Forward pass input_data over network
+
+        Parameters
+        ----------
+        input_data : ndarray
+            Batch of pooled features of any size along the first axis.
+
+        Outputs
+        -------
+        loc : ndarray
+            [n * K x 2] array with localization outputs.
+        score : ndarray
+            [n x K] array with confidence outputs.
+
+        """
+        l_pred, y_pred = self._fn(input_data)
+        return l_pred.reshape((-1, 2)), y_pred
+
+
 def forward_pass(network, input_data):
     """Forward pass input_data over network
     """
+    if hasattr(network, 'forward'):
+        return network.forward(input_data)
     l_pred_var, y_pred_var = lasagne.layers.get_output(network, input_data,
                                                        deterministic=True)
     loc = l_pred_var.eval().reshape((-1, 2))
@@ -100,62 +173,17 @@ def read_model(filename, network):
     return None
 
 
-def retrieve_proposals(video_name, l_size, network, T=256, stride=128,
-                       c3d_size=16, c3d_stride=8, pool_type='mean',
-                       hdf5_dataset=None, model_prm=None):
+def retrieve_proposals(video_name, l_size, network, *args, **kwargs):
     """Retrieve proposals for an input video.
 
-    Parameters
-    ----------
-    video_name : str.
-        Video identifier.
-    l_size : int.
-        Size of the video.
-    network : (localization, conf).
-        Lasagne layers.
-    T : int, optional.
-        Canonical temporal size of evaluation window.
-    stride : int, optional.
-        Size of the sliding step.
-    c3d_size : int, optional.
-        Size of temporal fiel C3D network.
-    c3d_stride : int, optional.
-        Size of temporal stride between extracted features.
-    pool_type : str, optional.
-        Global pooling strategy over a bunch of features.
-        'mean', 'max', 'pyr-2-mean/max', 'concat-2-mean/max'
-    hdf5_dataset : str.
-        Path to feature file.
+    Same as `daps.inference.retrieve_proposals` but network may also be a
+    pair of lasagne layers (localization, conf).
 
     """
-    # IO interface.
-    fobj = Feature(filename=hdf5_dataset, t_size=c3d_size,
-                   t_stride=c3d_stride, pool_type=pool_type)
-    fobj.open_instance()
-    # Video scanning.
-    f_init_array = np.arange(0, l_size - T, stride)
-    feat_stack = fobj.read_feat_batch_from_video(video_name, f_init_array,
-                                                 duration=T).astype(np.float32)
-    if model_prm.startswith('lstm:'):
-        user_prm = model_prm.split(':', 1)[1].split(',')
-        n_outputs, seq_length, width, depth = user_prm
-        feat_stack = feat_stack.reshape(feat_stack.shape[0],
-                                        int(seq_length),
-                                        feat_stack.shape[1]/int(seq_length))
-
-    # Close instance.
-    fobj.close_instance()
-
-    # Generate proposals.
-    loc, score = forward_pass(network, feat_stack)
-    n_proposals = score.shape[1]
-    n_segments = score.shape[0]
-    score = score.flatten()
-    map_array = np.stack((f_init_array,
-                          np.zeros(n_segments))).repeat(n_proposals, axis=-1).T
-    proposal = segment_format(map_array + (loc.clip(0, 1) * T),
-                              'c2b').astype(int)
-    return proposal, score
+    if not hasattr(network, 'forward'):
+        network = functools.partial(forward_pass, network)
+    return inference_retrieve_proposals(video_name, l_size, network, *args,
+                                        **kwargs)
 
 
 def weigthed_binary_crossentropy(predictions, targets, w0, w1):
@@ -0,0 +1,164 @@
+"""
+Structured pruning of the hidden units of trained DAPs models.
+
+Units are ranked per hidden layer and the same number of them is kept in every
+layer, thus the pruned parameters fit the networks of `daps.model.build_model`
+with a smaller width.
+
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+from daps.bundle import param_names
+from daps.inference import LSTM_GATES, parse_model_prm
+
+
+def _named_params(model_prm, params):
+    names = param_names(model_prm)
+    if len(names) != len(params):
+        msg = 'Expected {} parameters, got {}'
+        raise ValueError(msg.format(len(names), len(params)))
+    return OrderedDict(zip(names, params))
+
+
+def _layer_weights(model_prm, params, i):
+    """Incoming and outgoing weights of the units of a hidden layer
+
+    Outputs
+    -------
+    w_in : ndarray
+        [n_in x width] incoming weights, gates are stacked for LSTM.
+    w_out : ndarray
+        [width x n_out] outgoing weights, including recurrent ones for LSTM.
+
+    """
+    prm, named = parse_model_prm(model_prm), _named_params(model_prm, params)
+    if i + 1 < prm['depth']:
+        prefix = '{}{}.'.format('hidden' if prm['type'] == 'mlp' else 'lstm',
+                                i + 1)
+        if prm['type'] == 'mlp':
+            next_w = [named[prefix + 'W']]
+        else:
+            next_w = [named[prefix + 'W_in_to_' + j] for j in LSTM_GATES]
+    else:
+        next_w = [named['loc.W'], named['conf.W']]
+    if prm['type'] == 'mlp':
+        w_in = named['hidden{}.W'.format(i)]
+    else:
+        prefix = 'lstm{}.'.format(i)
+        w_in = np.vstack([named[prefix + 'W_in_to_' + j] for j in LSTM_GATES])
+        next_w += [named[prefix + 'W_hid_to_' + j] for j in LSTM_GATES]
+    return w_in, np.hstack(next_w)
+
+
+def unit_importance(model, method='norm', input_data=None):
+    """Score every hidden unit of a model
+
+    Parameters
+    ----------
+    model : daps.inference.NumpyProposalModel
+        Trained model.
+    method : str, optional
+        'norm': product of the L2-norm of incoming and outgoing weights.
+        'activation': mean absolute activation over input_data times the
+        L2-norm of outgoing weights.
+    input_data : ndarray, optional
+        Batch of pooled features, see `daps.inference.model_input`. Required
+        by 'activation'.
+
+    Outputs
+    -------
+    importance : list
+        1-dim arrays with the score of the units of each hidden layer.
+
+    """
+    if method == 'activation':
+        if input_data is None:
+            raise ValueError('input_data is required by activation method')
+        activations = model.hidden_activations(input_data)
+    elif method != 'norm':
+        raise ValueError('Unknown method {}'.format(method))
+
+    importance = []
+    for i in range(model.prm['depth']):
+        w_in, w_out = _layer_weights(model.model_prm, model.params, i)
+        out_norm = np.sqrt((w_out ** 2).sum(axis=1))
+        if method == 'norm':
+            in_norm = np.sqrt((w_in ** 2).sum(axis=0))
+            importance.append(in_norm * out_norm)
+        else:
+            x = np.abs(activations[i])
+            x = x.reshape((-1, x.shape[-1]))
+            importance.append(x.mean(axis=0) * out_norm)
+    return importance
+
+
+def select_units(importance, width):
+    """Index of the `width` most important units of each layer
+    """
+    if width > min([i.size for i in importance] or [width]):
+        raise ValueError('width is larger than the number of units')
+    return [np.sort(np.argsort(-i, kind='mergesort')[:width])
+            for i in importance]
+
+
+def prune_units(model_prm, params, keep):
+    """Remove hidden units of a model
+
+    Parameters
+    ----------
+    model_prm : str
+        Model specification, see `daps.model.build_model`.
+    params : list
+        ndarrays in the order of `lasagne.layers.get_all_param_values`.
+    keep : list
+        1-dim arrays with the index of the units kept on each hidden layer.
+        All of them must have the same size.
+
+    Outputs
+    -------
+    model_prm : str
+        Model specification with the new width.
+    params : list
+        ndarrays of the pruned model in the same order of the input.
+
+    """
+    prm = parse_model_prm(model_prm)
+    if len(keep) != prm['depth']:
+        raise ValueError('keep must have one array per hidden layer')
+    if len(set([len(i) for i in keep])) > 1:
+        raise ValueError('Same number of units must be kept in all layers')
+    named = _named_params(model_prm, [np.asarray(i) for i in params])
+
+    for i, k in enumerate(keep):
+        if prm['type'] == 'mlp':
+            prefix = 'hidden{}.'.format(i)
+            named[prefix + 'W'] = named[prefix + 'W'][:, k]
+            named[prefix + 'b'] = named[prefix + 'b'][k]
+            next_w = ['hidden{}.W'.format(i + 1)]
+        else:
+            prefix = 'lstm{}.'.format(i)
+            for gate in LSTM_GATES:
+                named[prefix + 'W_in_to_' + gate] = (
+                    named[prefix + 'W_in_to_' + gate][:, k])
+                named[prefix + 'W_hid_to_' + gate] = (
+                    named[prefix + 'W_hid_to_' + gate][k, :][:, k])
+                named[prefix + 'b_' + gate] = named[prefix + 'b_' + gate][k]
+            for j in ['W_cell_to_ingate', 'W_cell_to_forgetgate',
+                      'W_cell_to_outgate']:
+                named[prefix + j] = named[prefix + j][k]
+            for j in ['cell_init', 'hid_init']:
+                named[prefix + j] = named[prefix + j][:, k]
+            next_w = ['lstm{}.W_in_to_{}'.format(i + 1, j)
+                      for j in LSTM_GATES]
+        if i + 1 == prm['depth']:
+            next_w = ['loc.W', 'conf.W']
+        for j in next_w:
+            named[j] = named[j][k, :]
+
+    user_prm = model_prm.split(':', 1)[1].split(',')
+    if keep:
+        user_prm[2] = str(len(keep[0]))
+    model_prm = '{}:{}'.format(prm['type'], ','.join(user_prm))
+    return model_prm, [np.ascontiguousarray(i) for i in named.values()]
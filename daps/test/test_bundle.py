@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import lasagne
+import numpy as np
+
+import daps.bundle as bundle
+from daps.model import ProposalModel
+
+
+class test_bundle(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.filename = os.path.join(self.root, 'model.daps')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_param_names(self):
+        for model_prm in ['mlp:4,2,8,0,0', 'lstm:4,3,8,2']:
+            model = ProposalModel(model_prm, input_size=10)
+            params = lasagne.layers.get_all_params(model.network)
+            names = bundle.param_names(model_prm)
+            self.assertEqual(len(params), len(names))
+            for param, name in zip(params, names):
+                if param.name in ['W', 'b']:
+                    continue
+                self.assertEqual(param.name, name.split('.')[1])
+
+    def test_dump_load(self):
+        model_prm = 'mlp:4,2,8,0,0'
+        model = ProposalModel(model_prm, input_size=20)
+        params = lasagne.layers.get_all_param_values(model.network)
+        priors = np.random.rand(4, 2)
+        bundle.dump_bundle(self.filename, model_prm, params, priors,
+                           input_size=20, T=64, stride=16, c3d_size=4,
+                           c3d_stride=2, pool_type='concat-2-mean',
+                           feat_dim=10)
+        self.assertTrue(bundle.is_bundle(self.filename))
+        self.assertEqual(0, os.path.getsize(self.filename) % 64)
+        self.assertFalse(bundle.is_bundle(__file__))
+
+        config, arrays = bundle.read_bundle(self.filename)
+        self.assertIsInstance(arrays['loc.W'], np.memmap)
+        self.assertEqual(64, config['T'])
+        for backend in ['numpy', 'theano']:
+            net, config = bundle.load_bundle(self.filename, backend)
+            np.testing.assert_array_almost_equal(priors, config['priors'])
+            x = np.random.rand(5, 20).astype(np.float32)
+            for i, j in zip(model.forward(x), net.forward(x)):
+                np.testing.assert_array_almost_equal(i, j, 5)
+
+        # Mismatched configurations
+        self.assertRaises(ValueError, bundle.dump_bundle, self.filename,
+                          model_prm, params, np.random.rand(3, 2),
+                          input_size=20)
+        self.assertRaises(ValueError, bundle.dump_bundle, self.filename,
+                          model_prm, params, input_size=20, feat_dim=10,
+                          pool_type='mean')
+        self.assertRaises(ValueError, bundle.dump_bundle, self.filename,
+                          model_prm, params, input_size=30)
+        self.assertRaises(ValueError, bundle.dump_bundle, self.filename,
+                          'mlp:4,1,8,0,0', params, input_size=20)
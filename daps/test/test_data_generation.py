@@ -1,42 +1,171 @@
 import unittest
 
+import numpy as np
+import pandas as pd
+
 import daps.data_generation as data_generation
+import daps.utils.segment as segment
 
 
 class TestUtils(unittest.TestCase):
-    @unittest.skip("A contribution is required")
     def test_compute_priors(self):
-        pass
+        rng = np.random.RandomState(0)
+        f_init = rng.randint(0, 2000, 12)
+        df = pd.DataFrame({'video-name': list('abcab') * 2 + ['d', 'e'],
+                           'video-frames': [3000, 2500, 4000, 3000, 2500] * 2 +
+                           [100, 5000],
+                           'f-init': f_init,
+                           'n-frames': rng.randint(20, 300, 12)})
+        priors, new_df = data_generation.compute_priors(df, 256, K=4,
+                                                        rng_seed=1)
+        self.assertEqual((4, 2), priors.shape)
+        self.assertEqual(['a', 'b', 'c', 'e'],
+                         new_df['video-name'].unique().tolist())
+        self.assertEqual(4 + 4, new_df.shape[1])
+        # Results do not depend on number of processes
+        for i in [1, 2]:
+            rst = data_generation.compute_priors(df, 256, K=4, rng_seed=1,
+                                                 n_jobs=i)
+            np.testing.assert_array_equal(priors, rst[0])
+            self.assertTrue(new_df.equals(rst[1]))
+
+    def test_segment_priors_score(self):
+        rng = np.random.RandomState(0)
+        priors_b = np.array([[1, 128], [65, 256], [1, 256], [200, 230]])
+        n_gt = rng.randint(0, 4, 30)
+        f_init = rng.randint(0, 200, n_gt.sum())
+        mapped_gt = np.stack([f_init, f_init + rng.randint(5, 100,
+                                                            f_init.size)],
+                             axis=-1).astype(float)
+        expected = np.zeros((30, 4), dtype=int)
+        start = 0
+        for i, n in enumerate(n_gt):
+            if n > 0:
+                iou = segment.iou(priors_b, mapped_gt[start:start + n, :])
+                expected[i, :] = iou.max(axis=1) > 0.5
+            start += n
+        # Chunks of segments do not change the result
+        for budget in [None, 1, 4 * 8 * 5]:
+            rst = data_generation.segment_priors_score(
+                priors_b, mapped_gt, n_gt, 0.5, memory_budget=budget)
+            np.testing.assert_array_equal(expected, rst)
+        rst = data_generation.segment_priors_score(
+            priors_b, mapped_gt[:0, :], np.zeros(3, dtype=int))
+        np.testing.assert_array_equal(np.zeros((3, 4)), rst)
 
     def test_constants(self):
         self.assertIsInstance(data_generation.RATIO_INTERVALS, list)
         self.assertIsInstance(data_generation.REQ_INFO_CP, list)
+        self.assertIsInstance(data_generation.CLUSTERING, list)
+
+    def test_temp_priors_no_scale(self):
+        rng = np.random.RandomState(0)
+        centers = np.array([[0.2, 0.1], [0.5, 0.8], [0.8, 0.3]])
+        X = (centers[rng.randint(0, 3, 3000), :] +
+             0.01 * rng.randn(3000, 2))
+        for clustering in data_generation.CLUSTERING:
+            model = data_generation.TempPriorsNoScale(
+                3, rng_seed=0, clustering=clustering, batch_size=500)
+            self.assertRaises(ValueError, model.inertia, X)
+            model.fit(X)
+            self.assertGreaterEqual(model.fit_time, 0)
+            priors = model.priors[np.argsort(model.priors[:, 0]), :]
+            np.testing.assert_allclose(centers, priors, atol=0.01)
+            # Inertia over standardized features
+            self.assertLess(model.inertia(X), 3000 * 0.01)
+        self.assertRaises(ValueError, data_generation.TempPriorsNoScale,
+                          clustering='dbscan')
 
-    @unittest.skip("A contribution is required")
     def test_generate_segments(self):
-        """
-        rst = ...
+        annotations = np.array([[100, 400], [350, 900], [1200, 1300],
+                                [1250, 1260]])
+        cases = [(annotations, None, 0.5), (annotations, 'iou', 1.0),
+                 (annotations, None, 0),
+                 # Fractional boundaries
+                 (annotations + 0.43, None, 0.5),
+                 (annotations * 1.37, 'iou', 1.0)]
+        for annots, method, i_thr in cases:
+            rst = data_generation.generate_segments(
+                256, 3000, annots, i_thr=i_thr, rng_seed=3,
+                method=method)
+            self.assertEqual(3, len(rst))
+            self.assertIsInstance(rst[1], list)
+            for i in [0, 2]:
+                self.assertIsInstance(rst[i], np.ndarray)
+            self.assertEqual(1, rst[2].ndim)
+            self.assertEqual(rst[0].shape[0], len(rst[1]))
+            self.assertEqual(rst[0].shape[0], rst[2].size)
+
+            # Same result with every engine
+            for engine in ['index', 'dense']:
+                expected = data_generation.generate_segments(
+                    256, 3000, annots, i_thr=i_thr, rng_seed=3,
+                    method=method, engine=engine)
+                np.testing.assert_array_equal(expected[0], rst[0])
+                np.testing.assert_array_equal(expected[2], rst[2])
+                for i, j in zip(expected[1], rst[1]):
+                    np.testing.assert_array_equal(i, j)
+
+        rst = data_generation.generate_segments(256, 3000, annotations,
+                                                return_annot=False)
         self.assertIsInstance(rst, np.ndarray)
-        self.assertEqual(2, rst[2].ndim)
-        self.assertEqual(2, rst[2].shape[1])
-
-        rst = ...
-        self.assertEqual(3, len(rst))
-        self.assertIsInstance(rst[1], list)
-        for i in [0, 2]:
-            self.assertIsInstance(rst[i], np.ndarray)
-        self.assertEqual(1, rst[2].ndim)
-        self.assertEqual(rst[0].shape[0], len(rst[1]))
-        self.assertEqual(rst[0].shape[0], rst[2].size)
-        """
-        pass
-
-    @unittest.skip("A contribution is required")
+        self.assertEqual(2, rst.ndim)
+        self.assertEqual(2, rst.shape[1])
+
     def test_evaluate_priors(self):
-        # TODO: Write testing cases for function evaluate_priors.
-        pass
+        df = pd.DataFrame({'video-name': ['a', 'a', 'b', 'c'],
+                           'video-frames': [1000, 1000, 500, 100],
+                           'f-init': [2, 200, 19, 10],
+                           'n-frames': [127, 64, 127, 20]})
+        priors = np.array([[0.25, 0.5], [0.5, 1.0]])
+        eval_df, recall = data_generation.evaluate_priors(
+            df, priors, 256, stride=16, return_recall=True)
+        self.assertEqual(4, eval_df.shape[0])
+        # Windows start at 1, 18, 35... and priors span [1, 127], [1, 255]
+        np.testing.assert_array_equal([1.0, 1.0], eval_df['iou'][[0, 2]])
+        np.testing.assert_array_equal([0, 0], eval_df['k-idx'][[0, 2]])
+        np.testing.assert_array_equal([2, 19],
+                                      eval_df['priors-f-init'][[0, 2]])
+        np.testing.assert_array_equal([127, 127],
+                                      eval_df['priors-n-frames'][[0, 2]])
+        self.assertEqual(64.0 / 127, eval_df.loc[1, 'iou'])
+        # Videos shorter than T do not have priors
+        self.assertEqual(0.0, eval_df.loc[3, 'iou'])
+        self.assertTrue(np.isnan(eval_df.loc[3, 'k-idx']))
+        self.assertEqual(0.75, recall)
+        # Batches of a single length give the same result
+        rst = data_generation.evaluate_priors(df, priors, 256, stride=16,
+                                              max_priors=1)
+        self.assertTrue(eval_df.equals(rst))
+        rst = data_generation.evaluate_priors(df, priors, 256, stride=16,
+                                              max_priors=1, n_jobs=2)
+        self.assertTrue(eval_df.equals(rst))
 
-    @unittest.skip("A contribution is required")
     def test_compute_priors_over_time(self):
-        # TODO: Write testing cases for the function compute_priors_over_time.
-        pass
+        mapped_priors_b = np.array([[1, 128], [65, 256], [1, 256]])
+        priors_t, k_idx = data_generation.compute_priors_over_time(
+            mapped_priors_b, 256, 1000, stride=16)
+        # Windows start at 1, 18, 35, ..., 732
+        self.assertEqual((44 * 3, 2), priors_t.shape)
+        self.assertEqual(np.int32, priors_t.dtype)
+        np.testing.assert_array_equal([0, 1, 2] * 44, k_idx)
+        np.testing.assert_array_equal([[2, 129], [66, 257], [2, 257],
+                                       [19, 146]], priors_t[:4, :])
+        np.testing.assert_array_equal(mapped_priors_b + 732,
+                                      priors_t[-3:, :])
+        rst = data_generation.compute_priors_over_time(
+            mapped_priors_b, 256, 1000, stride=16, flat=False)[0]
+        self.assertEqual((44, 3, 2), rst.shape)
+        np.testing.assert_array_equal(priors_t, rst.reshape(-1, 2))
+        # Chunks of windows
+        chunks = list(data_generation.iter_priors_over_time(
+            mapped_priors_b, 256, 1000, stride=16, chunk_size=10))
+        self.assertEqual(5, len(chunks))
+        np.testing.assert_array_equal(
+            priors_t, np.vstack([i for i, _ in chunks]))
+        np.testing.assert_array_equal(k_idx,
+                                      np.hstack([i for _, i in chunks]))
+        # Videos shorter than T
+        rst = data_generation.compute_priors_over_time(mapped_priors_b, 256,
+                                                       200)
+        self.assertEqual([(0, 2), (0,)], [i.shape for i in rst])
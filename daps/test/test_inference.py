@@ -0,0 +1,259 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+import daps.inference as inference
+from daps.c3d_encoder import Feature
+
+
+class LinearModel(object):
+    """Toy model exposing the interface of daps.model.ProposalModel"""
+    def __init__(self, input_size, n_outputs=4, model_prm='mlp:4,1,8,0,0',
+                 rng_seed=None):
+        rng = np.random.RandomState(rng_seed)
+        self.model_prm = model_prm
+        self.W_loc = rng.rand(input_size, 2 * n_outputs)
+        self.W_conf = rng.rand(input_size, n_outputs)
+        self.batch_sizes = []
+
+    def forward(self, X):
+        X = X.reshape((X.shape[0], -1))
+        self.batch_sizes.append(X.shape[0])
+        return np.dot(X, self.W_loc).reshape((-1, 2)), np.dot(X, self.W_conf)
+
+
+def dump_features(filename, video_lst, d=6, rng_seed=None):
+    rng = np.random.RandomState(rng_seed)
+    with h5py.File(filename, 'w') as f:
+        for video_name, l_size in video_lst:
+            f.create_group(video_name).create_dataset(
+                'c3d_features', data=rng.rand(l_size, d))
+
+
+class test_window_scheduler(unittest.TestCase):
+    def test_add_flush(self):
+        model = LinearModel(3, rng_seed=0)
+        sizes = [5, 0, 1, 12, 3]
+        X = [np.random.rand(n, 3).astype(np.float32) for n in sizes]
+        scheduler = inference.WindowScheduler(model.forward, batch_size=4)
+        completed = []
+        for i, x in enumerate(X):
+            completed += scheduler.add(i, x, np.arange(x.shape[0]))
+        completed += scheduler.flush()
+        self.assertEqual(range(len(sizes)), [i[0] for i in completed])
+        self.assertEqual([4, 4, 4, 4, 4, 1], model.batch_sizes)
+        for key, f_init, loc, score in completed:
+            if sizes[key] == 0:
+                self.assertEqual(0, loc.shape[0])
+                continue
+            loc_true, score_true = model.forward(X[key])
+            np.testing.assert_array_almost_equal(loc_true, loc, 5)
+            np.testing.assert_array_almost_equal(score_true, score, 5)
+        self.assertRaises(ValueError, inference.WindowScheduler, None, 0)
+
+
+class test_prune_proposals(unittest.TestCase):
+    def test_prune_proposals(self):
+        proposal = np.arange(24).reshape((12, 2))
+        score = np.array([0.1, 0.9, 0.5, 0.3, 0.2, 0.4, 0.8, 0.7, 0.0, 0.6,
+                          0.05, 0.95])
+        rst = inference.prune_proposals(proposal, score, 4, top_k=2,
+                                        return_index=True)
+        np.testing.assert_array_equal([1, 2, 6, 7, 9, 11], rst[2])
+        np.testing.assert_array_equal(proposal[rst[2], :], rst[0])
+        np.testing.assert_array_equal(score[rst[2]], rst[1])
+        rst = inference.prune_proposals(proposal, score, 4, top_k=2,
+                                        score_thr=0.6, return_index=True)
+        np.testing.assert_array_equal([1, 6, 7, 9, 11], rst[2])
+        rst = inference.prune_proposals(proposal, score, 4, top_k=8)
+        np.testing.assert_array_equal(proposal, rst[0])
+
+
+class test_retrieve_proposals(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.filename = os.path.join(self.root, 'feat.hdf5')
+        with h5py.File(self.filename, 'w') as f:
+            f.create_group('a').create_dataset(
+                'c3d_features', data=np.random.rand(700, 5))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_memory_budget(self):
+        model = inference.NumpyProposalModel(
+            'mlp:4,1,8,0,0', input_size=10,
+            params=[np.random.rand(10, 8), np.random.rand(8),
+                    np.random.rand(8, 8), np.random.rand(8),
+                    np.random.rand(8, 4), np.random.rand(4)])
+        args = ('a', 700, model, 64, 16, 4, 2, 'concat-2-mean',
+                self.filename, model.model_prm)
+        proposal, score, stats = inference.retrieve_proposals(
+            *args, return_stats=True)
+        self.assertEqual(1, stats['n_chunks'])
+        feat = Feature(self.filename, t_size=4, t_stride=2,
+                       pool_type='concat-2-mean')
+        feat.open_instance()
+        f_init_array = inference.sliding_windows(700, 64, 16)
+        X = feat.read_feat_batch_from_video('a', f_init_array, 64)
+        feat.close_instance()
+        loc, score_true = model.forward(X.astype(np.float32))
+        rst = inference.window_proposals(f_init_array, loc, score_true, 64)
+        np.testing.assert_array_equal(rst[0], proposal)
+        np.testing.assert_array_equal(rst[1], score)
+        for budget in [1, 6000, 20000]:
+            rst = inference.retrieve_proposals(*args, memory_budget=budget,
+                                               return_stats=True)
+            np.testing.assert_array_equal(proposal, rst[0])
+            np.testing.assert_array_equal(score, rst[1])
+            self.assertEqual(np.ceil(40.0 / rst[2]['chunk_size']),
+                             rst[2]['n_chunks'])
+            if rst[2]['chunk_size'] > 1:
+                self.assertLessEqual(max(rst[2]['chunk_bytes']), budget)
+        rst = inference.retrieve_proposals('a', 10, *args[2:])
+        self.assertEqual((0, 2), rst[0].shape)
+
+
+class test_batch_retrieve_proposals(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.filename = os.path.join(self.root, 'feat.hdf5')
+        self.video_lst = [('a', 90), ('b', 40), ('c', 200)]
+        dump_features(self.filename, self.video_lst, rng_seed=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_batch_retrieve_proposals(self):
+        T, stride = 32, 8
+        model = LinearModel(6, rng_seed=1)
+        rst = list(inference.batch_retrieve_proposals(
+            self.video_lst, model, T, stride, 4, 2, 'mean', self.filename,
+            batch_size=5))
+        self.assertEqual(['a', 'b', 'c'], [i[0] for i in rst])
+        rst_pruned = inference.batch_retrieve_proposals(
+            self.video_lst, model, T, stride, 4, 2, 'mean', self.filename,
+            batch_size=5, top_k=2)
+        for (_, proposal, score), (_, proposal_k, score_k) in zip(rst,
+                                                                 rst_pruned):
+            proposal_true, score_true = inference.prune_proposals(
+                proposal, score, 4, 2)
+            np.testing.assert_array_equal(proposal_true, proposal_k)
+            np.testing.assert_array_almost_equal(score_true, score_k, 5)
+        feat = Feature(self.filename, t_size=4, t_stride=2)
+        feat.open_instance()
+        for (video_name, l_size), (_, proposal, score) in zip(self.video_lst,
+                                                             rst):
+            f_init = inference.sliding_windows(l_size, T, stride)
+            X = feat.read_feat_batch_from_video(video_name, f_init, T)
+            loc, score_true = model.forward(X.astype(np.float32))
+            proposal_true, score_true = inference.window_proposals(
+                f_init, loc, score_true, T)
+            np.testing.assert_array_equal(proposal_true, proposal)
+            np.testing.assert_array_almost_equal(score_true, score, 5)
+        feat.close_instance()
+
+
+class test_streaming_proposals(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.filename = os.path.join(self.root, 'feat.hdf5')
+        dump_features(self.filename, [('a', 181)], rng_seed=0)
+        with h5py.File(self.filename, 'r') as f:
+            self.rows = f['a']['c3d_features'][...]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_push(self):
+        T, stride = 32, 12
+        for pool_type, input_size in [('mean', 6), ('concat-2-max', 12)]:
+            model = LinearModel(input_size, rng_seed=1)
+            offline = list(inference.batch_retrieve_proposals(
+                [('a', self.rows.shape[0])], model, T, stride, 4, 2,
+                pool_type, self.filename))[0]
+            chunks = np.array_split(self.rows, [1, 2, 30, 31, 100, 170])
+            rst = list(inference.stream_proposals(
+                chunks, model, T, stride, 4, 2, pool_type))
+            f_init = inference.sliding_windows(self.rows.shape[0], T, stride)
+            np.testing.assert_array_equal(f_init, [i[0] for i in rst])
+            np.testing.assert_array_equal(
+                offline[1], np.vstack([i[1] for i in rst]))
+            np.testing.assert_array_almost_equal(
+                offline[2], np.hstack([i[2] for i in rst]))
+
+        model = LinearModel(6, rng_seed=1)
+        stream = inference.StreamingProposals(model, T, stride, 4, 2,
+                                              capacity=T + 1)
+        self.assertEqual([], stream.push(self.rows[:T]))
+        self.assertEqual(1, len(stream.push(self.rows[T:T + 1])))
+        self.assertEqual(T + 1, stream.n_rows)
+        self.assertEqual(1, len(stream.latency))
+        self.assertRaises(ValueError, inference.StreamingProposals, model, T,
+                          capacity=T)
+
+
+class test_multiscale(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.filename = os.path.join(self.root, 'feat.hdf5')
+        self.video_lst = [('a', 90), ('b', 40)]
+        dump_features(self.filename, self.video_lst, rng_seed=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_batch_retrieve_proposals_multiscale(self):
+        model, model_concat = LinearModel(6, 4), LinearModel(12, 3)
+        scales = [{'model': model, 'T': 32, 'stride': 8, 'pool_type': 'mean'},
+                  {'model': model_concat, 'T': 64, 'stride': 16,
+                   'pool_type': 'concat-2-mean'},
+                  {'model': model, 'T': 32, 'stride': 8, 'pool_type': 'mean'}]
+        rst = list(inference.batch_retrieve_proposals_multiscale(
+            self.video_lst, scales, self.filename, 4, 2))
+        self.assertEqual(['a', 'b'], [i[0] for i in rst])
+        for video_name, proposal, score, scale_idx in rst:
+            self.assertEqual(proposal.shape[0], score.size)
+            self.assertEqual(score.size, scale_idx.size)
+            for i, scale in enumerate(scales):
+                single = list(inference.batch_retrieve_proposals(
+                    [(video_name, dict(self.video_lst)[video_name])],
+                    scale['model'], scale['T'], scale['stride'], 4, 2,
+                    scale['pool_type'], self.filename))[0]
+                np.testing.assert_array_equal(single[1],
+                                              proposal[scale_idx == i, :])
+                np.testing.assert_array_almost_equal(single[2],
+                                                     score[scale_idx == i])
+        # Video b is too short for the second scale
+        self.assertEqual(0, (rst[1][3] == 1).sum())
+
+    def test_fuse_proposals(self):
+        proposal = np.array([[0, 100], [50, 200], [2, 101], [300, 400],
+                             [0, 100], [52, 150]])
+        score = np.array([0.6, 0.4, 0.8, 0.9, 0.1, 0.2])
+        model_idx = np.array([0, 0, 1, 1, 1, 1])
+        rst = inference.fuse_proposals(proposal, score, model_idx)
+        # Regressed boundaries of different models are matched by IOU and
+        # keep the ones of the highest score. A model adds a single proposal
+        # to each group.
+        np.testing.assert_array_equal(
+            [[0, 100], [2, 101], [50, 200], [52, 150], [300, 400]], rst[0])
+        np.testing.assert_array_almost_equal([0.05, 0.7, 0.2, 0.1, 0.45],
+                                             rst[1])
+        rst = inference.fuse_proposals(proposal, score, model_idx, [3, 1])
+        np.testing.assert_array_almost_equal(
+            [0.025, 0.65, 0.3, 0.05, 0.225], rst[1])
+        # Only identical boundaries are matched
+        rst = inference.fuse_proposals(proposal, score, model_idx,
+                                       iou_thr=1.0)
+        self.assertEqual(5, rst[0].shape[0])
+        np.testing.assert_array_almost_equal(0.35, rst[1][0])
+        rst = inference.fuse_proposals(proposal[:0], score[:0],
+                                       model_idx[:0], [1, 1])
+        self.assertEqual((0, 2), rst[0].shape)
+        self.assertRaises(ValueError, inference.fuse_proposals, proposal,
+                          score, model_idx, None, 0)
@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import lasagne
+import numpy as np
+import theano.tensor as T
+
+from daps.learning import iterate_minibatches, optimization
+from daps.learning import teacher_digest, teacher_outputs
+from daps.model import build_model, ProposalModel
+
+
+class test_distillation(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_teacher_outputs(self):
+        model_prm, X = 'mlp:4,2,16,0,0', np.random.rand(11, 10)
+        model = ProposalModel(model_prm, input_size=10)
+        teacher = (os.path.join(self.root, 'model.npz'),
+                   os.path.join(self.root, 'hyper_prm.json'))
+        np.savez(teacher[0],
+                 *lasagne.layers.get_all_param_values(model.network))
+        with open(teacher[1], 'w') as fobj:
+            json.dump({'model': model_prm}, fobj)
+
+        cachefile = os.path.join(self.root, 'cache.npz')
+        loc, conf, rst_prm = teacher_outputs(teacher, X, cachefile, 4)
+        self.assertEqual(model_prm, rst_prm)
+        self.assertEqual((11, 8), loc.shape)
+        exp_loc, exp_conf = model.forward(X)
+        np.testing.assert_array_almost_equal(exp_loc.reshape((11, 8)), loc)
+        np.testing.assert_array_almost_equal(exp_conf, conf)
+
+        # Digest depends on the content of the weights
+        digest = teacher_digest(teacher)
+        np.savez(teacher[0], *[i + 1 for i in lasagne.layers.
+                                get_all_param_values(model.network)])
+        self.assertNotEqual(digest, teacher_digest(teacher))
+
+        # Cached outputs are reused
+        os.remove(teacher[0])
+        rst = teacher_outputs(teacher, X, cachefile)
+        np.testing.assert_array_equal(loc, rst[0])
+        self.assertEqual(model_prm, rst[2])
+
+    def test_teacher_outputs_layout(self):
+        # lstm teacher of a mlp student
+        model_prm, X = 'lstm:4,2,8,1', np.random.rand(5, 10)
+        model = ProposalModel(model_prm, input_size=5)
+        teacher = (os.path.join(self.root, 'model.npz'),
+                   os.path.join(self.root, 'hyper_prm.json'))
+        np.savez(teacher[0],
+                 *lasagne.layers.get_all_param_values(model.network))
+        with open(teacher[1], 'w') as fobj:
+            json.dump({'model': model_prm}, fobj)
+        cachefile = os.path.join(self.root, 'cache.npz')
+        loc, conf, _ = teacher_outputs(teacher, X, cachefile)
+        exp_loc, exp_conf = model.forward(X.reshape((5, 2, 5)))
+        np.testing.assert_array_almost_equal(exp_loc.reshape((5, 8)), loc)
+        np.testing.assert_array_almost_equal(exp_conf, conf)
+        self.assertRaises(ValueError, teacher_outputs, teacher,
+                          np.random.rand(5, 9))
+
+        # Cache of a different model is ignored
+        mlp_prm = 'mlp:4,1,8,0,0'
+        mlp = ProposalModel(mlp_prm, input_size=10)
+        np.savez(teacher[0],
+                 *lasagne.layers.get_all_param_values(mlp.network))
+        with open(teacher[1], 'w') as fobj:
+            json.dump({'model': mlp_prm}, fobj)
+        loc, conf, rst_prm = teacher_outputs(teacher, X, cachefile)
+        self.assertEqual(mlp_prm, rst_prm)
+        np.testing.assert_array_almost_equal(mlp.forward(X)[1], conf)
+
+    def test_optimization(self):
+        input_var = T.matrix('inputs')
+        network = build_model('mlp:4,1,8,0,0', input_var, input_size=10)
+        priors = np.random.rand(8).astype(np.float32)
+        opt_prm = {'learning_rate': 0.01}
+        train_fn, _ = optimization(network, input_var, priors, 0.3, 0,
+                                   (1.0, 1.0), (1.0, 1.0), 'l2',
+                                   lasagne.updates.sgd, opt_prm, 0.5)
+        X = np.random.rand(6, 10).astype(np.float32)
+        y = np.random.randint(0, 2, (6, 4)).astype(np.float32)
+        teacher = (np.random.rand(6, 8), np.random.rand(6, 4))
+        n_batches = 0
+        for batch in iterate_minibatches(X, y, 3, True, teacher):
+            self.assertEqual(4, len(batch))
+            self.assertTrue(np.isfinite(train_fn(*batch)))
+            n_batches += 1
+        self.assertEqual(2, n_batches)
+
+    def test_distillation_weights(self):
+        # Null localization, thus the soft loss only depends on teacher_loc
+        input_var = T.matrix('inputs')
+        l_in = lasagne.layers.InputLayer((None, 3), input_var)
+        loc = lasagne.layers.DenseLayer(l_in, 4, W=lasagne.init.Constant(0),
+                                        b=lasagne.init.Constant(0),
+                                        nonlinearity=None)
+        conf = lasagne.layers.DenseLayer(
+            l_in, 2, nonlinearity=lasagne.nonlinearities.sigmoid)
+        priors = np.zeros(4, dtype=np.float32)
+        train_fn, _ = optimization([loc, conf], input_var, priors, 1.0, 0,
+                                   (1.0, 1.0), (1.0, 1.0), 'l2',
+                                   lasagne.updates.sgd,
+                                   {'learning_rate': 0.0}, 1.0)
+        X = np.random.rand(1, 3).astype(np.float32)
+        y = np.zeros((1, 2), dtype=np.float32)
+        teacher_conf = np.array([[1, 0]], dtype=np.float32)
+        ref = train_fn(X, y, np.zeros((1, 4)), teacher_conf)
+        # (c, d) of the first prior are weighted by its confidence only
+        rst = train_fn(X, y, np.array([[1, 1, 0, 0]]), teacher_conf)
+        self.assertAlmostEqual(0.5, rst - ref, 5)
+        rst = train_fn(X, y, np.array([[0, 0, 1, 1]]), teacher_conf)
+        self.assertAlmostEqual(0, rst - ref, 5)
@@ -1,9 +1,16 @@
+import os
+import shutil
+import tempfile
 import unittest
 
+import h5py
+import lasagne
 import numpy as np
 import theano
 import theano.tensor as T
 
+from daps.inference import multiply_adds, NumpyProposalModel
+from daps.model import forward_pass, ProposalModel, retrieve_proposals
 from daps.model import weigthed_binary_crossentropy
 
 
@@ -20,3 +27,75 @@ class test_loss_functions(unittest.TestCase):
         f = theano.function([x, y], loss, allow_input_downcast=True)
 
         np.testing.assert_array_almost_equal(expected_val, f(x_val, y_val))
+
+
+class test_proposal_model(unittest.TestCase):
+    def test_forward(self):
+        for model_prm, shape in [('mlp:4,2,8,0,0', (10,)),
+                                 ('lstm:4,3,8,1', (3, 10))]:
+            model = ProposalModel(model_prm, input_size=10)
+            for n in [1, 7]:
+                x = np.random.rand(n, *shape).astype(np.float32)
+                loc, score = model.forward(x)
+                self.assertEqual((n * 4, 2), loc.shape)
+                self.assertEqual((n, 4), score.shape)
+                rst = forward_pass(model.network, x)
+                np.testing.assert_array_almost_equal(rst[0], loc)
+                np.testing.assert_array_almost_equal(rst[1], score)
+
+    def test_multiply_adds(self):
+        for model_prm in ['mlp:4,2,8,0,0', 'lstm:4,3,8,2']:
+            model = ProposalModel(model_prm, input_size=10)
+            n_ops = 0
+            for i in lasagne.layers.get_all_params(model.network,
+                                                   regularizable=True):
+                if 'W_cell_to' in i.name:
+                    # Peephole connections are element-wise
+                    continue
+                n = i.get_value().size
+                if 'W_in_to' in i.name or 'W_hid_to' in i.name:
+                    n *= 3
+                n_ops += n
+            self.assertEqual(n_ops, multiply_adds(model_prm, 10))
+
+    def test_numpy_backend(self):
+        root = tempfile.mkdtemp()
+        filename = os.path.join(root, 'model.npz')
+        for model_prm, shape in [('mlp:4,2,8,0,0', (10,)),
+                                 ('lstm:4,3,8,2', (3, 10))]:
+            model = ProposalModel(model_prm, input_size=10)
+            np.savez(filename,
+                     *lasagne.layers.get_all_param_values(model.network))
+            # Peephole follows the installed Lasagne by default
+            np_model = NumpyProposalModel(model_prm, filename, input_size=10)
+            self.assertEqual(lasagne.__version__ == '0.1',
+                             np_model.legacy_peephole)
+            x = np.random.rand(6, *shape).astype(np.float32)
+            loc, score = model.forward(x)
+            rst = np_model.forward(x)
+            np.testing.assert_allclose(loc, rst[0], rtol=1e-4, atol=1e-5)
+            np.testing.assert_allclose(score, rst[1], rtol=1e-4, atol=1e-5)
+            self.assertRaises(ValueError, NumpyProposalModel, model_prm,
+                              filename, 11)
+        shutil.rmtree(root)
+
+
+class test_retrieve_proposals(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.filename = os.path.join(self.root, 'feat.hdf5')
+        with h5py.File(self.filename, 'w') as f:
+            f.create_group('a').create_dataset(
+                'c3d_features', data=np.random.rand(700, 5))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_lasagne_layers(self):
+        model = ProposalModel('mlp:4,1,8,0,0', input_size=10)
+        args = (64, 16, 4, 2, 'concat-2-mean', self.filename,
+                model.model_prm)
+        proposal, score = retrieve_proposals('a', 700, model, *args)
+        rst = retrieve_proposals('a', 700, model.network, *args)
+        np.testing.assert_array_almost_equal(proposal, rst[0], 4)
+        np.testing.assert_array_almost_equal(score, rst[1], 5)
@@ -0,0 +1,112 @@
+import imp
+import os
+import threading
+import unittest
+
+import numpy as np
+
+from daps.c3d_encoder import pool_windows
+from daps.inference import sliding_windows, window_proposals
+
+proposal_server = imp.load_source(
+    'proposal_server',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                 'tools', 'proposal_server.py'))
+
+
+class LinearModel(object):
+    """Toy model exposing the interface of daps.model.ProposalModel"""
+    def __init__(self, input_size, n_outputs=4, model_prm='mlp:4,1,8,0,0',
+                 rng_seed=None):
+        rng = np.random.RandomState(rng_seed)
+        self.model_prm = model_prm
+        self.W_loc = rng.rand(input_size, 2 * n_outputs)
+        self.W_conf = rng.rand(input_size, n_outputs)
+        self.batch_sizes = []
+
+    def forward(self, X):
+        self.batch_sizes.append(X.shape[0])
+        return np.dot(X, self.W_loc).reshape((-1, 2)), np.dot(X, self.W_conf)
+
+
+class test_micro_batcher(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # In-memory feature store with raw C3D features of each video
+        self.videos = {'a': 90, 'b': 40, 'c': 200, 'd': 8, 'e': 120}
+        self.feat = dict((k, rng.rand(v, 6).astype(np.float32))
+                         for k, v in self.videos.iteritems())
+        self.model = LinearModel(6, rng_seed=0)
+        self.server = proposal_server.ProposalServer(
+            ('localhost', 0), None, T=64, stride=32, c3d_size=4,
+            c3d_stride=2)
+        self.server.read_video = lambda video_name, _: self.feat[video_name]
+
+    def tearDown(self):
+        self.server.server_close()
+
+    def expected_proposals(self, video_name):
+        l_size = self.feat[video_name].shape[0]
+        f_init_array = sliding_windows(l_size, 64, 32)
+        feat_stack = pool_windows(self.feat[video_name], f_init_array, 64, 4,
+                                  2, 'mean', dtype=np.float32)
+        if f_init_array.size == 0:
+            return np.empty((0, 2)), np.empty(0)
+        loc, score = LinearModel(6, rng_seed=0).forward(feat_stack)
+        return window_proposals(f_init_array, loc, score, 64)
+
+    def test_concurrent_requests(self):
+        batcher = proposal_server.MicroBatcher(self.model, batch_size=8,
+                                               max_wait=0.5)
+        self.server.batcher = batcher
+        results, threads = {}, []
+
+        def client(video_name):
+            results[video_name] = self.server.proposals(
+                {'video-name': video_name})
+
+        for video_name in sorted(self.videos):
+            threads.append(threading.Thread(target=client,
+                                            args=(video_name,)))
+            threads[-1].start()
+        for thread in threads:
+            thread.join(10)
+            self.assertFalse(thread.is_alive())
+
+        # Windows of all requests share forward passes
+        n_windows = sum(sliding_windows(v, 64, 32).size
+                        for v in self.videos.itervalues())
+        self.assertEqual(n_windows, sum(self.model.batch_sizes))
+        self.assertLess(len(self.model.batch_sizes), len(self.videos))
+        self.assertEqual(n_windows, batcher.stats()['windows'])
+
+        # Every caller gets its own proposals
+        self.assertEqual(sorted(self.videos), sorted(results))
+        for video_name, rst in results.iteritems():
+            self.assertEqual(video_name, rst['video-name'])
+            proposal, score = self.expected_proposals(video_name)
+            np.testing.assert_array_almost_equal(proposal[:, 0],
+                                                 rst['f-init'], 3)
+            np.testing.assert_array_almost_equal(proposal[:, 1],
+                                                 rst['f-end'], 3)
+            np.testing.assert_array_almost_equal(score, rst['score'], 4)
+        # Videos shorter than a window do not have proposals
+        self.assertEqual([], results['d']['score'])
+
+    def test_submit(self):
+        batcher = proposal_server.MicroBatcher(self.model, batch_size=4,
+                                               max_wait=0)
+        X = np.random.rand(6, 6).astype(np.float32)
+        loc, score = batcher.submit(X, np.arange(6))
+        exp_loc, exp_score = self.model.forward(X)
+        np.testing.assert_array_almost_equal(exp_loc, loc, 5)
+        np.testing.assert_array_almost_equal(exp_score, score, 5)
+        loc, score = batcher.submit(np.empty((0, 6)), np.arange(0))
+        self.assertEqual(0, loc.shape[0])
+        self.assertEqual(0, score.shape[0])
+        # Errors are raised to the caller only
+        self.assertRaises(ValueError, batcher.submit, np.random.rand(2, 5),
+                          np.arange(2))
+        loc, score = batcher.submit(X[:2], np.arange(2))
+        np.testing.assert_array_almost_equal(exp_score[:2], score, 5)
+
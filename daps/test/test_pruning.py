@@ -0,0 +1,62 @@
+import unittest
+
+import lasagne
+import numpy as np
+
+from daps.inference import NumpyProposalModel
+from daps.model import build_model
+from daps.pruning import prune_units, select_units, unit_importance
+
+
+class test_pruning(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.RandomState(0)
+
+    def random_params(self, model_prm, input_size):
+        network = build_model(model_prm, input_size=input_size)
+        return [self.rng.randn(*i.shape).astype(np.float32)
+                for i in lasagne.layers.get_all_param_values(network)]
+
+    def test_prune_units(self):
+        for model_prm, shape in [('mlp:4,2,8,0,0', (10,)),
+                                 ('lstm:4,3,8,2', (3, 10))]:
+            params = self.random_params(model_prm, 10)
+            model = NumpyProposalModel(model_prm, input_size=10,
+                                       params=params)
+            x = self.rng.rand(5, *shape).astype(np.float32)
+
+            # Keeping all the units does not change the model
+            keep = [np.arange(8)] * 2
+            new_prm, new_params = prune_units(model_prm, params, keep)
+            self.assertEqual(model_prm, new_prm)
+            rst = NumpyProposalModel(new_prm, input_size=10,
+                                     params=new_params).forward(x)
+            for i, j in zip(model.forward(x), rst):
+                np.testing.assert_array_almost_equal(i, j)
+
+            # Units without outgoing weights are the least important ones
+            if model_prm.startswith('mlp'):
+                # Avoid dead units
+                params = [np.abs(i) for i in params]
+            useless = [1, 6]
+            for v in params:
+                if v.shape[0] == 8 and v.ndim == 2:
+                    v[useless, :] = 0
+            model = NumpyProposalModel(model_prm, input_size=10,
+                                       params=params)
+            for method in ['norm', 'activation']:
+                importance = unit_importance(model, method, x)
+                self.assertEqual(2, len(importance))
+                keep = select_units(importance, 6)
+                for i in keep:
+                    self.assertEqual([0, 2, 3, 4, 5, 7], i.tolist())
+            new_prm, new_params = prune_units(model_prm, params, keep)
+            self.assertEqual(model_prm.replace(',8,', ',6,'), new_prm)
+            pruned = NumpyProposalModel(new_prm, input_size=10,
+                                        params=new_params)
+            for i, j in zip(model.forward(x), pruned.forward(x)):
+                np.testing.assert_allclose(i, j, rtol=1e-5)
+
+        self.assertRaises(ValueError, select_units, importance, 9)
+        self.assertRaises(ValueError, prune_units, model_prm, params,
+                          [np.arange(3), np.arange(4)])
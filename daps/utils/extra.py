@@ -163,7 +163,7 @@ def sampling_with_uniform_groups(x, bin_edges, strict=True, rng=None):
     keep_idx_list = []
     for i in xrange(n_bins):
         tmp = (idx == i).nonzero()[0]
-        keep_idx_list.append(rng.permutation(tmp)[:samples_per_bin[i]])
+        keep_idx_list.append(rng.permutation(tmp)[:int(samples_per_bin[i])])
     keep_idx = np.hstack(keep_idx_list)
     return keep_idx
 
@@ -98,3 +98,54 @@ def concat1d(x, n=8, pool_type='mean', norm=True, unit=False):
     if unit:
         return concat_feat / n
     return concat_feat
+
+
+def feature_pooling(x, pool_type='mean'):
+    """Compute pooling of a bunch of features
+
+    Parameters
+    ----------
+    x : ndarray
+        [m x d] array of features. m is the number of features and d is the
+        dimensionality of the feature space.
+    pool_type : str
+        Global pooling strategy over a bunch of features.
+        None, 'mean', 'max', 'pyr-2-mean/max', 'concat-2-mean/max'
+
+    """
+    if x.ndim != 2:
+        raise ValueError('Invalid input ndarray. Input must be [mxd].')
+
+    if not pool_type:
+        return x
+
+    if pool_type == 'mean':
+        return x.mean(axis=0)
+    elif pool_type == 'max':
+        return x.max(axis=0)
+    elif 'pyr' in pool_type:
+        _, level, pool_type = pool_type.split('-')
+        return pyramid1d(x, int(level), pool_type)
+    elif 'concat' in pool_type:
+        _, level, pool_type = pool_type.split('-')
+        return concat1d(x, int(level), pool_type)
+
+
+def pooled_size(d, pool_type='mean'):
+    """Dimension of the output of `feature_pooling`
+
+    Parameters
+    ----------
+    d : int
+        Dimensionality of the feature space.
+    pool_type : str
+        Global pooling strategy, see `feature_pooling`.
+
+    """
+    if pool_type in ['mean', 'max']:
+        return d
+    elif 'pyr' in pool_type:
+        return d * (2**(int(pool_type.split('-')[1]) + 1) - 1)
+    elif 'concat' in pool_type:
+        return d * int(pool_type.split('-')[1])
+    raise ValueError('Unknown pooling type {}'.format(pool_type))
@@ -1,7 +1,12 @@
+import heapq
+
 import numpy as np
 
+# Default number of bytes of temporary arrays used by intersection and iou
+MEMORY_BUDGET = 2**27
+
 
-def format(X, mthd='c2b', T=None, init=None):
+def format(X, mthd='c2b', T=None, init=None, out=None):
     """Transform temporal annotations
 
     Parameters
@@ -13,6 +18,11 @@ def format(X, mthd='c2b', T=None, init=None):
         'c2b': transform [center, duration] onto [f-init, f-end]
         'b2c': inverse of c2b
         'd2b': transform ['f-init', 'n-frames'] into ['f-init', 'f-end']
+        'b2d': inverse of d2b
+    out : ndarray, optional
+        [n x 2] array to place the result. It can be X itself to transform
+        it in-place. By default, a new array of type float64 for integer X
+        and the type of X otherwise.
 
     Outputs
     -------
@@ -22,23 +32,69 @@ def format(X, mthd='c2b', T=None, init=None):
     """
     if X.ndim != 2:
         msg = 'Incorrect number of dimensions. X.shape = {}'
-        ValueError(msg.format(X.shape))
+        raise ValueError(msg.format(X.shape))
+    if mthd not in ('c2b', 'b2c', 'd2b', 'b2d'):
+        raise ValueError('Unknown conversion {}'.format(mthd))
+    if out is None:
+        dtype = X.dtype
+        if not np.issubdtype(dtype, np.floating):
+            dtype = np.float64
+        out = np.empty(X.shape, dtype=dtype)
+    elif out.shape != X.shape:
+        raise ValueError('out must have the same shape of X')
 
+    # Columns of out are written after reading the ones of X used to compute
+    # them, thus out can be X.
     if mthd == 'c2b':
-        Xinit = np.ceil(X[:, 0] - 0.5*X[:, 1])
-        Xend = Xinit + X[:, 1] - 1.0
-        return np.stack([Xinit, Xend], axis=-1)
+        Xinit = X[:, 1] * -0.5
+        Xinit += X[:, 0]
+        np.ceil(Xinit, out=Xinit)
+        np.add(Xinit, X[:, 1], out=out[:, 1], casting='unsafe')
+        out[:, 1] -= 1
+        out[:, 0] = Xinit
     elif mthd == 'b2c':
-        Xc = np.round(0.5*(X[:, 0] + X[:, 1]))
-        d = X[:, 1] - X[:, 0] + 1.0
-        return np.stack([Xc, d], axis=-1)
+        Xc = X[:, 0] + X[:, 1]
+        if Xc.dtype.kind != 'f':
+            Xc = Xc.astype(np.float64)
+        Xc *= 0.5
+        np.round(Xc, out=Xc)
+        np.subtract(X[:, 1], X[:, 0], out=out[:, 1], casting='unsafe')
+        out[:, 1] += 1
+        out[:, 0] = Xc
     elif mthd == 'd2b':
-        Xinit = X[:, 0]
-        Xend = X[:, 0] + X[:, 1] - 1.0
-        return np.stack([Xinit, Xend], axis=-1)
+        np.add(X[:, 0], X[:, 1], out=out[:, 1], casting='unsafe')
+        out[:, 1] -= 1
+        if out is not X:
+            out[:, 0] = X[:, 0]
+    elif mthd == 'b2d':
+        np.subtract(X[:, 1], X[:, 0], out=out[:, 1], casting='unsafe')
+        out[:, 1] += 1
+        if out is not X:
+            out[:, 0] = X[:, 0]
+    return out
+
+
+def _row_tiles(m, n, itemsize, n_buffers, memory_budget=None):
+    """Slices over m rows such that n_buffers [rows x n] arrays fit on budget
+    """
+    if memory_budget is None:
+        memory_budget = MEMORY_BUDGET
+    rows = max(int(memory_budget // max(n * itemsize * n_buffers, 1)), 1)
+    for i in xrange(0, m, rows):
+        yield slice(i, min(i + rows, m))
+
+
+def _output_dtype(target_segments, test_segments, dtype=None):
+    if dtype is None:
+        return np.result_type(target_segments, test_segments, np.float32)
+    dtype = np.dtype(dtype)
+    if not np.issubdtype(dtype, np.floating):
+        raise ValueError('dtype must be a floating type')
+    return dtype
 
 
-def intersection(target_segments, test_segments, return_ratio_target=False):
+def intersection(target_segments, test_segments, return_ratio_target=False,
+                 ratio_only=False, dtype=None, memory_budget=None):
     """Compute intersection btw segments
 
     Parameters
@@ -50,6 +106,15 @@ def intersection(target_segments, test_segments, return_ratio_target=False):
     return_ratio_target : bool, optional
         extra ndarray output with ratio btw size of intersection over size of
         target-segments
+    ratio_only : bool, optional
+        return only the ratio btw size of intersection over size of
+        target-segments. It avoids the allocation of intersect.
+    dtype : numpy.dtype, optional
+        Type of outputs. By default, float32 for float32 segments and float64
+        otherwise.
+    memory_budget : int, optional
+        Maximum number of bytes of temporary arrays. Target segments are
+        processed in tiles of rows that fit on it. By default MEMORY_BUDGET.
 
     Outputs
     -------
@@ -65,26 +130,38 @@ def intersection(target_segments, test_segments, return_ratio_target=False):
     if target_segments.ndim != 2 or test_segments.ndim != 2:
         raise ValueError('Dimension of arguments is incorrect')
     m, n = target_segments.shape[0], test_segments.shape[0]
+    dtype = _output_dtype(target_segments, test_segments, dtype)
+    target_segments = target_segments.astype(dtype, copy=False)
+    test_init = np.ascontiguousarray(test_segments[:, 0], dtype=dtype)
+    test_end = np.ascontiguousarray(test_segments[:, 1], dtype=dtype)
+    return_ratio_target = return_ratio_target or ratio_only
     if return_ratio_target:
-        ratio_target = np.zeros((m, n))
+        ratio_target = np.empty((m, n), dtype=dtype)
+        target_size = target_segments[:, 1] - target_segments[:, 0] + 1
+    if not ratio_only:
+        intersect = np.empty((m, n, 2), dtype=dtype)
 
-    intersect = np.zeros((m, n, 2))
-    for i in xrange(m):
-        target_size = target_segments[i, 1] - target_segments[i, 0] + 1.0
-        tt1 = np.maximum(target_segments[i, 0], test_segments[:, 0])
-        tt2 = np.minimum(target_segments[i, 1], test_segments[:, 1])
-
-        intersect[i, :, 0], intersect[i, :, 1] = tt1, tt2
+    for idx in _row_tiles(m, n, dtype.itemsize, 2, memory_budget):
+        tt1 = np.maximum(target_segments[idx, 0:1], test_init)
+        tt2 = np.minimum(target_segments[idx, 1:2], test_end)
+        if not ratio_only:
+            intersect[idx, :, 0], intersect[idx, :, 1] = tt1, tt2
         if return_ratio_target:
-            isegs_size = (tt2 - tt1 + 1.0).clip(0)
-            ratio_target[i, :] = isegs_size / target_size
+            # tt1 is reused to hold the size of the intersection
+            np.subtract(tt2, tt1, out=tt1)
+            tt1 += 1
+            np.clip(tt1, 0, None, out=tt1)
+            np.divide(tt1, target_size[idx, np.newaxis],
+                      out=ratio_target[idx, :])
 
+    if ratio_only:
+        return ratio_target
     if return_ratio_target:
         return intersect, ratio_target
     return intersect
 
 
-def iou(target_segments, test_segments):
+def iou(target_segments, test_segments, dtype=None, memory_budget=None):
     """Compute intersection over union btw segments
 
     Parameters
@@ -93,6 +170,12 @@ def iou(target_segments, test_segments):
         2-dim array in format [m x 2:=[init, end]]
     test_segments : ndarray
         2-dim array in format [n x 2:=[init, end]]
+    dtype : numpy.dtype, optional
+        Type of output. By default, float32 for float32 segments and float64
+        otherwise.
+    memory_budget : int, optional
+        Maximum number of bytes of temporary arrays. Target segments are
+        processed in tiles of rows that fit on it. By default MEMORY_BUDGET.
 
     Outputs
     -------
@@ -106,30 +189,528 @@ def iou(target_segments, test_segments):
         raise ValueError('Dimension of arguments is incorrect')
 
     m, n = target_segments.shape[0], test_segments.shape[0]
-    iou = np.empty((m, n))
-    for i in xrange(m):
-        tt1 = np.maximum(target_segments[i, 0], test_segments[:, 0])
-        tt2 = np.minimum(target_segments[i, 1], test_segments[:, 1])
+    dtype = _output_dtype(target_segments, test_segments, dtype)
+    target_segments = target_segments.astype(dtype, copy=False)
+    test_init = np.ascontiguousarray(test_segments[:, 0], dtype=dtype)
+    test_end = np.ascontiguousarray(test_segments[:, 1], dtype=dtype)
+    target_size = target_segments[:, 1] - target_segments[:, 0] + 1
+    test_size = test_end - test_init + 1
+
+    iou = np.empty((m, n), dtype=dtype)
+    for idx in _row_tiles(m, n, dtype.itemsize, 2, memory_budget):
+        tt1 = np.maximum(target_segments[idx, 0:1], test_init)
+        tt2 = np.minimum(target_segments[idx, 1:2], test_end)
 
         # Non-negative overlap score
-        intersection = (tt2 - tt1 + 1.0).clip(0)
-        union = ((test_segments[:, 1] - test_segments[:, 0] + 1) +
-                 (target_segments[i, 1] - target_segments[i, 0] + 1) -
-                 intersection)
+        intersection = np.subtract(tt2, tt1, out=tt2)
+        intersection += 1
+        np.clip(intersection, 0, None, out=intersection)
+        union = np.add(test_size, target_size[idx, np.newaxis], out=tt1)
+        union -= intersection
         # Compute overlap as the ratio of the intersection
         # over union of two segments at the frame level.
-        iou[i, :] = intersection / union
+        np.divide(intersection, union, out=iou[idx, :])
     return iou
 
 
-def nms_detections(dets, score, overlap=0.3):
+def _expand_ranges(lo, hi):
+    """Owner and value of every element of the ranges [lo[i], hi[i])
+    """
+    counts = (hi - lo).clip(0)
+    owner = np.repeat(np.arange(lo.size), counts)
+    offset = np.arange(counts.sum()) - np.repeat(counts.cumsum() - counts,
+                                                 counts)
+    return owner, lo[owner] + offset
+
+
+def _overlapping_pairs(target_segments, test_segments, target_order=None):
+    """Index of target and test segments with non-empty intersection
+    """
+    # A pair overlaps iff one of the segments begins inside the other one.
+    # Case 1: test segment begins at or after the target one.
+    test_order = np.argsort(test_segments[:, 0], kind='mergesort')
+    test_init = test_segments[test_order, 0]
+    lo = np.searchsorted(test_init, target_segments[:, 0], 'left')
+    hi = np.searchsorted(test_init, target_segments[:, 1] + 1, 'left')
+    rows_1, cols_1 = _expand_ranges(lo, hi)
+    cols_1 = test_order[cols_1]
+    # Case 2: target segment begins strictly after the test one.
+    if target_order is None:
+        target_order = np.argsort(target_segments[:, 0], kind='mergesort')
+    target_init = target_segments[target_order, 0]
+    lo = np.searchsorted(target_init, test_segments[:, 0], 'right')
+    hi = np.searchsorted(target_init, test_segments[:, 1] + 1, 'left')
+    cols_2, rows_2 = _expand_ranges(lo, hi)
+    rows_2 = target_order[rows_2]
+    return np.hstack([rows_1, rows_2]), np.hstack([cols_1, cols_2])
+
+
+def _pair_sizes(target_segments, test_segments, rows, cols):
+    """Size of intersection and union of pairs of segments
+    """
+    tt1 = np.maximum(target_segments[rows, 0], test_segments[cols, 0])
+    tt2 = np.minimum(target_segments[rows, 1], test_segments[cols, 1])
+    intersection = tt2 - tt1 + 1
+    union = ((target_segments[rows, 1] - target_segments[rows, 0] + 1) +
+             (test_segments[cols, 1] - test_segments[cols, 0] + 1) -
+             intersection)
+    return intersection, union
+
+
+def iou_sparse(target_segments, test_segments, dtype=None):
+    """Compute intersection over union of overlapping segments only
+
+    Pairs are found sorting the initial frame of the segments, thus the cost
+    is O((m + n) log(m + n) + number of overlapping pairs).
+
+    Parameters
+    ----------
+    target_segments : ndarray
+        2-dim array in format [m x 2:=[init, end]]
+    test_segments : ndarray
+        2-dim array in format [n x 2:=[init, end]]
+    dtype : numpy.dtype, optional
+        Type of iou values. By default, float32 for float32 segments and
+        float64 otherwise.
+
+    Outputs
+    -------
+    rows : ndarray
+        1-dim array with index of target segments.
+    cols : ndarray
+        1-dim array with index of test segments.
+    iou : ndarray
+        1-dim array with IOU ratio of the pairs (rows, cols), i.e. sparse
+        matrix in COO format sorted by rows and cols. Pairs with null IOU are
+        omitted.
+
+    """
+    if target_segments.ndim != 2 or test_segments.ndim != 2:
+        raise ValueError('Dimension of arguments is incorrect')
+    dtype = _output_dtype(target_segments, test_segments, dtype)
+    target_segments = target_segments.astype(dtype, copy=False)
+    test_segments = test_segments.astype(dtype, copy=False)
+
+    rows, cols = _overlapping_pairs(target_segments, test_segments)
+    idx = np.lexsort([cols, rows])
+    rows, cols = rows[idx], cols[idx]
+    intersection, union = _pair_sizes(target_segments, test_segments, rows,
+                                      cols)
+    return rows, cols, (intersection / union).astype(dtype, copy=False)
+
+
+def sparse_row_max(rows, cols, values, n_rows):
+    """Maximum value and its column for every row of a COO matrix
+
+    Parameters
+    ----------
+    rows : ndarray
+        1-dim array with row index of the values.
+    cols : ndarray
+        1-dim array with column index of the values.
+    values : ndarray
+        1-dim array with values of the matrix.
+    n_rows : int
+        Number of rows of the matrix.
+
+    Outputs
+    -------
+    max_value : ndarray
+        1-dim array of size n_rows. It is zero for empty rows.
+    argmax : ndarray
+        1-dim array of size n_rows with the smallest column achieving the
+        maximum. It is -1 for empty rows.
+
+    """
+    max_value = _reduce_by_key(rows, values, n_rows, np.maximum, 0)
+    # Smallest column among the ones achieving the maximum
+    cols = np.where(values == max_value[rows], cols, np.iinfo(int).max)
+    argmax = _reduce_by_key(rows, cols, n_rows, np.minimum, -1)
+    return max_value, argmax
+
+
+def _reduce_by_key(keys, values, n_keys, ufunc, fill_value):
+    """Reduce values sharing the same key, as ufunc.at does but sorting
+    """
+    rst = np.full(n_keys, fill_value, dtype=values.dtype)
+    if values.size == 0:
+        return rst
+    # Order of values sharing a key is irrelevant for min/max
+    if (keys[1:] < keys[:-1]).any():
+        order = np.argsort(keys)
+        keys, values = keys[order], values[order]
+    first = np.flatnonzero(np.hstack([True, keys[1:] != keys[:-1]]))
+    rst[keys[first]] = ufunc.reduceat(values, first)
+    return rst
+
+
+class IntervalIndex(object):
+    """Index over the segments of a video to look up overlapping ones
+
+    Segments are sorted once by initial frame. Queries with n segments cost
+    O((m + n) log(m + n) + number of overlapping pairs), i.e. it does not
+    allocate any [m x n] array.
+
+    Attributes
+    ----------
+    segments : ndarray
+        2-dim array in format [m x 2:=[init, end]]
+
+    """
+    def __init__(self, segments, dtype=None):
+        if segments.ndim != 2:
+            raise ValueError('Dimension of arguments is incorrect')
+        dtype = _output_dtype(segments, segments, dtype)
+        self.segments = segments.astype(dtype, copy=False)
+        self.size = self.segments[:, 1] - self.segments[:, 0] + 1
+        self._order = np.argsort(self.segments[:, 0], kind='mergesort')
+
+    def __len__(self):
+        return self.segments.shape[0]
+
+    def overlap(self, test_segments):
+        """Intersection of indexed segments and test segments
+
+        Parameters
+        ----------
+        test_segments : ndarray
+            2-dim array in format [n x 2:=[init, end]]
+
+        Outputs
+        -------
+        rows : ndarray
+            1-dim array with index of indexed segments.
+        cols : ndarray
+            1-dim array with index of test segments.
+        ratio : ndarray
+            1-dim array with ratio btw size of intersection over size of the
+            indexed segment.
+        iou : ndarray
+            1-dim array with IOU ratio.
+
+        Note: Pairs with empty intersection are omitted. They are sorted by
+        cols and rows.
+
+        """
+        if test_segments.ndim != 2:
+            raise ValueError('Dimension of arguments is incorrect')
+        test_segments = test_segments.astype(self.segments.dtype, copy=False)
+        rows, cols = _overlapping_pairs(self.segments, test_segments,
+                                        self._order)
+        idx = np.lexsort([rows, cols])
+        rows, cols = rows[idx], cols[idx]
+        intersection, union = _pair_sizes(self.segments, test_segments, rows,
+                                          cols)
+        return rows, cols, intersection / self.size[rows], intersection / union
+
+    def coverage(self, test_segments, method='iou', i_thr=1.0):
+        """Coverage of indexed segments per test segment
+
+        Parameters
+        ----------
+        test_segments : ndarray
+            2-dim array in format [n x 2:=[init, end]]
+        method : (None, str)
+            'iou': sum of IOU. None: sum of ratio of intersection over size of
+            indexed segments greater or equal than i_thr.
+        i_thr : float, optional
+            Threshold over intersection ratio, see method.
+
+        Outputs
+        -------
+        coverage : ndarray
+            1-dim array of size n.
+
+        """
+        _, cols, ratio, iou = self.overlap(test_segments)
+        if isinstance(method, str):
+            return np.bincount(cols, iou, minlength=test_segments.shape[0])
+        idx = ratio >= i_thr
+        return np.bincount(cols[idx], ratio[idx],
+                           minlength=test_segments.shape[0])
+
+
+def sliding_coverage(segments, t_size, f_init, n_windows, method='iou',
+                     i_thr=1.0):
+    """Coverage of segments per window sliding one frame at a time
+
+    Coverage is computed from the breakpoints of the intersection of each
+    segment with the windows, i.e. it is constant while the window contains
+    the segment (or vice versa) and changes frame by frame on both sides.
+    Constant parts are accumulated with a difference array and only the
+    sides are evaluated, thus the cost is O(n_windows + sum_i min(size_i,
+    t_size)) and no [m x n_windows] array is allocated. Values are those of
+    `IntervalIndex.coverage` up to the summation order.
+
+    Parameters
+    ----------
+    segments : ndarray
+        2-dim array in format [m x 2:=[init, end]]. Boundaries may be
+        fractional.
+    t_size : int
+        Size of the windows.
+    f_init : int
+        Initial frame of the first window.
+    n_windows : int
+        Number of windows, i.e. windows begin at f_init, f_init + 1, ...
+    method : (None, str)
+        'iou': sum of IOU. None: sum of ratio of intersection over size of
+        segments greater or equal than i_thr.
+    i_thr : float, optional
+        Threshold over intersection ratio, see method.
+
+    Outputs
+    -------
+    coverage : ndarray
+        1-dim array of size n_windows.
+
+    """
+    if segments.ndim != 2:
+        raise ValueError('Dimension of arguments is incorrect')
+    n_windows = max(int(n_windows), 0)
+    # Same arithmetic as IntervalIndex
+    dtype = _output_dtype(segments, segments)
+    init = segments[:, 0].astype(dtype)
+    end = segments[:, 1].astype(dtype)
+    size = end - init + 1
+
+    # The intersection is constant for windows beginning in [min(init,
+    # end - t_size + 1), max(init, end - t_size + 1)]. Before, it grows frame
+    # by frame from windows beginning after init - t_size and, after, it
+    # shrinks until windows beginning at end + 1.
+    first, last = f_init, f_init + n_windows - 1
+    flat_lo = np.minimum(init, end - t_size + 1).astype(np.float64)
+    flat_hi = np.maximum(init, end - t_size + 1).astype(np.float64)
+    rise = (np.floor(init - float(t_size)) + 1).clip(first, last + 1)
+    flat_init = np.ceil(flat_lo).clip(first, last + 1)
+    flat_end = np.floor(flat_hi).clip(first - 1, last)
+    fall = (np.ceil(end.astype(np.float64)) + 1).clip(first, last + 1)
+
+    def window_value(idx, s):
+        s = s.astype(dtype)
+        intersection = (np.minimum(end[idx], s + (t_size - 1)) -
+                        np.maximum(init[idx], s) + 1)
+        if isinstance(method, str):
+            return intersection / (size[idx] + t_size - intersection)
+        return intersection / size[idx]
+
+    def counted(value):
+        if isinstance(method, str):
+            return value > 0
+        return (value > 0) & (value >= i_thr)
+
+    coverage = np.zeros(n_windows)
+    # Constant part
+    idx = (flat_init <= flat_end).nonzero()[0]
+    value = window_value(idx, flat_init[idx])
+    keep = counted(value)
+    idx, value = idx[keep], value[keep]
+    if idx.size > 0:
+        lo = (flat_init[idx] - first).astype(int)
+        hi = (flat_end[idx] - first).astype(int) + 1
+        delta = np.bincount(lo, value, minlength=n_windows + 1)
+        delta -= np.bincount(hi, value, minlength=n_windows + 1)
+        count = np.bincount(lo, minlength=n_windows + 1)
+        count -= np.bincount(hi, minlength=n_windows + 1)
+        coverage = np.cumsum(delta[:-1])
+        # Avoid residuals of the cumulative sum out of constant parts
+        coverage[np.cumsum(count[:-1]) == 0] = 0
+
+    # Sides
+    n = init.size
+    lo = np.hstack([rise, np.maximum(flat_end + 1, flat_init)])
+    hi = np.hstack([flat_init, fall])
+    owner, s = _expand_ranges(lo.astype(int), hi.astype(int))
+    if s.size > 0:
+        value = window_value(np.tile(np.arange(n), 2)[owner], s)
+        keep = counted(value)
+        coverage += np.bincount(s[keep] - first, value[keep],
+                                minlength=n_windows)
+    return coverage
+
+
+def _nms_intervals(t1, t2, score, overlap, max_output=None, group=None):
+    """Greedy NMS checking only the intervals that overlap each pick
+
+    Ties in score are picked from the largest index down, i.e. the order of
+    a stable ascending sort scanned from its end.
+
+    Outputs
+    -------
+    pick : ndarray
+        1-dim array with index of selected intervals in selection order.
+
+    """
+    n = score.size
+    if n == 0:
+        return np.empty(0, dtype=int)
+    t1, t2 = t1.astype(float), t2.astype(float)
+    area = t2 - t1 + 1.0
+
+    # Intervals overlapping i begin in (t1[i] - 1 - max_length, t2[i] + 1)
+    order_init = np.argsort(t1, kind='mergesort')
+    init_sorted = t1[order_init]
+    max_length = (t2 - t1).max()
+    lo = np.searchsorted(init_sorted, t1 - 1 - max_length, 'right')
+    hi = np.searchsorted(init_sorted, t2 + 1, 'left')
+
+    # Same tie-breaking than sorting scores in ascending order
+    order_score = np.argsort(score, kind='mergesort')[::-1]
+    if group is None:
+        group, n_groups = np.zeros(n, dtype=int), 1
+    else:
+        n_groups = group.max() + 1
+    n_picks = np.zeros(n_groups, dtype=int)
+    if max_output is None:
+        max_output = n
+    suppressed = np.zeros(n, dtype=bool)
+    pick = []
+    for i in order_score:
+        if suppressed[i] or n_picks[group[i]] >= max_output:
+            continue
+        pick.append(i)
+        n_picks[group[i]] += 1
+        if len(pick) == n_groups * max_output:
+            break
+
+        ind = order_init[lo[i]:hi[i]]
+        tt1 = np.maximum(t1[i], t1[ind])
+        tt2 = np.minimum(t2[i], t2[ind])
+        wh = np.maximum(0., tt2 - tt1 + 1.0)
+        o = wh / (area[i] + area[ind] - wh)
+        suppressed[ind[o > overlap]] = True
+    return np.array(pick, dtype=int)
+
+
+def _soft_nms_intervals(t1, t2, score, overlap, method='linear', sigma=0.5,
+                        max_output=None, group=None, min_score=0.0):
+    """Soft-NMS decaying only the scores of intervals overlapping each pick
+
+    Outputs
+    -------
+    pick : ndarray
+        1-dim array with index of selected intervals in selection order.
+    new_score : ndarray
+        1-dim array with decayed score of the selected intervals.
+
+    """
+    n = score.size
+    if n == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=score.dtype)
+    t1, t2 = t1.astype(float), t2.astype(float)
+    area = t2 - t1 + 1.0
+    order_init = np.argsort(t1, kind='mergesort')
+    init_sorted = t1[order_init]
+    max_length = (t2 - t1).max()
+    lo = np.searchsorted(init_sorted, t1 - 1 - max_length, 'right')
+    hi = np.searchsorted(init_sorted, t2 + 1, 'left')
+
+    if group is None:
+        group, n_groups = np.zeros(n, dtype=int), 1
+    else:
+        n_groups = group.max() + 1
+    n_picks = np.zeros(n_groups, dtype=int)
+    if max_output is None:
+        max_output = n
+
+    # Max-heap of scores. Scores only decay, thus outdated entries are
+    # pushed again with their current score when they are popped.
+    new_score = score.astype(float)
+    heap = zip((-new_score).tolist(), range(n))
+    heapq.heapify(heap)
+    done = np.zeros(n, dtype=bool)
+    pick = []
+    while heap:
+        neg_score, i = heapq.heappop(heap)
+        if done[i]:
+            continue
+        if -neg_score != new_score[i]:
+            heapq.heappush(heap, (-new_score[i], i))
+            continue
+        if new_score[i] < min_score:
+            break
+        done[i] = True
+        if n_picks[group[i]] >= max_output:
+            continue
+        pick.append(i)
+        n_picks[group[i]] += 1
+        if len(pick) == n_groups * max_output:
+            break
+
+        ind = order_init[lo[i]:hi[i]]
+        ind = ind[~done[ind]]
+        tt1 = np.maximum(t1[i], t1[ind])
+        tt2 = np.minimum(t2[i], t2[ind])
+        wh = np.maximum(0., tt2 - tt1 + 1.0)
+        o = wh / (area[i] + area[ind] - wh)
+        if method == 'linear':
+            idx = o > overlap
+            ind, decay = ind[idx], 1 - o[idx]
+        else:
+            idx = o > 0
+            ind, decay = ind[idx], np.exp(-o[idx]**2 / sigma)
+        new_score[ind] *= decay
+    pick = np.array(pick, dtype=int)
+    return pick, new_score[pick].astype(score.dtype)
+
+
+def soft_nms_detections(dets, score, overlap=0.3, method='linear', sigma=0.5,
+                        max_output=None, min_score=0.0):
+    """Soft-NMS: Greedily select high-scoring detections and decay the score
+    of the detections overlapping them.
+
+    Only detections overlapping the selected one are decayed. The next one is
+    taken from a heap, thus the cost is O(n log(n) + p * o) for p selected
+    detections overlapping o detections on average. Use max_output to bound
+    it. On synthetic inputs of 1e5 detections up to 256 frames long over a
+    1e5 frames video, selecting the top 1000 takes about 0.2s (linear) and
+    0.3s (gaussian), while ranking all of them takes 12s and 28s. See
+    tools/benchmark_kernels.py.
+
+    Parameters
+    ----------
+    dets : ndarray.
+        Each row is ['f-init', 'f-end']
+    score : 1darray.
+        Detection score.
+    overlap : float.
+        Overlap ratio over which scores are decayed by method 'linear'.
+    method : str.
+        'linear': score times (1 - overlap). 'gaussian': score times
+        exp(-overlap^2 / sigma).
+    sigma : float.
+        Width of 'gaussian' decay.
+    max_output : int, optional.
+        Stop after selecting this number of detections.
+    min_score : float, optional.
+        Stop when the highest decayed score is lower than this value.
+
+    Outputs
+    -------
+    dets : ndarray.
+        Selected detections sorted by decayed score.
+    score : ndarray.
+        Decayed score of the selected detections.
+    """
+    if method not in ('linear', 'gaussian'):
+        raise ValueError('Unknown soft-nms method {}'.format(method))
+    pick, new_score = _soft_nms_intervals(
+        dets[:, 0], dets[:, 1], score, overlap, method, sigma, max_output,
+        min_score=min_score)
+    return dets[pick, :], new_score
+
+
+def nms_detections(dets, score, overlap=0.3, max_output=None):
     """
     Non-maximum suppression: Greedily select high-scoring detections and
     skip detections that are significantly covered by a previously
     selected detection.
 
-    This version is translated from Matlab code by Tomasz Malisiewicz,
-    who sped up Pedro Felzenszwalb's code.
+    Detections are sorted by initial frame, thus every selected detection is
+    only compared against the ones overlapping it.
+
+    Detections with the same score are selected from the last one to the
+    first one, in the order they are given.
 
     Parameters
     ----------
@@ -139,33 +720,161 @@ def nms_detections(dets, score, overlap=0.3):
         Detection score.
     overlap : float.
         Minimum overlap ratio (0.3 default).
+    max_output : int, optional.
+        Stop after selecting this number of detections.
 
     Outputs
     -------
     dets : ndarray.
         Remaining after suppression.
     """
-    t1 = dets[:, 0]
-    t2 = dets[:, 1]
-    ind = np.argsort(score)
+    pick = _nms_intervals(dets[:, 0], dets[:, 1], score, overlap, max_output)
+    return dets[pick, :], score[pick]
 
-    area = (t2 - t1 + 1).astype(float)
 
-    pick = []
-    while len(ind) > 0:
-        i = ind[-1]
-        pick.append(i)
-        ind = ind[:-1]
+def _group_offsets(group, n_groups, t1, t2):
+    """Shift of each group placing them on disjoint intervals of a timeline
+    """
+    offset = np.zeros(n_groups)
+    if group.size == 0:
+        return offset
+    start = _reduce_by_key(group, t1, n_groups, np.minimum, np.inf)
+    end = _reduce_by_key(group, t2, n_groups, np.maximum, -np.inf)
+    # Groups without segments take no room
+    empty = np.isinf(start)
+    start[empty], end[empty] = 0, -2
+    offset = np.hstack([0, np.cumsum(end - start + 2)[:-1]]) - start
+    return offset
 
-        tt1 = np.maximum(t1[i], t1[ind])
-        tt2 = np.minimum(t2[i], t2[ind])
 
-        wh = np.maximum(0., tt2 - tt1 + 1.0)
-        o = wh / (area[i] + area[ind] - wh)
+def grouped_iou_matching(target_ids, target_segments, test_ids,
+                         test_segments, dtype=None, return_test=False):
+    """Best matches among the segments of many videos in a single call
 
-        ind = ind[np.nonzero(o <= overlap)[0]]
+    Segments of each video are shifted onto disjoint intervals of a common
+    timeline, thus overlapping pairs are found sorting all the segments once
+    as `iou_sparse` does. Pairs of different videos never overlap.
 
-    return dets[pick, :], score[pick]
+    Parameters
+    ----------
+    target_ids : ndarray
+        1-dim array of size m with video of each target segment, e.g.
+        ground-truth.
+    target_segments : ndarray
+        2-dim array in format [m x 2:=[init, end]]
+    test_ids : ndarray
+        1-dim array of size n with video of each test segment, e.g.
+        proposals.
+    test_segments : ndarray
+        2-dim array in format [n x 2:=[init, end]]
+    dtype : numpy.dtype, optional
+        Type of iou values. By default, float32 for float32 segments and
+        float64 otherwise.
+    return_test : bool, optional
+        Return one extra output (test_iou).
+
+    Outputs
+    -------
+    target_iou : ndarray
+        1-dim array of size m with best IOU of each target segment.
+    target_argmax : ndarray
+        1-dim array of size m with index of the test segment achieving the
+        best IOU, the smallest one in case of ties. It is -1 for target
+        segments without overlapping test segments.
+    test_iou : ndarray
+        1-dim array of size n with best IOU of each test segment.
+
+    """
+    if target_segments.ndim != 2 or test_segments.ndim != 2:
+        raise ValueError('Dimension of arguments is incorrect')
+    target_ids, test_ids = np.asarray(target_ids), np.asarray(test_ids)
+    m, n = target_segments.shape[0], test_segments.shape[0]
+    if target_ids.shape != (m,) or test_ids.shape != (n,):
+        raise ValueError('A video id is required per segment')
+    dtype = _output_dtype(target_segments, test_segments, dtype)
+    target_segments = target_segments.astype(dtype, copy=False)
+    test_segments = test_segments.astype(dtype, copy=False)
+
+    _, group = np.unique(np.hstack([target_ids, test_ids]),
+                         return_inverse=True)
+    t1 = np.hstack([target_segments[:, 0], test_segments[:, 0]])
+    t2 = np.hstack([target_segments[:, 1], test_segments[:, 1]])
+    offset = _group_offsets(group, group.max() + 1 if group.size else 0,
+                            t1.astype(float), t2.astype(float))
+    shifted = np.stack([t1 + offset[group], t2 + offset[group]], axis=-1)
+    rows, cols = _overlapping_pairs(shifted[:m, :], shifted[m:, :])
+
+    # Sizes come from the original segments to avoid rounding of the shift
+    intersection, union = _pair_sizes(target_segments, test_segments, rows,
+                                      cols)
+    iou = (intersection.clip(0) / union).astype(dtype, copy=False)
+    target_iou, target_argmax = sparse_row_max(rows, cols, iou, m)
+    if return_test:
+        test_iou = _reduce_by_key(cols, iou, n, np.maximum, 0)
+        return target_iou, target_argmax, test_iou
+    return target_iou, target_argmax
+
+
+def nms_batch(video_ids, dets, score, overlap=0.3, max_output=None,
+              method='hard', sigma=0.5, min_score=0.0):
+    """Non-maximum suppression of the detections of several videos
+
+    Parameters
+    ----------
+    video_ids : ndarray.
+        1-dim array with video of each detection.
+    dets : ndarray.
+        Each row is ['f-init', 'f-end']
+    score : 1darray.
+        Detection score.
+    overlap : float.
+        Minimum overlap ratio (0.3 default).
+    max_output : int, optional.
+        Maximum number of detections per video.
+    method : str, optional.
+        'hard' for `nms_detections`, 'linear' or 'gaussian' for
+        `soft_nms_detections`.
+    sigma : float, optional.
+        Width of 'gaussian' decay.
+    min_score : float, optional.
+        Minimum decayed score of soft-nms.
+
+    Outputs
+    -------
+    keep : ndarray.
+        1-dim array with index of remaining detections. Videos are sorted by
+        first appearance and their detections by selection order, i.e. as
+        calling nms_detections for each video.
+    score : ndarray.
+        1-dim array with score of remaining detections, decayed by soft-nms.
+
+    """
+    if method not in ('hard', 'linear', 'gaussian'):
+        raise ValueError('Unknown nms method {}'.format(method))
+    video_ids = np.asarray(video_ids)
+    if video_ids.size != score.size or dets.shape[0] != score.size:
+        raise ValueError('Inconsistent number of detections')
+    _, first, group = np.unique(video_ids, return_index=True,
+                                return_inverse=True)
+    # Rank of videos by first appearance
+    rank = np.empty(first.size, dtype=int)
+    rank[np.argsort(first)] = np.arange(first.size)
+    group = rank[group]
+
+    # Shift videos onto disjoint intervals of a common timeline
+    t1, t2 = dets[:, 0].astype(float), dets[:, 1].astype(float)
+    offset = _group_offsets(group, first.size, t1, t2)
+    t1, t2 = t1 + offset[group], t2 + offset[group]
+
+    if method == 'hard':
+        pick = _nms_intervals(t1, t2, score, overlap, max_output, group)
+        new_score = score[pick]
+    else:
+        pick, new_score = _soft_nms_intervals(
+            t1, t2, score, overlap, method, sigma, max_output, group,
+            min_score)
+    idx = np.argsort(group[pick], kind='mergesort')
+    return pick[idx], new_score[idx]
 
 
 def unit_scaling(X, T, init=None, copy=False):
@@ -200,3 +909,120 @@ def unit_scaling(X, T, init=None, copy=False):
     Y[:, 0] /= T - 1
     Y[:, 1] /= T
     return Y
+
+
+class SegmentArray(object):
+    """Temporal segments of one or many videos
+
+    Attributes
+    ----------
+    data : ndarray
+        [n x 2] array with segments.
+    fmt : str
+        Format of data: 'b' [f-init, f-end], 'c' [center, duration] or 'd'
+        [f-init, n-frames].
+    video_ids : ndarray
+        1-dim array of size n with video of each segment or None.
+
+    """
+    FORMATS = ('b', 'c', 'd')
+
+    def __init__(self, data, fmt='b', video_ids=None, dtype=None,
+                 copy=False):
+        self.data = np.array(data, dtype=dtype, copy=copy)
+        if self.data.ndim != 2 or self.data.shape[1] != 2:
+            raise ValueError('data must be a [n x 2] array')
+        if fmt not in self.FORMATS:
+            raise ValueError('Unknown format {}'.format(fmt))
+        if video_ids is not None:
+            video_ids = np.asarray(video_ids)
+            if video_ids.shape != (self.data.shape[0],):
+                raise ValueError('A video id is required per segment')
+        self.fmt, self.video_ids = fmt, video_ids
+
+    @classmethod
+    def from_dataframe(cls, df, columns=('f-init', 'n-frames'), fmt='d',
+                       video_column='video-name', dtype=np.int32):
+        """Segments of a table such as `daps.datasets.Dataset.segments_info`
+        """
+        video_ids = None
+        if video_column is not None:
+            video_ids = df[video_column].values
+        return cls(df.loc[:, list(columns)].values, fmt, video_ids,
+                   dtype=dtype)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, idx):
+        """Segments selected by idx. Slices are views of data."""
+        video_ids = self.video_ids
+        if video_ids is not None:
+            video_ids = video_ids[idx]
+        return SegmentArray(self.data[idx, :], self.fmt, video_ids)
+
+    def convert(self, fmt, out=None, inplace=False):
+        """Change format of the segments
+
+        Parameters
+        ----------
+        fmt : str
+            Target format, see `SegmentArray.FORMATS`.
+        out : ndarray, optional
+            [n x 2] array to place converted segments.
+        inplace : bool, optional
+            Overwrite data. Integer types are only suitable between 'b' and
+            'd' formats.
+
+        Outputs
+        -------
+        segments : SegmentArray
+            Converted segments. It is self when inplace is True and data is
+            returned unchanged when fmt is the current format.
+
+        """
+        if fmt not in self.FORMATS:
+            raise ValueError('Unknown format {}'.format(fmt))
+        if inplace:
+            out = self.data
+        if fmt == self.fmt:
+            if out is not None and out is not self.data:
+                out[...] = self.data
+            data = self.data if out is None else out
+        elif self.fmt == 'b' or fmt == 'b':
+            data = format(self.data, '{}2{}'.format(self.fmt, fmt), out=out)
+        else:
+            # Segments go through boundary format
+            data = format(format(self.data, '{}2b'.format(self.fmt)),
+                          'b2{}'.format(fmt), out=out)
+        if inplace:
+            self.fmt = fmt
+            return self
+        return SegmentArray(data, fmt, self.video_ids)
+
+    def boundaries(self):
+        """[n x 2] array in format [f-init, f-end], a view if possible."""
+        return self.convert('b').data
+
+    def groupby_video(self):
+        """Iterate over (video_id, segments) of each video
+
+        Segments of a video are a view of data if they are contiguous.
+        """
+        if self.video_ids is None:
+            raise ValueError('Segments without video ids')
+        if len(self) == 0:
+            return
+        change = np.flatnonzero(self.video_ids[1:] != self.video_ids[:-1])
+        edges = np.hstack([0, change + 1, len(self)])
+        if np.unique(self.video_ids[edges[:-1]]).size == edges.size - 1:
+            for i, j in zip(edges[:-1], edges[1:]):
+                yield self.video_ids[i], self[i:j]
+            return
+        _, first, inverse = np.unique(self.video_ids, return_index=True,
+                                      return_inverse=True)
+        order = np.argsort(inverse, kind='mergesort')
+        end = np.cumsum(np.bincount(inverse))
+        start = end - np.bincount(inverse)
+        for k in np.argsort(first):
+            yield self.video_ids[first[k]], self[order[start[k]:end[k]]]
@@ -10,6 +10,51 @@ class test_segment_utilities(unittest.TestCase):
         a = np.array([[10, 3]])
         res = np.array([[10, 12]])
         np.testing.assert_array_equal(segment.format(a, 'd2b'), res)
+        np.testing.assert_array_equal(segment.format(res, 'b2d'), a)
+        b = np.array([[10.5, 5], [20, 4]])
+        c = segment.format(b, 'c2b')
+        np.testing.assert_array_equal(c, [[8, 12], [18, 21]])
+        # In-place transformation
+        self.assertTrue(segment.format(c, 'b2c', out=c) is c)
+        np.testing.assert_array_equal(c, [[10, 5], [20, 4]])
+        out = np.empty((1, 2), dtype=np.int32)
+        segment.format(a, 'd2b', out=out)
+        np.testing.assert_array_equal(out, res)
+        self.assertRaises(ValueError, segment.format, a, 'c2d')
+        self.assertRaises(ValueError, segment.format, a[0], 'd2b')
+
+    def test_segment_array(self):
+        a = np.array([[10, 3], [0, 5], [20, 1], [4, 4]])
+        video_ids = np.array(['x', 'x', 'y', 'z'])
+        seg = segment.SegmentArray(a, 'd', video_ids, dtype=np.int32)
+        self.assertEqual(4, len(seg))
+        b = seg.convert('b')
+        np.testing.assert_array_equal(b.data, segment.format(a, 'd2b'))
+        np.testing.assert_array_equal(b.convert('d').data, a)
+        c = seg.convert('c')
+        self.assertEqual('c', c.fmt)
+        np.testing.assert_array_equal(
+            c.data, segment.format(segment.format(a, 'd2b'), 'b2c'))
+        # In-place conversions and slices reuse memory
+        data = seg.data
+        self.assertTrue(seg.convert('b', inplace=True) is seg)
+        self.assertTrue(seg.data is data)
+        self.assertEqual(np.int32, seg.data.dtype)
+        self.assertTrue(np.may_share_memory(seg[1:3].data, data))
+        self.assertTrue(seg.boundaries() is data)
+        groups = list(seg.groupby_video())
+        self.assertEqual(['x', 'y', 'z'], [i for i, _ in groups])
+        for _, i in groups:
+            self.assertTrue(np.may_share_memory(i.data, data))
+        np.testing.assert_array_equal(groups[0][1].data, data[:2])
+        # Non-contiguous videos keep order of first appearance
+        seg.video_ids = np.array(['y', 'x', 'y', 'x'])
+        groups = list(seg.groupby_video())
+        self.assertEqual(['y', 'x'], [i for i, _ in groups])
+        np.testing.assert_array_equal(groups[0][1].data, data[[0, 2]])
+        np.testing.assert_array_equal(groups[1][1].video_ids, ['x', 'x'])
+        self.assertRaises(ValueError, segment.SegmentArray, a, 'e')
+        self.assertRaises(ValueError, segment.SegmentArray, a, 'b', ['x'])
 
     def test_intersection(self):
         a = np.random.rand(1)
@@ -43,9 +88,255 @@ class test_segment_utilities(unittest.TestCase):
         # segment to right
         self.assertEqual(6/15.0, rst[2, 3])
 
-    @unittest.skip("A contribution is required")
+    def test_tiled_kernels(self):
+        rng = np.random.RandomState(0)
+        a = np.sort(rng.randint(0, 100, (7, 2)), axis=1)
+        b = np.sort(rng.randint(0, 100, (50, 2)), axis=1)
+        # Reference computed one target segment at a time
+        gt_isegs = np.stack([np.maximum(a[:, :1], b[:, 0]),
+                             np.minimum(a[:, 1:], b[:, 1])], axis=-1)
+        i_size = (gt_isegs[..., 1] - gt_isegs[..., 0] + 1.0).clip(0)
+        gt_ratio = i_size / (a[:, 1:] - a[:, :1] + 1.0)
+        gt_iou = i_size / ((a[:, 1:] - a[:, :1] + 1.0) +
+                           (b[:, 1] - b[:, 0] + 1.0) - i_size)
+        for budget in [None, 1, 50 * 8 * 3]:
+            for dtype in [np.int32, np.float32, np.float64]:
+                x, y = a.astype(dtype), b.astype(dtype)
+                rst = segment.iou(x, y, memory_budget=budget)
+                self.assertEqual(np.float32 if dtype == np.float32 else
+                                 np.float64, rst.dtype)
+                np.testing.assert_allclose(gt_iou, rst, rtol=1e-6)
+                isegs, ratio = segment.intersection(x, y, True,
+                                                    memory_budget=budget)
+                np.testing.assert_array_equal(gt_isegs, isegs)
+                np.testing.assert_allclose(gt_ratio, ratio, rtol=1e-6)
+                ratio = segment.intersection(x, y, ratio_only=True,
+                                             dtype=np.float32,
+                                             memory_budget=budget)
+                self.assertEqual(np.float32, ratio.dtype)
+                np.testing.assert_allclose(gt_ratio, ratio, rtol=1e-6)
+        self.assertRaises(ValueError, segment.iou, a, b, np.int32)
+
+    def test_iou_sparse(self):
+        rng = np.random.RandomState(0)
+        for dtype in [np.int32, np.float64]:
+            a = np.sort(rng.randint(0, 100, (20, 2)), axis=1).astype(dtype)
+            b = np.sort(rng.randint(0, 100, (50, 2)), axis=1).astype(dtype)
+            if dtype == np.float64:
+                a += rng.rand(*a.shape) / 2
+            dense = segment.iou(a, b)
+            rows, cols, values = segment.iou_sparse(a, b)
+            self.assertEqual((dense > 0).sum(), values.size)
+            self.assertTrue((values > 0).all())
+            rst = np.zeros(dense.shape)
+            rst[rows, cols] = values
+            np.testing.assert_array_almost_equal(dense, rst)
+            order = np.lexsort([cols, rows])
+            np.testing.assert_array_equal(np.arange(rows.size), order)
+
+            max_value, argmax = segment.sparse_row_max(rows, cols, values,
+                                                       a.shape[0] + 1)
+            np.testing.assert_array_almost_equal(dense.max(axis=1),
+                                                 max_value[:-1])
+            np.testing.assert_array_equal(dense.argmax(axis=1), argmax[:-1])
+            self.assertEqual(-1, argmax[-1])
+            self.assertEqual(0, max_value[-1])
+
+        # segments touching at the boundaries do not overlap
+        a, b = np.array([[1, 10]]), np.array([[11, 20], [10, 20], [-5, 0]])
+        rows, cols, values = segment.iou_sparse(a, b)
+        np.testing.assert_array_equal([1], cols)
+        rst = segment.iou_sparse(np.empty((0, 2)), b)
+        self.assertEqual(0, rst[2].size)
+        rst = segment.sparse_row_max(*(rst + (3,)))
+        np.testing.assert_array_equal([-1, -1, -1], rst[1])
+
+    def test_grouped_iou_matching(self):
+        rng = np.random.RandomState(0)
+        for dtype in [np.int32, np.float32, np.float64]:
+            a = np.sort(rng.randint(0, 100, (30, 2)), axis=1).astype(dtype)
+            b = np.sort(rng.randint(0, 100, (80, 2)), axis=1).astype(dtype)
+            a_ids = rng.choice(['x', 'y', 'z'], 30)
+            b_ids = rng.choice(['x', 'y', 'w'], 80)
+            iou_a, argmax_a, iou_b = segment.grouped_iou_matching(
+                a_ids, a, b_ids, b, return_test=True)
+            self.assertEqual(segment.iou(a, b).dtype, iou_a.dtype)
+            # Reference computed one video at a time
+            dense = segment.iou(a, b)
+            dense[a_ids[:, np.newaxis] != b_ids] = 0
+            np.testing.assert_array_equal(dense.max(axis=1), iou_a)
+            np.testing.assert_array_equal(dense.max(axis=0), iou_b)
+            exp_argmax = np.where(dense.max(axis=1) > 0,
+                                  dense.argmax(axis=1), -1)
+            np.testing.assert_array_equal(exp_argmax, argmax_a)
+            self.assertTrue((argmax_a[a_ids == 'z'] == -1).all())
+        rst = segment.grouped_iou_matching([], np.empty((0, 2)), ['x'], b[:1],
+                                           return_test=True)
+        self.assertEqual([0, 0, 1], [i.size for i in rst])
+        self.assertRaises(ValueError, segment.grouped_iou_matching, a_ids[1:],
+                          a, b_ids, b)
+
+    def test_interval_index(self):
+        rng = np.random.RandomState(0)
+        a = np.sort(rng.randint(0, 1000, (30, 2)), axis=1)
+        b = np.sort(rng.randint(0, 1000, (200, 2)), axis=1)
+        index = segment.IntervalIndex(a)
+        self.assertEqual(30, len(index))
+        rows, cols, ratio, iou = index.overlap(b)
+        isegs, exp_ratio = segment.intersection(a, b, True)
+        exp_iou = segment.iou(a, b)
+        mask = isegs[:, :, 1] >= isegs[:, :, 0]
+        self.assertEqual(mask.sum(), rows.size)
+        np.testing.assert_array_equal(np.arange(rows.size),
+                                      np.lexsort([rows, cols]))
+        np.testing.assert_array_almost_equal(exp_ratio[rows, cols], ratio)
+        np.testing.assert_array_almost_equal(exp_iou[rows, cols], iou)
+
+        np.testing.assert_array_almost_equal(exp_iou.sum(axis=0),
+                                             index.coverage(b))
+        exp_ratio[exp_ratio < 0.5] = 0
+        np.testing.assert_array_almost_equal(
+            exp_ratio.sum(axis=0), index.coverage(b, None, 0.5))
+        self.assertRaises(ValueError, segment.IntervalIndex, np.arange(3))
+
+    def test_sliding_coverage(self):
+        rng = np.random.RandomState(0)
+        for dtype in [np.int32, np.float64, np.float32]:
+            f_init = rng.randint(0, 1000, 10)
+            a = np.stack([f_init, f_init + rng.randint(0, 300, 10)],
+                         axis=-1).astype(dtype)
+            if dtype != np.int32:
+                # Fractional boundaries
+                a += rng.rand(*a.shape).astype(dtype)
+            windows = np.arange(-20, 1200)
+            windows = np.stack([windows, windows + 63], axis=-1)
+            index = segment.IntervalIndex(a)
+            for method, i_thr in [('iou', 1.0), (None, 0.5), (None, 1.0),
+                                  (None, 0.25)]:
+                rst = segment.sliding_coverage(a, 64, -20, 1220, method,
+                                               i_thr)
+                self.assertEqual((1220,), rst.shape)
+                np.testing.assert_allclose(
+                    index.coverage(windows, method, i_thr), rst, rtol=1e-6)
+        # Fractional annotation straddling window boundaries
+        a = np.array([[391.43, 432.14]])
+        windows = np.arange(775 - 64 + 1)
+        windows = np.stack([windows, windows + 63], axis=-1)
+        for method, i_thr in [('iou', 1.0), (None, 0.5)]:
+            np.testing.assert_allclose(
+                segment.IntervalIndex(a).coverage(windows, method, i_thr),
+                segment.sliding_coverage(a, 64, 0, windows.shape[0], method,
+                                         i_thr))
+        self.assertEqual(0, segment.sliding_coverage(a, 64, 0, 0).size)
+        np.testing.assert_array_equal(
+            np.zeros(5), segment.sliding_coverage(a[:0], 64, 0, 5))
+
     def test_nms_detection(self):
-        pass
+        def reference_nms(dets, score, overlap):
+            # Greedy NMS against every remaining detection
+            t1, t2 = dets[:, 0], dets[:, 1]
+            area = (t2 - t1 + 1).astype(float)
+            ind = np.argsort(score, kind='mergesort')
+            pick = []
+            while len(ind) > 0:
+                i, ind = ind[-1], ind[:-1]
+                pick.append(i)
+                wh = np.maximum(0., np.minimum(t2[i], t2[ind]) -
+                                np.maximum(t1[i], t1[ind]) + 1.0)
+                o = wh / (area[i] + area[ind] - wh)
+                ind = ind[np.nonzero(o <= overlap)[0]]
+            return pick
+
+        rng = np.random.RandomState(0)
+        f_init = rng.randint(0, 1000, 200)
+        dets = np.stack([f_init, f_init + rng.randint(1, 300, 200)], axis=-1)
+        score = rng.rand(200)
+        for overlap in [0.0, 0.3, 0.65, 1.0]:
+            pick = reference_nms(dets, score, overlap)
+            rst_dets, rst_score = segment.nms_detections(dets, score, overlap)
+            np.testing.assert_array_equal(dets[pick, :], rst_dets)
+            np.testing.assert_array_equal(score[pick], rst_score)
+            rst = segment.nms_detections(dets, score, overlap, max_output=5)
+            np.testing.assert_array_equal(score[pick[:5]], rst[1])
+
+        # Ties are picked from the last detection to the first one
+        dets_tie = np.array([[0, 10], [20, 30], [2, 10], [40, 50], [21, 30]])
+        score_tie = np.array([0.5, 0.5, 0.5, 0.9, 0.5])
+        np.testing.assert_array_equal(
+            dets_tie[[3, 4, 2], :],
+            segment.nms_detections(dets_tie, score_tie, 0.5)[0])
+        score_tie = np.round(score, 1)
+        for overlap in [0.3, 0.65]:
+            pick = reference_nms(dets, score_tie, overlap)
+            rst_dets, _ = segment.nms_detections(dets, score_tie, overlap)
+            np.testing.assert_array_equal(dets[pick, :], rst_dets)
+
+        # Batch of videos with overlapping frames across videos
+        video_ids = rng.choice(['b', 'a', 'c'], 200)
+        keep, rst = segment.nms_batch(video_ids, dets, score, 0.3,
+                                      max_output=7)
+        np.testing.assert_array_equal(score[keep], rst)
+        expected = []
+        # Videos are sorted by first appearance
+        first = np.unique(video_ids, return_index=True)[1]
+        for v in video_ids[np.sort(first)]:
+            idx = (video_ids == v).nonzero()[0]
+            pick = reference_nms(dets[idx, :], score[idx], 0.3)
+            expected += idx[pick[:7]].tolist()
+        np.testing.assert_array_equal(expected, keep)
+        self.assertEqual(0, segment.nms_batch([], np.empty((0, 2)),
+                                              np.empty(0))[0].size)
+        self.assertRaises(ValueError, segment.nms_batch, ['a'], dets, score)
+
+    def test_soft_nms_detections(self):
+        def reference_soft_nms(dets, score, overlap, method, sigma):
+            # Select the max score and decay all the remaining ones
+            score, ind = score.astype(float), np.arange(score.size)
+            pick, pick_score = [], []
+            while len(ind) > 0:
+                k = score[ind].argmax()
+                i = ind[k]
+                pick.append(i)
+                pick_score.append(score[i])
+                ind = np.delete(ind, k)
+                o = segment.iou(dets[i:i + 1, :], dets[ind, :])[0, :]
+                if method == 'linear':
+                    score[ind] *= np.where(o > overlap, 1 - o, 1)
+                else:
+                    score[ind] *= np.exp(-o**2 / sigma)
+            return np.array(pick), np.array(pick_score)
+
+        rng = np.random.RandomState(0)
+        f_init = rng.randint(0, 1000, 150)
+        dets = np.stack([f_init, f_init + rng.randint(1, 300, 150)], axis=-1)
+        score = rng.rand(150)
+        for method in ['linear', 'gaussian']:
+            pick, exp_score = reference_soft_nms(dets, score, 0.3, method,
+                                                 0.5)
+            rst = segment.soft_nms_detections(dets, score, 0.3, method)
+            np.testing.assert_array_equal(dets[pick, :], rst[0])
+            np.testing.assert_array_almost_equal(exp_score, rst[1])
+            rst = segment.soft_nms_detections(dets, score, 0.3, method,
+                                              max_output=10)
+            np.testing.assert_array_almost_equal(exp_score[:10], rst[1])
+            rst = segment.soft_nms_detections(dets, score, 0.3, method,
+                                              min_score=0.5)
+            self.assertEqual((exp_score >= 0.5).sum(), rst[1].size)
+
+            video_ids = rng.choice(['a', 'b'], 150)
+            keep, rst = segment.nms_batch(video_ids, dets, score, 0.3, 5,
+                                          method)
+            first = np.unique(video_ids, return_index=True)[1]
+            for i, v in enumerate(video_ids[np.sort(first)]):
+                idx = (video_ids == v).nonzero()[0]
+                pick, exp_score = reference_soft_nms(
+                    dets[idx, :], score[idx], 0.3, method, 0.5)
+                np.testing.assert_array_equal(idx[pick[:5]],
+                                              keep[i * 5:(i + 1) * 5])
+                np.testing.assert_array_almost_equal(exp_score[:5],
+                                                     rst[i * 5:(i + 1) * 5])
+        self.assertRaises(ValueError, segment.soft_nms_detections, dets,
+                          score, 0.3, 'hard')
 
     def test_unit_scaling(self):
         a = np.random.rand(1)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+
+Benchmark of the segment kernels of daps.utils.segment against the reference
+implementations looping over target segments. Inputs mimic the calls of
+daps.data_generation.generate_segments: few annotations against every window
+of a long video.
+
+It also times hard and soft NMS over random proposals of a single video.
+
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from daps.utils import segment
+
+
+def loop_intersection(target_segments, test_segments):
+    """Reference implementation of segment.intersection"""
+    m, n = target_segments.shape[0], test_segments.shape[0]
+    ratio_target = np.zeros((m, n))
+    intersect = np.zeros((m, n, 2))
+    for i in xrange(m):
+        target_size = target_segments[i, 1] - target_segments[i, 0] + 1.0
+        tt1 = np.maximum(target_segments[i, 0], test_segments[:, 0])
+        tt2 = np.minimum(target_segments[i, 1], test_segments[:, 1])
+        intersect[i, :, 0], intersect[i, :, 1] = tt1, tt2
+        isegs_size = (tt2 - tt1 + 1.0).clip(0)
+        ratio_target[i, :] = isegs_size / target_size
+    return intersect, ratio_target
+
+
+def loop_iou(target_segments, test_segments):
+    """Reference implementation of segment.iou"""
+    m, n = target_segments.shape[0], test_segments.shape[0]
+    iou = np.empty((m, n))
+    for i in xrange(m):
+        tt1 = np.maximum(target_segments[i, 0], test_segments[:, 0])
+        tt2 = np.minimum(target_segments[i, 1], test_segments[:, 1])
+        intersection = (tt2 - tt1 + 1.0).clip(0)
+        union = ((test_segments[:, 1] - test_segments[:, 0] + 1) +
+                 (target_segments[i, 1] - target_segments[i, 0] + 1) -
+                 intersection)
+        iou[i, :] = intersection / union
+    return iou
+
+
+def random_segments(n_targets, l_size, t_size, rng):
+    f_init = rng.randint(0, l_size - t_size, n_targets)
+    n_frames = rng.randint(1, t_size + 1, n_targets)
+    annotations = np.stack([f_init, f_init + n_frames - 1], axis=-1)
+    f_init = np.arange(1, l_size - t_size)
+    windows = np.stack([f_init, f_init + t_size - 1], axis=-1)
+    return annotations, windows
+
+
+def random_proposals(n_proposals, l_size, max_length, rng):
+    f_init = rng.randint(0, l_size, n_proposals)
+    n_frames = rng.randint(16, max_length + 1, n_proposals)
+    proposals = np.stack([f_init, f_init + n_frames - 1], axis=-1)
+    return proposals, rng.rand(n_proposals)
+
+
+def best_time(fn, n_repeats, *args, **kwargs):
+    elapsed = []
+    for _ in range(n_repeats):
+        start_time = time.time()
+        rst = fn(*args, **kwargs)
+        elapsed.append(time.time() - start_time)
+    return min(elapsed), rst
+
+
+def input_parser():
+    description = ('Time IOU and intersection of segments against the '
+                   'reference loops.')
+    p = argparse.ArgumentParser(
+        description=description,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('-o', '--output', default='benchmark_kernels.json',
+                   help='json file with results.')
+    p.add_argument('-nt', '--n_targets', type=int, nargs='+',
+                   default=[1, 10, 100], help='Number of annotations.')
+    p.add_argument('-l', '--l_size', type=int, nargs='+',
+                   default=[10000, 100000], help='Number of video frames.')
+    p.add_argument('-t', '--T', type=int, default=512,
+                   help='Size of the temporal windows.')
+    p.add_argument('-mb', '--memory_budget', type=float, default=None,
+                   help='MB of temporary arrays of tiled kernels.')
+    p.add_argument('-np', '--n_proposals', type=int, default=100000,
+                   help='Number of proposals for NMS, 0 to skip it.')
+    p.add_argument('-mo', '--max_output', type=int, nargs='+',
+                   default=[1000, 0],
+                   help='Budget of NMS. 0 means all the proposals.')
+    p.add_argument('-nr', '--n_repeats', type=int, default=3,
+                   help='Number of repetitions, best time is reported.')
+    p.add_argument('-rng', '--rng_seed', type=int, default=0,
+                   help='Seed for random number generation.')
+    return p
+
+
+def main(output, n_targets, l_size, T=512, memory_budget=None,
+         n_proposals=100000, max_output=(1000, 0), n_repeats=3, rng_seed=0):
+    rng = np.random.RandomState(rng_seed)
+    if memory_budget is not None:
+        memory_budget = int(memory_budget * 1024**2)
+    results = []
+    print '{:>6} {:>8} {:>8} {:>10} {:>10} {:>10}'.format(
+        'm', 'n', 'dtype', 'kernel', 'loop(s)', 'tiled(s)')
+    for l in l_size:
+        for m in n_targets:
+            a, b = random_segments(m, l, T, rng)
+            t_loop_iou, ref_iou = best_time(loop_iou, n_repeats, a, b)
+            t_loop_int, ref_int = best_time(loop_intersection, n_repeats,
+                                            a, b)
+            for dtype in [np.int32, np.float32, np.float64]:
+                x, y = a.astype(dtype), b.astype(dtype)
+                t_iou, rst_iou = best_time(segment.iou, n_repeats, x, y,
+                                           memory_budget=memory_budget)
+                t_int, rst_int = best_time(
+                    segment.intersection, n_repeats, x, y, True,
+                    memory_budget=memory_budget)
+                t_ratio, rst_ratio = best_time(
+                    segment.intersection, n_repeats, x, y, ratio_only=True,
+                    memory_budget=memory_budget)
+                rows = [('iou', t_loop_iou, t_iou,
+                         np.abs(ref_iou - rst_iou).max()),
+                        ('intersect', t_loop_int, t_int,
+                         np.abs(ref_int[1] - rst_int[1]).max()),
+                        ('ratio', t_loop_int, t_ratio,
+                         np.abs(ref_int[1] - rst_ratio).max())]
+                for kernel, t_ref, t_new, max_err in rows:
+                    results.append({'m': m, 'n': b.shape[0],
+                                    'dtype': np.dtype(dtype).name,
+                                    'kernel': kernel, 'loop_time': t_ref,
+                                    'tiled_time': t_new,
+                                    'max_abs_error': float(max_err)})
+                    print '{:>6} {:>8} {:>8} {:>10} {:10.4f} {:10.4f}'.format(
+                        m, b.shape[0], np.dtype(dtype).name, kernel, t_ref,
+                        t_new)
+
+    nms_results = []
+    if n_proposals > 0:
+        proposals, score = random_proposals(n_proposals, n_proposals, T,
+                                            rng)
+        print '{:>8} {:>10} {:>10} {:>10}'.format('n', 'method', 'budget',
+                                                  'time(s)')
+    for budget in max_output if n_proposals > 0 else []:
+        for method in ['hard', 'linear', 'gaussian']:
+            if method == 'hard':
+                fn, args = segment.nms_detections, (proposals, score, 0.65,
+                                                    budget or None)
+            else:
+                fn = segment.soft_nms_detections
+                args = (proposals, score, 0.65, method, 0.5, budget or None)
+            t_nms, rst = best_time(fn, 1, *args)
+            nms_results.append({'n': n_proposals, 'method': method,
+                                'max_output': budget, 'time': t_nms,
+                                'n_outputs': rst[1].size})
+            print '{:>8} {:>10} {:>10} {:10.4f}'.format(
+                n_proposals, method, budget, t_nms)
+
+    config = dict(T=T, memory_budget=memory_budget, n_repeats=n_repeats,
+                  rng_seed=rng_seed)
+    with open(output, 'w') as fobj:
+        json.dump({'config': config, 'results': results,
+                   'nms': nms_results}, fobj, sort_keys=True, indent=4)
+    print 'Results saved on {}'.format(output)
+
+
+if __name__ == '__main__':
+    p = input_parser()
+    args = vars(p.parse_args())
+    main(**args)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+"""
+
+Benchmark of the DAPs pipeline on synthetic data. It does not require the
+C3D features of any dataset thus it runs on CPU-only machines.
+
+Stages: compute_priors, create_dataset, training, retrieve_proposals
+(per-video and batched) and wrapper_nms. Timings are dumped on a json file.
+
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+
+import h5py
+import numpy as np
+import pandas as pd
+
+import create_dataset
+from daps_detection import wrapper_nms
+from daps.data_generation import compute_priors, dump_files
+
+
+def synthetic_annotations(n_videos=50, min_frames=1000, max_frames=5000,
+                          n_instances=5, min_length=30, max_length=600,
+                          rng_seed=None):
+    """Create a table of random annotations.
+
+    Outputs
+    -------
+    df : DataFrame
+        Table with columns daps.data_generation.REQ_INFO_CP.
+
+    """
+    rng = np.random.RandomState(rng_seed)
+    video_frames = rng.randint(min_frames, max_frames + 1, n_videos)
+    df = []
+    for i, l_size in enumerate(video_frames):
+        n = rng.randint(1, n_instances + 1)
+        n_frames = rng.randint(min_length, min(max_length, l_size) + 1, n)
+        f_init = (rng.rand(n) * (l_size - n_frames)).astype(int)
+        df.append(pd.DataFrame({'video-name': 'video_{:05d}'.format(i),
+                                'video-frames': l_size, 'f-init': f_init,
+                                'n-frames': n_frames}))
+    return pd.concat(df, ignore_index=True)
+
+
+def dump_synthetic_features(filename, df, feat_dim=4096, rng_seed=None):
+    """Create a HDF5 file with random C3D features for each video of df.
+    """
+    rng = np.random.RandomState(rng_seed)
+    videos = df.groupby('video-name', sort=False)['video-frames'].first()
+    with h5py.File(filename, 'w') as fobj:
+        for video_name, l_size in videos.iteritems():
+            feat = rng.rand(l_size, feat_dim).astype(np.float32)
+            fobj.create_group(video_name).create_dataset('c3d_features',
+                                                         data=feat)
+
+
+def git_revision():
+    try:
+        cwd = os.path.dirname(os.path.realpath(__file__))
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       cwd=cwd).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Timer(object):
+    """Collect elapsed time of named stages."""
+    def __init__(self, verbose=True):
+        self.stages = {}
+        self.verbose = verbose
+
+    def __call__(self, name, fn, *args, **kwargs):
+        start_time = time.time()
+        rst = fn(*args, **kwargs)
+        self.stages[name] = {'time': time.time() - start_time}
+        if self.verbose:
+            print '{}: {:.3f}s'.format(name, self.stages[name]['time'])
+        return rst
+
+
+def input_parser():
+    description = ('Time each stage of the DAPs pipeline over synthetic '
+                   'features and annotations.')
+    p = argparse.ArgumentParser(
+        description=description,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('-o', '--output', default='benchmark_pipeline.json',
+                   help='json file with results.')
+    p.add_argument('-wd', '--work_dir', default=None,
+                   help='Folder for intermediate files. Temporal by default.')
+    p.add_argument('-nv', '--n_videos', type=int, default=50,
+                   help='Number of videos.')
+    p.add_argument('-mnf', '--min_frames', type=int, default=1000,
+                   help='Minimum number of frames per video.')
+    p.add_argument('-mxf', '--max_frames', type=int, default=5000,
+                   help='Maximum number of frames per video.')
+    p.add_argument('-ni', '--n_instances', type=int, default=5,
+                   help='Maximum number of annotations per video.')
+    p.add_argument('-fd', '--feat_dim', type=int, default=500,
+                   help='Dimension of C3D features.')
+    p.add_argument('-k', '--n_proposals', type=int, default=16,
+                   help='Number of priors, K.')
+    p.add_argument('-t', '--T', type=int, default=256,
+                   help='Segment canonical size.')
+    p.add_argument('-s', '--stride', type=int, default=128,
+                   help='Video sliding step size.')
+    p.add_argument('-w', '--width', type=int, default=256,
+                   help='Number of hidden units of the MLP.')
+    p.add_argument('-ne', '--num_epochs', type=int, default=3,
+                   help='Number of training epochs.')
+    p.add_argument('-bz', '--batch_size', type=int, default=1024,
+                   help='Windows per forward pass in batched inference.')
+    p.add_argument('-b', '--backend', default='theano',
+                   choices=['theano', 'numpy'],
+                   help='Library used to evaluate the network.')
+    p.add_argument('-nms', '--nms', type=float, default=0.65,
+                   help='Threshold of non-maxima-suppression.')
+    p.add_argument('-rng', '--rng_seed', type=int, default=0,
+                   help='Seed for random number generation.')
+    return p
+
+
+def main(output, work_dir=None, n_videos=50, min_frames=1000,
+         max_frames=5000, n_instances=5, feat_dim=500, n_proposals=16, T=256,
+         stride=128, width=256, num_epochs=3, batch_size=1024,
+         backend='theano', nms=0.65, rng_seed=0):
+    # Theano is imported lazily to let users set THEANO_FLAGS
+    from daps import learning
+    from daps.inference import batch_retrieve_proposals, load_model
+    from daps.inference import retrieve_proposals
+
+    config = dict(n_videos=n_videos, min_frames=min_frames,
+                  max_frames=max_frames, n_instances=n_instances,
+                  feat_dim=feat_dim, n_proposals=n_proposals, T=T,
+                  stride=stride, width=width, num_epochs=num_epochs,
+                  batch_size=batch_size, backend=backend, nms=nms,
+                  rng_seed=rng_seed)
+    tmp_dir = work_dir is None
+    if tmp_dir:
+        work_dir = tempfile.mkdtemp(prefix='daps-bench-')
+    elif not os.path.isdir(work_dir):
+        os.makedirs(work_dir)
+    timer = Timer()
+
+    try:
+        # Synthetic data
+        df = synthetic_annotations(n_videos, min_frames, max_frames,
+                                   n_instances, rng_seed=rng_seed)
+        feat_file = os.path.join(work_dir, 'c3d.hdf5')
+        timer('synthetic_features', dump_synthetic_features, feat_file, df,
+              feat_dim, rng_seed)
+
+        # Priors and dataset
+        priors, df_seg = timer('compute_priors', compute_priors, df, T,
+                               n_proposals, rng_seed=rng_seed)
+        prefix = os.path.join(work_dir, 'train')
+        dump_files(prefix, priors=priors, df=df_seg, conf=True)
+        timer('create_dataset', create_dataset.main, prefix + '_ref.lst',
+              feat_file, work_dir, '_fc7_{}.hkl', prefix + '_conf.hkl', 0.85,
+              'mean', True, False, rng_seed, False, 100000)
+
+        # Training
+        model_prm = 'mlp:{},1,{},0,0'.format(n_proposals, width)
+        timer('train', learning.main, exp_id='bench', model=model_prm,
+              num_epochs=num_epochs, batch_size=256, rng_seed=rng_seed,
+              output_dir=work_dir, ds_prefix=work_dir, ds_suffix='mean',
+              snapshot_freq=num_epochs + 1, opt_rule='adam')
+        with open(os.path.join(work_dir, 'bench', 'bench.log'), 'r') as fobj:
+            epoch_time = [float(i.split()[-1]) for i in fobj
+                          if 'Elapsed time' in i]
+        timer.stages['train']['epoch_time'] = np.mean(epoch_time)
+        model_file = os.path.join(work_dir, 'bench', 'model.npz')
+
+        # Inference
+        network = timer('load_model', load_model, model_prm, model_file,
+                        feat_dim, backend)
+        video_lst = zip(*[df.groupby('video-name')['video-frames'].first()
+                          .reset_index()[i] for i in ['video-name',
+                                                      'video-frames']])
+        n_windows = sum([np.arange(0, l_size - T, stride).size
+                         for _, l_size in video_lst])
+
+        def per_video():
+            return [(v,) + retrieve_proposals(
+                v, l_size, network, T, stride, hdf5_dataset=feat_file,
+                model_prm=model_prm) for v, l_size in video_lst]
+
+        def batched():
+            return list(batch_retrieve_proposals(
+                video_lst, network, T, stride, 16, 8, 'mean', feat_file,
+                model_prm, batch_size))
+
+        timer('retrieve_proposals', per_video)
+        results = timer('batch_retrieve_proposals', batched)
+        for i in ['retrieve_proposals', 'batch_retrieve_proposals']:
+            timer.stages[i]['windows_per_sec'] = (
+                n_windows / timer.stages[i]['time'])
+
+        # Post-processing
+        l_sizes = dict(video_lst)
+        proposal_df = pd.concat([pd.DataFrame(
+            {'video-name': v, 'video-frames': l_sizes[v],
+             'f-init': proposal[:, 0], 'f-end': proposal[:, 1],
+             'score': score}) for v, proposal, score in results])
+        timer('wrapper_nms', wrapper_nms, proposal_df, nms)
+        timer.stages['wrapper_nms']['n_proposals'] = proposal_df.shape[0]
+    finally:
+        if tmp_dir:
+            shutil.rmtree(work_dir)
+
+    import lasagne
+    import theano
+    rst = {'config': config, 'stages': timer.stages,
+           'n_windows': n_windows, 'commit': git_revision(),
+           'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+           'platform': platform.platform(),
+           'versions': {'python': platform.python_version(),
+                        'numpy': np.__version__, 'pandas': pd.__version__,
+                        'theano': theano.__version__,
+                        'lasagne': lasagne.__version__}}
+    with open(output, 'w') as fobj:
+        json.dump(rst, fobj, sort_keys=True, indent=4)
+    print 'Results saved on {}'.format(output)
+
+
+if __name__ == '__main__':
+    p = input_parser()
+    args = vars(p.parse_args())
+    main(**args)
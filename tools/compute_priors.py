@@ -7,6 +7,7 @@ Helper program to compute priors/proposals
 import argparse
 
 from daps.datasets import Dataset
+from daps.data_generation import CLUSTERING, TempPriorsNoScale
 from daps.data_generation import compute_priors, dump_files
 
 
@@ -29,16 +30,39 @@ def input_parse():
                    choices=['thumos14', 'activitynet'])
     p.add_argument('-o', '--outprefix', default='mydata_256_16',
                    help='Prefix for output files')
+    p.add_argument('-n', '--n_jobs', default=1, type=int,
+                   help='Number of processes sampling segments of videos')
+    p.add_argument('-c', '--clustering', default='kmeans', choices=CLUSTERING,
+                   help='Clustering algorithm used to compute priors')
+    p.add_argument('-bz', '--batch_size', default=10000, type=int,
+                   help='Mini-batch size of minibatch/streaming clustering')
+    p.add_argument('-cmp', '--compare', action='store_true',
+                   help='Report fit time and inertia against full-batch '
+                        'kmeans')
     return p
 
 
-def main(ds_name, outprefix, n_proposals, T, iou_thr, i_thr, rng_seed):
+def main(ds_name, outprefix, n_proposals, T, iou_thr, i_thr, rng_seed,
+         n_jobs=1, clustering='kmeans', batch_size=10000, compare=False):
     ds_helper = Dataset(ds_name)
     df_seg = ds_helper.segments_info()
 
     # Generate segments for training and priors for regression
-    priors, df = compute_priors(df_seg, T, n_proposals, iou_thr=iou_thr,
-                                i_thr=i_thr, rng_seed=rng_seed)
+    priors, df, model, X = compute_priors(
+        df_seg, T, n_proposals, iou_thr=iou_thr, i_thr=i_thr,
+        rng_seed=rng_seed, n_jobs=n_jobs, clustering=clustering,
+        batch_size=batch_size, return_model=True)
+
+    models = [model]
+    if compare and clustering != 'kmeans':
+        reference = TempPriorsNoScale(n_proposals, rng_seed=rng_seed)
+        reference.fit(X)
+        models.append(reference)
+    print 'Clustering of {} annotations'.format(X.shape[0])
+    print '{:>10} {:>10} {:>12}'.format('method', 'time(s)', 'inertia')
+    for i in models:
+        print '{:>10} {:10.2f} {:12.2f}'.format(i.clustering, i.fit_time,
+                                                i.inertia(X))
 
     # Save priors, segments, confidence/matching
     dump_files(outprefix, priors=priors, df=df, conf=True)
@@ -129,8 +129,9 @@ def main(ref_file, rootfile, output_dir, suffix_fmt, conf_file, train_ratio,
         f.close()
 
         # Dump label matrix
-        conffile = (filename.split('_')[0] + '_conf' +
-                    os.path.splitext(filename)[1])
+        dirname, basename = os.path.split(filename)
+        conffile = os.path.join(dirname, basename.split('_')[0] + '_conf' +
+                                os.path.splitext(filename)[1])
         colnames = ['c_{}'.format(i) for i in range(df.columns.size - 4)]
         with h5py.File(conffile, 'w') as f:
             dset = f.create_dataset("data", (idx_s.size, len(colnames)),
@@ -11,14 +11,21 @@ import glob
 import json
 import os
 
+import h5py
 import hickle as hkl
 import numpy as np
 import pandas as pd
 
+from daps.bundle import is_bundle, load_bundle
 from daps.datasets import Dataset
-from daps.model import build_model, read_model, retrieve_proposals
-from daps.utils.segment import format as segment_format
-from daps.utils.segment import nms_detections
+from daps.inference import batch_retrieve_proposals, load_model
+from daps.inference import batch_retrieve_proposals_multiscale
+from daps.inference import fuse_proposals, prune_proposals, sliding_windows
+from daps.inference import retrieve_proposals
+from daps.utils.segment import grouped_iou_matching
+from daps.utils.segment import nms_batch, SegmentArray
+
+TIOU_THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.9]
 
 
 def filter_proposals(proposal_df):
@@ -42,7 +49,9 @@ def load_proposals(proposal_dir, stride=128, T=256,
     filenames = glob.glob(os.path.join(proposal_dir, '*.proposals'))
     priors = None
     if priors_filename:
-        priors = hkl.load(priors_filename)
+        # Priors in format [center, duration] relative to their window
+        priors = (hkl.load(priors_filename).clip(0, 1) * T).astype(
+            np.float64, copy=False)
     for f in filenames:
         vid = os.path.basename(f).split('.')[0]
         if file_filter and vid not in vds_true:
@@ -51,72 +60,193 @@ def load_proposals(proposal_dir, stride=128, T=256,
         if priors_filename:
             n_proposals = priors.shape[0]
             n_segments = this_df.shape[0] / n_proposals
-            this_priors = np.tile(priors, (n_segments, 1))
+            proposals = np.tile(priors, (n_segments, 1))
             l_size = this_df['video-frames'].mean()
             f_init_array = np.arange(0, l_size - T, stride)
-            map_array = np.stack((f_init_array, np.zeros(n_segments)))
-            map_array = map_array.repeat(n_proposals, axis=-1).T
-            proposals = segment_format(
-                map_array + (this_priors.clip(0, 1) * T), 'c2b').astype(int)
+            proposals[:, 0] += f_init_array.repeat(n_proposals)
+            proposals = SegmentArray(proposals, 'c').convert(
+                'b', inplace=True).data.astype(int)
             this_df['f-init'] = proposals[:, 0]
             this_df['f-end'] = proposals[:, 1]
         proposal_df.append(this_df)
     return pd.concat(proposal_df, axis=0)
 
 
-def wrapper_nms(proposal_df, overlap=0.65):
+def wrapper_nms(proposal_df, overlap=0.65, max_output=None, method='hard',
+                sigma=0.5):
     """Apply non-max-suppresion to a video batch.
     """
-    vds_unique = pd.unique(proposal_df['video-name'])
-    new_proposal_df = []
-    for i, v in enumerate(vds_unique):
-        idx = proposal_df['video-name'] == v
-        p = proposal_df.loc[idx, ['video-name', 'f-init', 'f-end',
-                                  'score', 'video-frames']]
-        n_frames = np.int(p['video-frames'].mean())
-        loc = np.stack((p['f-init'], p['f-end']), axis=-1)
-        loc, score = nms_detections(loc, np.array(p['score']), overlap)
-        n_proposals = score.shape[0]
-        n_frames = np.repeat(p['video-frames'].mean(), n_proposals).astype(int)
-        this_df = pd.DataFrame({'video-name': np.repeat(v, n_proposals),
-                                'f-init': loc[:, 0], 'f-end': loc[:, 1],
-                                'score': score,
-                                'video-frames': n_frames})
-        new_proposal_df.append(this_df)
-    return pd.concat(new_proposal_df, axis=0)
+    keep, score = nms_batch(np.array(proposal_df['video-name']),
+                            np.array(proposal_df.loc[:, ['f-init', 'f-end']]),
+                            np.array(proposal_df['score']), overlap,
+                            max_output, method, sigma)
+    columns = ['f-end', 'f-init', 'score', 'video-frames', 'video-name']
+    new_proposal_df = proposal_df.iloc[keep][columns].reset_index(drop=True)
+    new_proposal_df['score'] = score
+    new_proposal_df['video-frames'] = new_proposal_df['video-frames'].astype(
+        int)
+    return new_proposal_df
+
+
+def proposal_recall(gt_segments, proposals, keep, iou_thr=TIOU_THRESHOLDS):
+    """Count ground-truth matched by proposals before and after pruning.
+    """
+    rst = np.zeros((2, len(iou_thr)), dtype=int)
+    if gt_segments.shape[0] == 0 or proposals.shape[0] == 0:
+        return rst
+    # Ground-truth is matched against all (0) and kept (1) proposals at once
+    n_gt = gt_segments.shape[0]
+    best_iou = grouped_iou_matching(
+        np.repeat([0, 1], n_gt), np.vstack([gt_segments, gt_segments]),
+        np.repeat([0, 1], [proposals.shape[0], keep.size]),
+        np.vstack([proposals, proposals[keep, :]]))[0]
+    best_iou = best_iou.reshape(2, n_gt)
+    for i, v in enumerate(best_iou):
+        rst[i, :] = (v[:, np.newaxis] >= np.array(iou_thr)).sum(axis=0)
+    return rst
+
+
+def dump_video_proposals(proposal_dir, video_name, l_size, proposals, score):
+    """Save proposals of a video as a space separated file.
+    """
+    n_proposals = proposals.shape[0]
+    this_proposal_df = pd.DataFrame(
+        {'video-name': np.repeat(video_name, n_proposals),
+         'video-frames': np.repeat(l_size, n_proposals),
+         'f-init': proposals[:, 0], 'f-end': proposals[:, 1],
+         'score': score})
+    out = os.path.join(proposal_dir, '{}.proposals'.format(video_name))
+    this_proposal_df.to_csv(out, sep=' ', index=False,
+                            columns=['video-name', 'video-frames',
+                                     'f-init', 'f-end', 'score'])
 
 
 def wrapper_retrieve_proposals(video_df, network, proposal_dir, T=256,
                                stride=128, c3d_size=16, c3d_stride=8,
                                pool_type='mean', hdf5_dataset=None,
-                               model_prm=None, verbose=True):
+                               model_prm=None, batch_size=1024, scales=None,
+                               top_k=None, score_thr=None, gt_df=None,
+                               memory_budget=None, ensemble=False,
+                               fusion_iou=0.8, verbose=True):
     """Retrieve proposals for a video batch and save them.
+
+    In ensemble mode, proposals of each scale/model are saved on a folder
+    named after it inside proposal_dir, and the ones fused by
+    `fuse_proposals` on proposal_dir.
     """
-    cnt = 1
-    for idx, video in video_df.iterrows():
-        if video['video-frames'] < T:
-            cnt += 1
-            continue
-        proposals, score = retrieve_proposals(
-            video['video-name'], video['video-frames'], network, T, stride,
-            c3d_size, c3d_stride, pool_type, hdf5_dataset, model_prm)
-
-        # Build proposal DataFrame.
-        n_proposals = proposals.shape[0]
-        this_proposal_df = pd.DataFrame(
-            {'video-name': np.repeat(video['video-name'], n_proposals),
-             'video-frames': np.repeat(video['video-frames'], n_proposals),
-             'f-init': proposals[:, 0], 'f-end': proposals[:, 1],
-             'score': score})
-        out = os.path.join(proposal_dir,
-                           '{}.proposals'.format(video['video-name']))
-        this_proposal_df.to_csv(out, sep=' ', index=False,
-                                columns=['video-name', 'video-frames',
-                                         'f-init', 'f-end', 'score'])
+    # Pruning is done here to measure its cost when ground-truth is given
+    report = gt_df is not None and (top_k or score_thr is not None)
+    if report and scales:
+        raise ValueError('Pruning report is not supported with scales.')
+    prune_prm = {'top_k': top_k, 'score_thr': score_thr}
+    if report:
+        prune_prm = {'top_k': None, 'score_thr': None}
+        gt_df = gt_df.loc[gt_df['video-name'].isin(video_df['video-name'])]
+        gt_segments = SegmentArray.from_dataframe(gt_df)
+        gt_segments.convert('b', inplace=True)
+        gt_segments = dict((v, i.data)
+                           for v, i in gt_segments.groupby_video())
+        counts = np.zeros((2, len(TIOU_THRESHOLDS)), dtype=int)
+        n_proposals_all = np.zeros(2, dtype=int)
+
+    if scales:
+        T = min([i['T'] for i in scales])
+        scales = [dict(i, **prune_prm) for i in scales]
+    video_df = video_df.loc[video_df['video-frames'] >= T]
+    video_lst = zip(video_df['video-name'], video_df['video-frames'])
+    if scales:
+        # Features of each video are read once and shared by all scales.
+        results = batch_retrieve_proposals_multiscale(
+            video_lst, scales, hdf5_dataset, c3d_size, c3d_stride)
+    elif batch_size > 0 and memory_budget is None:
+        # Windows of several videos are packed in the same forward pass.
+        results = batch_retrieve_proposals(
+            video_lst, network, T, stride, c3d_size, c3d_stride, pool_type,
+            hdf5_dataset, model_prm, batch_size, **prune_prm)
+    else:
+        def per_video():
+            # Windows of long videos are split in chunks fitting the budget
+            for v, l_size in video_lst:
+                rst = retrieve_proposals(
+                    v, l_size, network, T, stride, c3d_size, c3d_stride,
+                    pool_type, hdf5_dataset, model_prm,
+                    memory_budget=memory_budget, return_stats=True,
+                    **prune_prm)
+                if verbose and memory_budget is not None:
+                    stats = rst[2]
+                    print 'Video {}: {} chunks, peak {:.1f}MB'.format(
+                        v, stats['n_chunks'],
+                        max(stats['chunk_bytes'] or [0]) / 2.0**20)
+                yield (v,) + rst[:2]
+        results = per_video()
+    l_sizes = dict(video_lst)
+
+    for cnt, rst in enumerate(results):
+        video_name, proposals, score = rst[:3]
+        if ensemble:
+            for i, scale in enumerate(scales):
+                idx = rst[3] == i
+                dump_video_proposals(
+                    os.path.join(proposal_dir, scale['name']), video_name,
+                    l_sizes[video_name], proposals[idx, :], score[idx])
+            proposals, score = fuse_proposals(
+                proposals, score, rst[3], [i['weight'] for i in scales],
+                fusion_iou)
+        if report:
+            n_windows = sliding_windows(l_sizes[video_name], T, stride).size
+            n_proposals = score.size / max(n_windows, 1)
+            all_proposals = proposals
+            proposals, score, keep = prune_proposals(
+                proposals, score, n_proposals, top_k, score_thr,
+                return_index=True)
+            counts += proposal_recall(
+                gt_segments.get(video_name, np.empty((0, 2))), all_proposals,
+                keep)
+            n_proposals_all += [all_proposals.shape[0], keep.size]
+
+        dump_video_proposals(proposal_dir, video_name, l_sizes[video_name],
+                             proposals, score)
         if verbose:
-            print 'Processed video: {} - {}/{}'.format(video['video-name'],
-                                                       cnt, video.shape[0])
-            cnt += 1
+            print 'Processed video: {} - {}/{}'.format(video_name, cnt + 1,
+                                                       len(video_lst))
+
+    if report:
+        n_gt = max(sum([i.shape[0] for i in gt_segments.values()]), 1)
+        print 'Pruning kept {} out of {} proposals ({:.2%})'.format(
+            n_proposals_all[1], n_proposals_all[0],
+            n_proposals_all[1] * 1.0 / max(n_proposals_all[0], 1))
+        for i, v in enumerate(TIOU_THRESHOLDS):
+            print 'Recall@{:.2f} before/after pruning: {:.4f}/{:.4f}'.format(
+                v, counts[0, i] * 1.0 / n_gt, counts[1, i] * 1.0 / n_gt)
+
+
+def load_scale_model(scale, backend='theano', feat_file=None, c3d_size=16,
+                     c3d_stride=8):
+    """Load model of a scale from a bundle or a npz-file plus its params.
+    """
+    if is_bundle(scale['model']):
+        network, config = load_bundle(scale['model'], backend)
+        if (config['c3d_size'], config['c3d_stride']) != (c3d_size,
+                                                          c3d_stride):
+            raise ValueError('C3D size/stride differ from the ones of the '
+                             'bundle {}'.format(scale['model']))
+        if config['feat_dim'] is not None:
+            with h5py.File(feat_file, 'r') as fobj:
+                video_name = next(iter(fobj))
+                feat_dim = fobj[video_name]['c3d_features'].shape[1]
+            if feat_dim != config['feat_dim']:
+                msg = 'Features of {} are {}-d, bundle {} expects {}-d'
+                raise ValueError(msg.format(feat_file, feat_dim,
+                                            scale['model'],
+                                            config['feat_dim']))
+        return network, config['model_prm'], config
+    if not scale['network_params']:
+        raise ValueError('network_params is required for npz models.')
+    with open(scale['network_params'], 'r') as fobj:
+        model_prm = json.load(fobj)['model']
+    network = load_model(model_prm, scale['model'],
+                         input_size=scale['input_size'], backend=backend)
+    return network, model_prm, None
 
 
 def input_parser():
@@ -124,9 +254,11 @@ def input_parser():
                    'intense use of our data-structures and data-flow.')
     p = argparse.ArgumentParser(description=description)
     p.add_argument('model',
-                   help='npz file with trained model.')
+                   help=('npz file with trained model or DAPs bundle. The '
+                         'latter sets input_size, T, stride and pool_type.'))
     p.add_argument('network_params',
-                   help='json file with params used for the input model')
+                   help=('json file with params used for the input model. '
+                         'Use "" for bundles.'))
     p.add_argument('eval_id', help='Evaluation identifier')
     p.add_argument('exp_id',
                    help='Experiment identifier to correlate with train exps.')
@@ -153,15 +285,60 @@ def input_parser():
                    help='Segment canonical size.')
     p.add_argument('-nms', '--no_nms', dest='nms', type=float, default=0.65,
                    help='Non-maxima-Supression on retrieved proposals')
+    p.add_argument('-mo', '--max_output', type=int, default=None,
+                   help='Maximum number of proposals per video after NMS.')
+    p.add_argument('-nm', '--nms_method', default='hard',
+                   choices=['hard', 'linear', 'gaussian'],
+                   help=('Type of NMS. Soft-NMS methods decay the score of '
+                         'proposals overlapping more than --no_nms (linear) '
+                         'or by a gaussian of width --nms_sigma.'))
+    p.add_argument('-ns', '--nms_sigma', type=float, default=0.5,
+                   help='Width of gaussian Soft-NMS.')
     p.add_argument('-pr', '--priors_filename',
-                   help='File with priors used in training.')
+                   help=('File with priors used in training. Boundaries are '
+                         'rebuilt from them, thus it does not support '
+                         'top_k/score_thr pruning.'))
+    p.add_argument('-bz', '--batch_size', type=int, default=1024,
+                   help=('Number of windows, from one or many videos, per '
+                         'forward pass. Use 0 to run one pass per video.'))
+    p.add_argument('-b', '--backend', default='theano',
+                   choices=['theano', 'numpy'],
+                   help='Library used to evaluate the network.')
+    h_scales = ('json file with a list of extra scales. Each one is a dict '
+                'with any of the keys: model, network_params, input_size, T, '
+                'stride, pool_type. Missing keys take the value of the main '
+                'scale. Proposals of all scales are merged before NMS. Not '
+                'supported with --priors_filename.')
+    p.add_argument('-ms', '--scales', help=h_scales)
+    p.add_argument('-mb', '--memory_budget', type=float, default=None,
+                   help=('Max MB of features held per video. Windows are '
+                         'processed by chunks, one video at a time.'))
+    h_ensemble = ('json file with a list of extra models, same format as '
+                  '--scales plus optional keys name and weight. Each video '
+                  'is read once and proposals of every model are saved '
+                  'besides the ones fused by a weighted average of scores.')
+    p.add_argument('-en', '--ensemble', help=h_ensemble)
+    p.add_argument('-fi', '--fusion_iou', type=float, default=0.8,
+                   help=('Min IOU between proposals of different models of '
+                         'the ensemble fused together.'))
+    p.add_argument('-k', '--top_k', type=int, default=None,
+                   help='Number of proposals kept per window.')
+    p.add_argument('-st', '--score_thr', type=float, default=None,
+                   help='Remove proposals with lower confidence.')
+    p.add_argument('-prep', '--pruning_report', action='store_true',
+                   help=('Report the recall lost by top_k/score_thr pruning '
+                         'against the annotations of the dataset.'))
     return p
 
 
 def main(model, network_params, eval_id, exp_id, output_dir,
          input_size=4096, dataset='thumos14-val', feat_file=None,
          file_filter=None, overwrite=False, c3d_size=16, c3d_stride=8,
-         pool_type='mean', stride=128, T=256, nms=0.65, priors_filename=None):
+         pool_type='mean', stride=128, T=256, nms=0.65, priors_filename=None,
+         batch_size=1024, backend='theano', scales=None, top_k=None,
+         score_thr=None, pruning_report=False, memory_budget=None,
+         ensemble=None, max_output=None, nms_method='hard', nms_sigma=0.5,
+         fusion_iou=0.8):
 
     ###########################################################################
     # Loading dataset info.
@@ -180,6 +357,47 @@ def main(model, network_params, eval_id, exp_id, output_dir,
         video_names = pd.read_csv(file_filter)['video-name']
         df = df[df['video-name'].isin(video_names)]
 
+    if memory_budget is not None:
+        memory_budget = int(memory_budget * 2**20)
+    if ensemble and (scales or priors_filename):
+        raise ValueError('Ensemble does not support scales or priors.')
+    if priors_filename and (top_k or score_thr is not None):
+        raise ValueError('Pruning does not support priors.')
+    if scales and priors_filename:
+        raise ValueError('Scales do not support priors.')
+
+    ###########################################################################
+    # Loading network.
+    ###########################################################################
+    main_scale = {'model': model, 'network_params': network_params,
+                  'input_size': input_size, 'T': T, 'stride': stride,
+                  'pool_type': pool_type, 'name': 'model-0', 'weight': 1.0}
+    scales_lst = [main_scale]
+    if scales or ensemble:
+        with open(scales or ensemble, 'r') as fobj:
+            scales_lst += [dict(dict(main_scale,
+                                     name='model-{}'.format(i + 1)), **j)
+                           for i, j in enumerate(json.load(fobj))]
+    # Models shared by several scales are loaded once.
+    models = {}
+    for scale in scales_lst:
+        key = (scale['model'], scale['network_params'], scale['input_size'])
+        if key not in models:
+            models[key] = load_scale_model(scale, backend, feat_file,
+                                           c3d_size, c3d_stride)
+        scale['model'], scale['model_prm'], config = models[key]
+        # Bundles dictate how their input is built.
+        if config is not None:
+            for k in ['input_size', 'T', 'stride', 'pool_type']:
+                scale[k] = config[k]
+    T, stride, pool_type = [main_scale[i] for i in ['T', 'stride',
+                                                    'pool_type']]
+    model_prm = main_scale['model_prm']
+    # Inference function is compiled once and shared by all the videos.
+    network = main_scale['model']
+    scales_filename = scales or ensemble
+    scales = scales_lst if scales_filename else None
+
     ###########################################################################
     # Set output file paths.
     ###########################################################################
@@ -188,7 +406,11 @@ def main(model, network_params, eval_id, exp_id, output_dir,
         os.makedirs(output_dir)
     # Config file.
     conf = {'stride': stride, 'nms': nms, 'dataset': dataset, 'T': T,
-            'filter': file_filter, 'priors_filename': priors_filename}
+            'filter': file_filter, 'priors_filename': priors_filename,
+            'scales': scales_filename, 'top_k': top_k,
+            'score_thr': score_thr, 'pool_type': pool_type,
+            'ensemble': ensemble is not None,
+            'fusion_iou': fusion_iou if ensemble else None}
     conf_filename = os.path.join(output_dir, 'config.json')
     with open(conf_filename, 'w') as fobj:
         fobj.write(json.dumps(conf, sort_keys=True, indent=4))
@@ -198,20 +420,14 @@ def main(model, network_params, eval_id, exp_id, output_dir,
     proposal_dir = os.path.join(output_dir, 'proposals')
     if not os.path.isdir(proposal_dir):
         os.makedirs(proposal_dir)
+    for scale in scales_lst if ensemble else []:
+        if not os.path.isdir(os.path.join(proposal_dir, scale['name'])):
+            os.makedirs(os.path.join(proposal_dir, scale['name']))
     # Results path.
     results_dir = os.path.join(output_dir, 'results')
     if not os.path.isdir(results_dir):
         os.makedirs(results_dir)
 
-    ###########################################################################
-    # Loading network.
-    ###########################################################################
-    with open(network_params, 'r') as fobj:
-        network_params = json.load(fobj)
-    network = build_model(model_prm=network_params['model'],
-                          input_size=input_size)
-    read_model(model, network)
-
     ###########################################################################
     # Proposal extraction for batch of videos.
     ###########################################################################
@@ -237,7 +453,13 @@ def main(model, network_params, eval_id, exp_id, output_dir,
                                    stride=stride,
                                    c3d_size=c3d_size, c3d_stride=c3d_stride,
                                    pool_type=pool_type, hdf5_dataset=feat_file,
-                                   model_prm=network_params['model'])
+                                   model_prm=model_prm,
+                                   batch_size=batch_size, scales=scales,
+                                   top_k=top_k, score_thr=score_thr,
+                                   gt_df=df if pruning_report else None,
+                                   memory_budget=memory_budget,
+                                   ensemble=ensemble is not None,
+                                   fusion_iou=fusion_iou)
 
     ###########################################################################
     # Evaluate proposals
@@ -246,9 +468,21 @@ def main(model, network_params, eval_id, exp_id, output_dir,
                                  file_filter=file_filter,
                                  priors_filename=priors_filename)
     if nms > 0:
-        proposal_df = wrapper_nms(proposal_df, nms)
+        proposal_df = wrapper_nms(proposal_df, nms, max_output, nms_method,
+                                  nms_sigma)
     # Store results
     proposal_df.to_csv(result_filename, sep=' ', index=False)
+    # Results of each model of the ensemble
+    for scale in scales_lst if ensemble else []:
+        proposal_df = load_proposals(
+            os.path.join(proposal_dir, scale['name']),
+            file_filter=file_filter)
+        if nms > 0:
+            proposal_df = wrapper_nms(proposal_df, nms, max_output,
+                                      nms_method, nms_sigma)
+        proposal_df.to_csv(os.path.join(
+            output_dir, 'result_{}.proposals'.format(scale['name'])),
+            sep=' ', index=False)
     print 'Have a good day!'
 
 
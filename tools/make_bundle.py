@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+
+Pack a trained DAPs model, its hyper-parameters, priors and the parameters
+used to build its input onto a single bundle file.
+
+"""
+import argparse
+import json
+
+import hickle as hkl
+
+from daps.bundle import dump_bundle, load_bundle
+
+
+def input_parser():
+    description = 'Create a single-file bundle of a DAPs model.'
+    p = argparse.ArgumentParser(
+        description=description,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('model', help='npz file with trained model.')
+    p.add_argument('network_params',
+                   help='json file with params used for the input model')
+    p.add_argument('output', help='Fullpath of bundle file.')
+    p.add_argument('-pr', '--priors_filename',
+                   help='File with priors used in training.')
+    p.add_argument('-is', '--input_size', type=int, default=4096,
+                   help='Size of the input to the network.')
+    p.add_argument('-fd', '--feat_dim', type=int, default=None,
+                   help='Dimension of raw C3D features (e.g. 4096 or 500).')
+    p.add_argument('-c3d-size', '--c3d_size', type=int, default=16,
+                   help='Size of C3D receptive field.')
+    p.add_argument('-c3d-stride', '--c3d_stride', type=int, default=8,
+                   help='Size of sliding step for C3D.')
+    p.add_argument('-pt', '--pool_type', default='mean',
+                   help='Type of pooling: mean, max, pyr-2-mean ...')
+    p.add_argument('-s', '--stride', type=int, default=128,
+                   help='Video sliding step size.')
+    p.add_argument('-t', '--T', type=int, default=256,
+                   help='Segment canonical size.')
+    return p
+
+
+def main(model, network_params, output, priors_filename=None,
+         input_size=4096, feat_dim=None, c3d_size=16, c3d_stride=8,
+         pool_type='mean', stride=128, T=256):
+    with open(network_params, 'r') as fobj:
+        model_prm = json.load(fobj)['model']
+    priors = None
+    if priors_filename:
+        priors = hkl.load(priors_filename)
+    dump_bundle(output, model_prm, model, priors, input_size=input_size, T=T,
+                stride=stride, c3d_size=c3d_size, c3d_stride=c3d_stride,
+                pool_type=pool_type, feat_dim=feat_dim)
+    # Sanity check
+    _, config = load_bundle(output, backend='numpy')
+    print 'Bundle of {} saved on {}'.format(config['model_prm'], output)
+
+
+if __name__ == '__main__':
+    p = input_parser()
+    args = vars(p.parse_args())
+    main(**args)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+
+Client of the local proposal service, see proposal_server.py.
+
+"""
+import argparse
+import json
+import urllib2
+
+import numpy as np
+import pandas as pd
+
+
+def request_proposals(url, video_name=None, features=None, video_frames=None,
+                      feat_file=None, timeout=600):
+    """Request proposals of a video to the proposal service.
+
+    Parameters
+    ----------
+    url : str
+        Root url of the service, e.g. http://localhost:8421
+    video_name : str, optional
+        Video identifier in the feature store of the service.
+    features : ndarray, optional
+        [l x d] array with raw C3D features. It takes precedence over the
+        feature store.
+    video_frames : int, optional
+        Size of the video. By default, the number of feature rows.
+    feat_file : str, optional
+        hdf5 file with raw C3D features, visible from the service.
+
+    Outputs
+    -------
+    proposal_df : DataFrame
+        Table with the same columns of the files dumped by daps_detection.py
+
+    """
+    request = {}
+    if video_name is not None:
+        request['video-name'] = video_name
+    if features is not None:
+        request['features'] = np.asarray(features).tolist()
+    if video_frames is not None:
+        request['video-frames'] = int(video_frames)
+    if feat_file is not None:
+        request['feat_file'] = feat_file
+    http_request = urllib2.Request(
+        url.rstrip('/') + '/proposals', json.dumps(request),
+        {'Content-Type': 'application/json'})
+    try:
+        response = json.load(urllib2.urlopen(http_request, timeout=timeout))
+    except urllib2.HTTPError as err:
+        raise ValueError(json.load(err).get('error', str(err)))
+    n_proposals = len(response['score'])
+    return pd.DataFrame({'video-name': [response['video-name']] * n_proposals,
+                         'video-frames': [response['video-frames']] *
+                         n_proposals,
+                         'f-init': response['f-init'],
+                         'f-end': response['f-end'],
+                         'score': response['score']},
+                        columns=['video-name', 'video-frames', 'f-init',
+                                 'f-end', 'score'])
+
+
+def server_stats(url, timeout=60):
+    """Retrieve latency/throughput counters of the proposal service.
+    """
+    return json.load(urllib2.urlopen(url.rstrip('/') + '/stats',
+                                     timeout=timeout))
+
+
+def input_parser():
+    description = 'Request proposals to a running proposal_server.py'
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('-u', '--url', default='http://localhost:8421',
+                   help='Root url of the service.')
+    p.add_argument('-vn', '--video_name',
+                   help='Video identifier in the feature store.')
+    p.add_argument('-npy', '--npy_file',
+                   help='npy file with raw C3D features of a video.')
+    p.add_argument('-vf', '--video_frames', type=int,
+                   help='Number of frames of the video.')
+    p.add_argument('-feat', '--feat_file',
+                   help='hdf5 file containing the raw C3D features.')
+    p.add_argument('-o', '--output',
+                   help='File to save proposals. By default, stdout.')
+    p.add_argument('-st', '--stats', action='store_true',
+                   help='Print counters of the service and exit.')
+    return p
+
+
+def main(url, video_name=None, npy_file=None, video_frames=None,
+         feat_file=None, output=None, stats=False):
+    if stats:
+        print json.dumps(server_stats(url), sort_keys=True, indent=4)
+        return None
+    features = None
+    if npy_file:
+        features = np.load(npy_file)
+    proposal_df = request_proposals(url, video_name, features, video_frames,
+                                    feat_file)
+    if output:
+        proposal_df.to_csv(output, sep=' ', index=False)
+    else:
+        print proposal_df.to_csv(sep=' ', index=False)
+
+
+if __name__ == '__main__':
+    p = input_parser()
+    args = vars(p.parse_args())
+    main(**args)
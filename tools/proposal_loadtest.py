@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""
+
+Load test of the local proposal service, see proposal_server.py.
+
+"""
+import argparse
+import json
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from proposal_client import request_proposals, server_stats
+
+
+def input_parser():
+    description = ('Send concurrent requests to proposal_server.py and '
+                   'report latency and throughput.')
+    p = argparse.ArgumentParser(
+        description=description,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('-u', '--url', default='http://localhost:8421',
+                   help='Root url of the service.')
+    p.add_argument('-vl', '--video_list',
+                   help=('CSV with video-name column. Videos are read from '
+                         'the feature store of the service. By default, '
+                         'random features are sent.'))
+    p.add_argument('-n', '--n_requests', type=int, default=100,
+                   help='Total number of requests.')
+    p.add_argument('-c', '--concurrency', type=int, default=8,
+                   help='Number of concurrent clients.')
+    p.add_argument('-l', '--length', type=int, default=1024,
+                   help='Number of feature rows of random videos.')
+    p.add_argument('-d', '--feat_dim', type=int, default=500,
+                   help='Dimension of random features.')
+    p.add_argument('-rng', '--rng_seed', type=int, default=None,
+                   help='Seed for random number generator')
+    p.add_argument('-o', '--output', help='json file to save the report.')
+    return p
+
+
+def main(url, video_list=None, n_requests=100, concurrency=8, length=1024,
+         feat_dim=500, rng_seed=None, output=None):
+    rng = np.random.RandomState(rng_seed)
+    if video_list:
+        videos = pd.read_csv(video_list)['video-name'].tolist()
+        requests = [{'video_name': videos[i % len(videos)]}
+                    for i in range(n_requests)]
+    else:
+        features = rng.rand(length, feat_dim).astype(np.float32)
+        requests = [{'features': features}] * n_requests
+
+    latency, errors, lock = [], [], threading.Lock()
+    pending = list(range(n_requests))
+
+    def client():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                i = pending.pop()
+            start_time = time.time()
+            try:
+                request_proposals(url, **requests[i])
+            except Exception as err:
+                with lock:
+                    errors.append(str(err))
+                continue
+            with lock:
+                latency.append(time.time() - start_time)
+
+    start_time = time.time()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for i in threads:
+        i.start()
+    for i in threads:
+        i.join()
+    elapsed = time.time() - start_time
+
+    latency = np.array(latency)
+    report = {'requests': n_requests, 'concurrency': concurrency,
+              'errors': len(errors), 'elapsed': elapsed,
+              'requests_per_sec': latency.size / elapsed}
+    if latency.size:
+        report['latency_mean'] = latency.mean()
+        for i in [50, 95, 99]:
+            report['latency_p{}'.format(i)] = np.percentile(latency, i)
+    report['server'] = server_stats(url)
+    print json.dumps(report, sort_keys=True, indent=4)
+    if output:
+        with open(output, 'w') as fobj:
+            json.dump(report, fobj, sort_keys=True, indent=4)
+
+
+if __name__ == '__main__':
+    p = input_parser()
+    args = vars(p.parse_args())
+    main(**args)
@@ -0,0 +1,272 @@
+#!/usr/bin/env python
+"""
+
+Local proposal service. It loads a DAPs model once and answers requests
+over HTTP on localhost. Windows of concurrent requests are micro-batched
+into shared forward passes.
+
+Endpoints:
+    POST /proposals
+        json-dict with 'video-name' (features are read from the feature
+        store, optionally 'feat_file' and 'video-frames') or 'features'
+        (list of rows with raw C3D features, optionally 'video-frames').
+        It answers a json-dict with 'video-name', 'f-init', 'f-end' and
+        'score'.
+    GET /stats
+        Latency and throughput counters.
+
+"""
+import argparse
+import json
+import threading
+import time
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from collections import deque
+from Queue import Empty, Queue
+from SocketServer import ThreadingMixIn
+
+import numpy as np
+
+from daps.c3d_encoder import Feature, pool_windows
+from daps.inference import load_model, model_input, sliding_windows
+from daps.inference import window_proposals, WindowScheduler
+
+
+class MicroBatcher(object):
+    """Merge windows of concurrent requests into shared forward passes
+    """
+    def __init__(self, model, batch_size=1024, max_wait=0.005,
+                 n_latency=10000):
+        self.model = model
+        self.max_wait = max_wait
+        self.scheduler = WindowScheduler(model.forward, batch_size)
+        self.queue = Queue()
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.counters = {'requests': 0, 'windows': 0, 'errors': 0}
+        self.latency = deque(maxlen=n_latency)
+        self._key = 0
+        worker = threading.Thread(target=self._worker)
+        worker.daemon = True
+        worker.start()
+
+    def submit(self, X, f_init_array):
+        """Evaluate windows of a request, it blocks until they are done
+        """
+        request = {'X': X, 'f_init': f_init_array, 'done': threading.Event()}
+        self.queue.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['loc'], request['score']
+
+    def stats(self):
+        """Latency and throughput counters
+        """
+        with self.lock:
+            stats = dict(self.counters)
+            latency = np.array(self.latency)
+        elapsed = time.time() - self.start_time
+        stats['batches'] = self.scheduler.n_batches
+        stats['uptime'] = elapsed
+        stats['requests_per_sec'] = stats['requests'] / elapsed
+        stats['windows_per_sec'] = stats['windows'] / elapsed
+        if latency.size:
+            stats['latency_mean'] = latency.mean()
+            for i in [50, 95, 99]:
+                stats['latency_p{}'.format(i)] = np.percentile(latency, i)
+        return stats
+
+    def _worker(self):
+        while True:
+            # Wait for a request and gather the ones arriving shortly after
+            batch = [self.queue.get()]
+            n_windows = batch[0]['f_init'].size
+            deadline = time.time() + self.max_wait
+            while n_windows < self.scheduler.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except Empty:
+                    break
+                n_windows += batch[-1]['f_init'].size
+
+            requests, completed = {}, []
+            try:
+                for request in batch:
+                    self._key += 1
+                    requests[self._key] = request
+                    completed += self.scheduler.add(
+                        self._key, request['X'], request['f_init'])
+                completed += self.scheduler.flush()
+            except Exception as err:
+                # Leave the scheduler ready for next requests
+                self.scheduler = WindowScheduler(self.model.forward,
+                                                 self.scheduler.batch_size)
+                for request in batch:
+                    request['error'] = err
+                    request['done'].set()
+                continue
+
+            for key, _, loc, score in completed:
+                requests[key]['loc'], requests[key]['score'] = loc, score
+                requests[key]['done'].set()
+            with self.lock:
+                self.counters['windows'] += n_windows
+
+
+class ProposalServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher, T=256, stride=128, c3d_size=16,
+                 c3d_stride=8, pool_type='mean', feat_file=None,
+                 verbose=False):
+        HTTPServer.__init__(self, address, ProposalHandler)
+        self.batcher = batcher
+        self.T, self.stride = T, stride
+        self.c3d_size, self.c3d_stride = c3d_size, c3d_stride
+        self.pool_type = pool_type
+        self.feat_file = feat_file
+        self.verbose = verbose
+        self.feat_lock = threading.Lock()
+        self._feat = {}
+
+    def read_video(self, video_name, feat_file=None):
+        """Read raw features of a video from a feature store
+        """
+        feat_file = feat_file or self.feat_file
+        if feat_file is None:
+            raise ValueError('Feature file was not provided.')
+        with self.feat_lock:
+            if feat_file not in self._feat:
+                self._feat[feat_file] = Feature(feat_file, pool_type=None)
+                self._feat[feat_file].open_instance()
+            return self._feat[feat_file].read_video(video_name)
+
+    def proposals(self, request):
+        """Retrieve proposals for a request
+        """
+        if 'features' in request:
+            video_name = request.get('video-name')
+            raw_feat_stack = np.array(request['features'], dtype=np.float32)
+        else:
+            video_name = request['video-name']
+            raw_feat_stack = self.read_video(video_name,
+                                             request.get('feat_file'))
+        l_size = int(request.get('video-frames', raw_feat_stack.shape[0]))
+
+        f_init_array = sliding_windows(l_size, self.T, self.stride)
+        feat_stack = pool_windows(raw_feat_stack, f_init_array, self.T,
+                                  self.c3d_size, self.c3d_stride,
+                                  self.pool_type, dtype=np.float32)
+        feat_stack = model_input(feat_stack, self.batcher.model.model_prm)
+        loc, score = self.batcher.submit(feat_stack, f_init_array)
+        proposal, score = window_proposals(f_init_array, loc, score, self.T)
+        return {'video-name': video_name, 'video-frames': l_size,
+                'f-init': proposal[:, 0].tolist(),
+                'f-end': proposal[:, 1].tolist(), 'score': score.tolist()}
+
+
+class ProposalHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            self._reply(200, self.server.batcher.stats())
+        else:
+            self._reply(404, {'error': 'Unknown path ' + self.path})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/proposals':
+            self._reply(404, {'error': 'Unknown path ' + self.path})
+            return
+        start_time = time.time()
+        batcher = self.server.batcher
+        try:
+            length = int(self.headers.getheader('content-length', 0))
+            request = json.loads(self.rfile.read(length))
+            response = self.server.proposals(request)
+        except Exception as err:
+            with batcher.lock:
+                batcher.counters['errors'] += 1
+            self._reply(400, {'error': str(err)})
+            return
+        with batcher.lock:
+            batcher.counters['requests'] += 1
+            batcher.latency.append(time.time() - start_time)
+        self._reply(200, response)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _reply(self, code, data):
+        body = json.dumps(data)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def input_parser():
+    description = ('Serve DAPs proposals from a model loaded once. Windows '
+                   'of concurrent requests share forward passes.')
+    p = argparse.ArgumentParser(
+        description=description,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('model', help='npz file with trained model.')
+    p.add_argument('network_params',
+                   help='json file with params used for the input model')
+    p.add_argument('-H', '--host', default='localhost',
+                   help='Address to bind the server.')
+    p.add_argument('-p', '--port', type=int, default=8421,
+                   help='Port to bind the server.')
+    p.add_argument('-feat', '--feat_file',
+                   help='Default hdf5 file containing the raw C3D features.')
+    p.add_argument('-is', '--input_size', type=int, default=4096,
+                   help='Size of the input to the network.')
+    p.add_argument('-c3d-size', '--c3d_size', type=int, default=16,
+                   help='Size of C3D receptive field.')
+    p.add_argument('-c3d-stride', '--c3d_stride', type=int, default=8,
+                   help='Size of sliding step for C3D.')
+    p.add_argument('-pt', '--pool_type', default='mean',
+                   help='Type of pooling: mean, max, pyr-2-mean ...')
+    p.add_argument('-s', '--stride', type=int, default=128,
+                   help='Video sliding step size.')
+    p.add_argument('-t', '--T', type=int, default=256,
+                   help='Segment canonical size.')
+    p.add_argument('-bz', '--batch_size', type=int, default=1024,
+                   help='Max number of windows per forward pass.')
+    p.add_argument('-mw', '--max_wait', type=float, default=0.005,
+                   help='Seconds to wait for requests to join a batch.')
+    p.add_argument('-b', '--backend', default='theano',
+                   choices=['theano', 'numpy'],
+                   help='Library used to evaluate the network.')
+    p.add_argument('-v', '--verbose', action='store_true')
+    return p
+
+
+def main(model, network_params, host='localhost', port=8421, feat_file=None,
+         input_size=4096, c3d_size=16, c3d_stride=8, pool_type='mean',
+         stride=128, T=256, batch_size=1024, max_wait=0.005,
+         backend='theano', verbose=False):
+    with open(network_params, 'r') as fobj:
+        network_params = json.load(fobj)
+    network = load_model(network_params['model'], model,
+                         input_size=input_size, backend=backend)
+    batcher = MicroBatcher(network, batch_size, max_wait)
+    server = ProposalServer((host, port), batcher, T, stride, c3d_size,
+                            c3d_stride, pool_type, feat_file, verbose)
+    print 'Serving proposals on http://{}:{}'.format(host, port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print 'Bye!'
+    server.server_close()
+
+
+if __name__ == '__main__':
+    p = input_parser()
+    args = vars(p.parse_args())
+    main(**args)
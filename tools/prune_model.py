@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+
+Shrink the hidden layers of a trained DAPs model. Units are ranked by weight
+norm or activation statistics over the validation set dumped by
+create_dataset.py, the least important ones are removed and, optionally, the
+pruned model is fine-tuned with daps.learning.
+
+Outputs model.npz and hyper_prm.json on the output folder plus a json file
+comparing recall and speed of the original and pruned models.
+
+"""
+import argparse
+import json
+import os
+import time
+
+import hickle as hkl
+import numpy as np
+from sklearn.metrics import average_precision_score
+
+from daps.inference import NumpyProposalModel, parse_model_prm
+from daps.pruning import prune_units, select_units, unit_importance
+
+
+def ranking_metrics(y_true, y_pred, levels=(10, 25, 50)):
+    """AP and recall at the top-ranked levels (%) of confidence predictions.
+    """
+    y_true, y_pred = y_true.flatten(), y_pred.flatten()
+    idx_sorted = np.argsort(-y_pred)
+    n_pos = max(y_true.sum(), 1)
+    rst = {'ap': average_precision_score(y_true, y_pred)}
+    for v in levels:
+        tp = y_true[idx_sorted[:int(v * y_true.size / 100)]].sum()
+        rst['R{}'.format(v)] = tp * 1.0 / n_pos
+    return rst
+
+
+def evaluate(model, X, y, n_repeats=3, batch_size=1024):
+    """Recall and throughput of a model over a set of windows.
+    """
+    y_pred = np.vstack([model.forward(X[i:i + batch_size])[1]
+                        for i in range(0, X.shape[0], batch_size)])
+    rst = ranking_metrics(y, y_pred)
+    elapsed = []
+    for _ in range(n_repeats):
+        start_time = time.time()
+        for i in range(0, X.shape[0], batch_size):
+            model.forward(X[i:i + batch_size])
+        elapsed.append(time.time() - start_time)
+    rst['windows_per_sec'] = X.shape[0] / min(elapsed)
+    return rst
+
+
+def input_parser():
+    description = ('Remove hidden units of a trained MLP/LSTM and report '
+                   'recall and speed against the original model.')
+    p = argparse.ArgumentParser(
+        description=description,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    p.add_argument('model', help='npz file with trained model.')
+    p.add_argument('network_params',
+                   help='json file with params used for the input model')
+    p.add_argument('output_dir', help='Folder for the pruned model.')
+    p.add_argument('-dp', '--ds_prefix', required=True,
+                   help='Folder with val features dumped by create_dataset.')
+    p.add_argument('-ds', '--ds_suffix', default='mean',
+                   help='Suffix used to read features, val_fc7_SUFFIX.hkl')
+    p.add_argument('-w', '--width', type=int, default=None,
+                   help='Number of units kept per hidden layer.')
+    p.add_argument('-r', '--ratio', type=float, default=0.25,
+                   help='Ratio of units kept. Ignored if width is given.')
+    p.add_argument('-m', '--method', default='norm',
+                   choices=['norm', 'activation'],
+                   help='Criteria to rank hidden units.')
+    p.add_argument('-ns', '--n_samples', type=int, default=4096,
+                   help='Number of val windows used by activation method.')
+    p.add_argument('-ne', '--num_epochs', type=int, default=0,
+                   help='Number of fine-tuning epochs.')
+    p.add_argument('-lr', '--l_rate', type=float, default=1e-4,
+                   help='Learning rate of fine-tuning.')
+    p.add_argument('-bz', '--batch_size', type=int, default=500,
+                   help='Mini batch size of fine-tuning.')
+    p.add_argument('-om', '--opt_rule', default='rmsprop',
+                   help='Update rule of fine-tuning.')
+    p.add_argument('-a', '--alpha', type=float, default=0.3,
+                   help='Trade-off between matching and confidence loss.')
+    p.add_argument('-rng', '--rng_seed', type=int, default=None,
+                   help='Seed for random number generation.')
+    return p
+
+
+def main(model, network_params, output_dir, ds_prefix, ds_suffix='mean',
+         width=None, ratio=0.25, method='norm', n_samples=4096, num_epochs=0,
+         l_rate=1e-4, batch_size=500, opt_rule='rmsprop', alpha=0.3,
+         rng_seed=None):
+    with open(network_params, 'r') as fobj:
+        hyper_prm = json.load(fobj)
+    model_prm = hyper_prm['model']
+    X_val = hkl.load(os.path.join(
+        ds_prefix, 'val_fc7_{}.hkl'.format(ds_suffix))).astype(np.float32)
+    y_val = hkl.load(os.path.join(ds_prefix, 'val_conf.hkl')).astype(np.uint8)
+    input_size = X_val.shape[-1]
+    original = NumpyProposalModel(model_prm, model, input_size=input_size)
+
+    # Rank and remove units
+    prm = parse_model_prm(model_prm)
+    if width is None:
+        width = max(int(round(prm['width'] * ratio)), 1)
+    rng = np.random.RandomState(rng_seed)
+    idx = rng.permutation(X_val.shape[0])[:n_samples]
+    importance = unit_importance(original, method, X_val[idx])
+    keep = select_units(importance, width)
+    new_prm, params = prune_units(model_prm, original.params, keep)
+    print 'Pruned {} into {}'.format(model_prm, new_prm)
+
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    modelfile = os.path.join(output_dir, 'model.npz')
+    np.savez(modelfile, *params)
+    if num_epochs > 0:
+        from daps import learning
+        output_dir = os.path.realpath(output_dir)
+        learning.main(exp_id=os.path.basename(output_dir), model=new_prm,
+                      num_epochs=num_epochs, alpha=alpha,
+                      batch_size=batch_size, l_rate=l_rate,
+                      rng_seed=rng_seed, init_model=[modelfile, 0],
+                      output_dir=os.path.dirname(output_dir),
+                      ds_prefix=ds_prefix, ds_suffix=ds_suffix,
+                      snapshot_freq=num_epochs + 1, opt_rule=opt_rule)
+    else:
+        with open(os.path.join(output_dir, 'hyper_prm.json'), 'w') as fobj:
+            json.dump(dict(hyper_prm, model=new_prm, pruned_from=model,
+                           pruning_method=method), fobj, indent=4,
+                      separators=(',', ': '))
+    pruned = NumpyProposalModel(new_prm, modelfile, input_size=input_size)
+
+    # Report
+    report = {'original': evaluate(original, X_val, y_val),
+              'pruned': evaluate(pruned, X_val, y_val),
+              'model': model_prm, 'pruned_model': new_prm,
+              'method': method, 'num_epochs': num_epochs}
+    print '{:>10} {:>8} {:>8} {:>8} {:>12}'.format('', 'AP', 'R25', 'R50',
+                                                    'windows/s')
+    for i in ['original', 'pruned']:
+        print '{:>10} {:8.4f} {:8.4f} {:8.4f} {:12.1f}'.format(
+            i, report[i]['ap'], report[i]['R25'], report[i]['R50'],
+            report[i]['windows_per_sec'])
+    with open(os.path.join(output_dir, 'pruning_report.json'), 'w') as fobj:
+        json.dump(report, fobj, sort_keys=True, indent=4)
+
+
+if __name__ == '__main__':
+    p = input_parser()
+    args = vars(p.parse_args())
+    main(**args)